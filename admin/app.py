@@ -1,21 +1,29 @@
 """
 Админ-панель (Streamlit): DAU/MAU, расход токенов, список пользователей, Ban, Premium
 Запуск: streamlit run admin/app.py
+Данные — через admin.data (SQLite или PostgreSQL; дашборды читают с реплики
+DATABASE_REPLICA_URL или из отдельного read-only пула).
 """
 
 import os
-import sqlite3
+import sys
 from pathlib import Path
 
 import pandas as pd
 import streamlit as st
 
-DB_PATH = Path(__file__).parent.parent / "bot_database.db"
+# streamlit добавляет в sys.path только admin/ — нужен корень проекта (config, database)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from admin.data import AdminData, connect  # noqa: E402
+
 PAGE_TITLE = "Nero AI — Админ-панель"
 
 
-def get_conn():
-    return sqlite3.connect(str(DB_PATH), check_same_thread=False)
+@st.cache_resource
+def get_data() -> AdminData:
+    """Один слой данных (пулы БД) на процесс Streamlit"""
+    return connect()
 
 
 def check_auth() -> bool:
@@ -53,167 +61,59 @@ def login_form():
 
 
 def load_daily_active(days: int = 30) -> pd.DataFrame:
-    """DAU за последние N дней"""
-    conn = get_conn()
+    """DAU за последние N дней (daily_metrics)"""
     try:
-        df = pd.read_sql_query(
-            """
-            SELECT date(created_at) as date, COUNT(DISTINCT user_id) as dau
-            FROM messages
-            WHERE created_at >= date('now', '-%d days')
-            GROUP BY date(created_at)
-            ORDER BY date
-            """
-            % days,
-            conn,
-        )
+        return pd.DataFrame(get_data().daily_active(days), columns=["date", "dau"])
     except Exception:
-        df = pd.DataFrame(columns=["date", "dau"])
-    finally:
-        conn.close()
-    return df
+        return pd.DataFrame(columns=["date", "dau"])
 
 
 def load_mau(days: int = 30) -> int:
     """MAU — уникальные пользователи за последние N дней"""
-    conn = get_conn()
     try:
-        row = pd.read_sql_query(
-            """
-            SELECT COUNT(DISTINCT user_id) as mau
-            FROM messages
-            WHERE created_at >= date('now', '-%d days')
-            """
-            % days,
-            conn,
-        )
-        return int(row.iloc[0]["mau"]) if not row.empty else 0
+        return get_data().mau(days)
     except Exception:
         return 0
-    finally:
-        conn.close()
 
 
-def load_token_usage() -> pd.DataFrame:
-    """Расход токенов по дням"""
-    conn = get_conn()
+def load_token_usage(days: int = 30) -> pd.DataFrame:
+    """Расход токенов по дням и моделям (daily_metrics): строки — дни, колонки — модели"""
     try:
-        df = pd.read_sql_query(
-            """
-            SELECT date(updated_at) as date, SUM(tokens_used) as tokens
-            FROM stats
-            WHERE updated_at >= date('now', '-30 days')
-            GROUP BY date(updated_at)
-            ORDER BY date
-            """,
-            conn,
+        df = pd.DataFrame(
+            get_data().token_usage_by_model(days), columns=["date", "model", "tokens"]
         )
     except Exception:
-        df = pd.DataFrame(columns=["date", "tokens"])
-    finally:
-        conn.close()
-    return df
+        return pd.DataFrame()
+    if df.empty:
+        return df
+    df["model"] = df["model"].replace("", "—")
+    return df.pivot_table(
+        index="date", columns="model", values="tokens", aggfunc="sum", fill_value=0
+    )
+
+
+def load_command_usage(days: int = 30) -> pd.DataFrame:
+    """Популярные команды за N дней (индекс command_usage (day, command))"""
+    try:
+        return pd.DataFrame(get_data().command_usage(days), columns=["command", "uses"])
+    except Exception:
+        return pd.DataFrame(columns=["command", "uses"])
 
 
 def load_users(limit: int = 200) -> pd.DataFrame:
     """Список пользователей с базовой статистикой, is_banned, premium"""
-    conn = get_conn()
     try:
-        cols = "u.telegram_id, u.first_name, u.username, u.created_at"
-        try:
-            conn.execute("SELECT is_banned FROM users LIMIT 1")
-            cols += ", COALESCE(u.is_banned, 0) as is_banned"
-        except sqlite3.OperationalError:
-            cols += ", 0 as is_banned"
-        # subscriptions может отсутствовать в старых БД
-        try:
-            conn.execute("SELECT 1 FROM subscriptions LIMIT 1")
-            join_sub = "LEFT JOIN subscriptions sub ON sub.user_id = u.telegram_id"
-            cols += ", COALESCE(sub.tier, 'free') as tier"
-        except sqlite3.OperationalError:
-            join_sub = ""
-            cols += ", 'free' as tier"
-        df = pd.read_sql_query(
-            f"""
-            SELECT {cols},
-                   COALESCE(s.requests_count, 0) as requests,
-                   COALESCE(s.tokens_used, 0) as tokens,
-                   COALESCE(s.images_generated, 0) as images
-            FROM users u
-            LEFT JOIN stats s ON s.user_id = u.telegram_id
-            {join_sub}
-            ORDER BY u.created_at DESC
-            LIMIT ?
-            """,
-            conn,
-            params=(limit,),
-        )
+        return pd.DataFrame(get_data().users(limit))
     except Exception:
-        try:
-            df = pd.read_sql_query(
-                """
-                SELECT u.telegram_id, u.first_name, u.username, u.created_at,
-                       COALESCE(s.requests_count, 0) as requests,
-                       COALESCE(s.tokens_used, 0) as tokens,
-                       COALESCE(s.images_generated, 0) as images
-                FROM users u
-                LEFT JOIN stats s ON s.user_id = u.telegram_id
-                ORDER BY u.created_at DESC
-                LIMIT ?
-                """,
-                conn,
-                params=(limit,),
-            )
-        except Exception:
-            df = pd.DataFrame()
-    finally:
-        conn.close()
-    return df
+        return pd.DataFrame()
 
 
 def exec_ban(telegram_id: int, ban: bool) -> None:
-    conn = get_conn()
-    try:
-        conn.execute(
-            "UPDATE users SET is_banned = ? WHERE telegram_id = ?",
-            (1 if ban else 0, telegram_id),
-        )
-        conn.commit()
-    except sqlite3.OperationalError:
-        # колонка is_banned может отсутствовать
-        pass
-    finally:
-        conn.close()
+    get_data().set_banned(telegram_id, ban)
 
 
 def exec_premium(telegram_id: int, give: bool) -> None:
-    conn = get_conn()
-    try:
-        cur = conn.execute("SELECT 1 FROM subscriptions WHERE user_id = ?", (telegram_id,))
-        exists = cur.fetchone() is not None
-        if give:
-            if exists:
-                conn.execute(
-                    "UPDATE subscriptions SET tier='premium', stars_paid_at=datetime('now'), updated_at=datetime('now') WHERE user_id=?",
-                    (telegram_id,),
-                )
-            else:
-                conn.execute(
-                    "INSERT INTO subscriptions (user_id, tier, stars_paid_at, created_at, updated_at) "
-                    "VALUES (?, 'premium', datetime('now'), datetime('now'), datetime('now'))",
-                    (telegram_id,),
-                )
-        else:
-            if exists:
-                conn.execute(
-                    "UPDATE subscriptions SET tier='free', stars_paid_at=NULL, updated_at=datetime('now') WHERE user_id=?",
-                    (telegram_id,),
-                )
-        conn.commit()
-    except Exception:
-        pass
-    finally:
-        conn.close()
+    get_data().set_premium(telegram_id, give)
 
 
 def main():
@@ -229,27 +129,25 @@ def main():
         st.session_state.admin_authenticated = False
         st.rerun()
 
-    if not DB_PATH.exists():
-        st.error("База данных не найдена. Запустите бота.")
+    try:
+        data = get_data()
+    except Exception as e:
+        st.error(f"База данных недоступна: {e}")
         return
 
     tab_overview, tab_users, tab_personas = st.tabs(["📊 Обзор", "👥 Пользователи", "📝 Персонажи"])
 
     with tab_overview:
-        conn = get_conn()
         try:
-            total_users = pd.read_sql_query("SELECT COUNT(*) as c FROM users", conn).iloc[0]["c"]
-            total_tokens = pd.read_sql_query(
-                "SELECT COALESCE(SUM(tokens_used), 0) as c FROM stats", conn
-            ).iloc[0]["c"]
-            total_images = pd.read_sql_query(
-                "SELECT COALESCE(SUM(images_generated), 0) as c FROM stats", conn
-            ).iloc[0]["c"]
+            totals = data.totals()
+            total_users, total_tokens, total_images = (
+                totals["users"],
+                totals["tokens"],
+                totals["images"],
+            )
             mau = load_mau(30)
         except Exception:
             total_users = total_tokens = total_images = mau = 0
-        finally:
-            conn.close()
 
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("Пользователей", total_users)
@@ -264,10 +162,17 @@ def main():
         else:
             st.info("Нет данных")
 
-        st.subheader("Расход токенов по дням")
-        tokens_df = load_token_usage()
+        st.subheader("Расход токенов по дням и моделям")
+        tokens_df = load_token_usage(30)
         if not tokens_df.empty:
-            st.bar_chart(tokens_df.set_index("date")["tokens"])
+            st.bar_chart(tokens_df)
+        else:
+            st.info("Нет данных")
+
+        st.subheader("Популярные команды (30 дн.)")
+        commands_df = load_command_usage(30)
+        if not commands_df.empty:
+            st.bar_chart(commands_df.set_index("command")["uses"])
         else:
             st.info("Нет данных")
 
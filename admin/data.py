@@ -0,0 +1,113 @@
+"""
+Слой данных админ-панели: те же методы Database, что и у бота, поверх SQLite или
+PostgreSQL. Database.init_admin: без create_all и второго писателя SQLite — схемой и
+записью владеет бот. Дашборды читают через read-only пул (DATABASE_REPLICA_URL или
+отдельный пул на основной БД); DAU, MAU и токены — из дневных агрегатов daily_metrics.
+Бан и премиум пишутся в основную БД с инвалидацией кэша профилей.
+Streamlit синхронный, поэтому Database живёт в собственном event loop в фоновом потоке.
+"""
+
+import asyncio
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Coroutine, Dict, List, Tuple, TypeVar
+
+from database.daily_metrics import MAU_WINDOW_DAYS, METRIC_MAU, METRIC_TOKENS
+from database.db import Database
+
+T = TypeVar("T")
+
+DB_PATH = Path(__file__).parent.parent / "bot_database.db"
+QUERY_TIMEOUT_SEC = 60
+
+
+def _database_urls() -> Tuple[str, str, bool]:
+    """(основная БД, реплика, доступен ли config); без DATABASE_URL — SQLite бота"""
+    try:
+        from config import settings
+
+        url = (settings.DATABASE_URL or "").strip()
+        replica = (settings.DATABASE_REPLICA_URL or "").strip()
+        has_config = True
+    except (Exception, SystemExit):
+        # Без .env config завершает процесс — админке достаточно переменных окружения
+        url = os.getenv("DATABASE_URL", "").strip()
+        replica = os.getenv("DATABASE_REPLICA_URL", "").strip()
+        has_config = False
+    return url or f"sqlite+aiosqlite:///{DB_PATH}", replica, has_config
+
+
+class AdminData:
+    """Синхронная обёртка над Database для Streamlit"""
+
+    def __init__(self, url: str, replica_url: str = "", use_redis: bool = True) -> None:
+        self.url = url
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="admin-db-loop", daemon=True
+        )
+        self._thread.start()
+        self.db = Database()
+        # Redis нужен только для инвалидации кэша профилей в боте (REDIS_URL из config)
+        self.db.profiles.use_redis = use_redis
+        self._call(self.db.init_admin(url, replica_url or None))
+
+    def _call(self, coro: Coroutine[Any, Any, T]) -> T:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(QUERY_TIMEOUT_SEC)
+
+    def close(self) -> None:
+        self._call(self.db.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # ---------- Дашборды (read-only пул) ----------
+
+    def totals(self) -> Dict[str, int]:
+        return self._call(self.db.get_overview_totals())
+
+    def daily_active(self, days: int = 30) -> List[Tuple[str, int]]:
+        return self._call(self.db.get_daily_active(datetime.utcnow() - timedelta(days=days)))
+
+    def mau(self, days: int = MAU_WINDOW_DAYS) -> int:
+        """MAU из daily_metrics; за нестандартное окно или до первого пересчёта — по messages"""
+        if days == MAU_WINDOW_DAYS:
+            value = self._call(self.db.get_latest_daily_metric(METRIC_MAU))
+            if value is not None:
+                return value
+        return self._call(self.db.get_active_users_count(datetime.utcnow() - timedelta(days=days)))
+
+    def token_usage(self, days: int = 30) -> List[Tuple[str, int]]:
+        return self._call(self.db.get_token_usage(datetime.utcnow() - timedelta(days=days)))
+
+    def token_usage_by_model(self, days: int = 30) -> List[Tuple[str, str, int]]:
+        """[(день, модель, токенов)] — модель пустая у записей без разреза"""
+        since = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+        return self._call(self.db.get_daily_metrics(METRIC_TOKENS, since))
+
+    def command_usage(self, days: int = 30, limit: int = 15) -> List[Tuple[str, int]]:
+        since = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+        return self._call(self.db.get_top_commands(since, limit=limit))
+
+    def users(self, limit: int = 200) -> List[Dict[str, Any]]:
+        return self._call(self.db.get_users_overview(limit))
+
+    # ---------- Действия (основная БД) ----------
+
+    def set_banned(self, telegram_id: int, ban: bool) -> None:
+        if ban:
+            self._call(self.db.ban_user(telegram_id))
+        else:
+            self._call(self.db.unban_user(telegram_id))
+
+    def set_premium(self, telegram_id: int, give: bool) -> None:
+        if give:
+            self._call(self.db.set_premium(telegram_id))
+        else:
+            self._call(self.db.remove_premium(telegram_id))
+
+
+def connect() -> AdminData:
+    """AdminData по DATABASE_URL / DATABASE_REPLICA_URL"""
+    url, replica, has_config = _database_urls()
+    return AdminData(url, replica, use_redis=has_config)
@@ -0,0 +1,34 @@
+"""Unique (user_id, fact_type) on user_facts
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+
+Дубликаты фактов одного типа удаляются (остаётся самая поздняя запись),
+затем создаётся уникальный индекс — цель для INSERT ... ON CONFLICT.
+"""
+
+from typing import Sequence, Union
+
+from sqlalchemy import text
+
+from alembic import op
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        text(
+            "DELETE FROM user_facts WHERE id NOT IN ("
+            "SELECT MAX(id) FROM user_facts GROUP BY user_id, fact_type)"
+        )
+    )
+    op.create_index("uq_user_facts_user_type", "user_facts", ["user_id", "fact_type"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("uq_user_facts_user_type", table_name="user_facts")
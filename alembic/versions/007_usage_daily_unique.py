@@ -0,0 +1,43 @@
+"""Unique (user_id, date) on usage_daily
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19
+
+Дубликаты дневных счётчиков (гонка SELECT → INSERT) сливаются в самую позднюю запись
+(count суммируется), затем создаётся уникальный индекс — цель для INSERT ... ON CONFLICT.
+"""
+
+from typing import Sequence, Union
+
+from sqlalchemy import text
+
+from alembic import op
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        text(
+            "UPDATE usage_daily SET count = ("
+            "SELECT SUM(u.count) FROM usage_daily u "
+            "WHERE u.user_id = usage_daily.user_id AND u.date = usage_daily.date) "
+            "WHERE id IN ("
+            "SELECT MAX(id) FROM usage_daily GROUP BY user_id, date HAVING COUNT(*) > 1)"
+        )
+    )
+    op.execute(
+        text(
+            "DELETE FROM usage_daily WHERE id NOT IN ("
+            "SELECT MAX(id) FROM usage_daily GROUP BY user_id, date)"
+        )
+    )
+    op.create_index("uq_usage_daily_user_date", "usage_daily", ["user_id", "date"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("uq_usage_daily_user_date", table_name="usage_daily")
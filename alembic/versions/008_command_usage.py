@@ -0,0 +1,103 @@
+"""Add command_usage and backfill it from stats.commands_used
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19
+
+Счётчики команд переезжают из JSON stats.commands_used в таблицу command_usage
+(user_id, command, day, count). Дата вызовов в JSON не хранилась — исторические
+счётчики записываются на день последнего обновления статистики (stats.updated_at).
+"""
+
+from datetime import datetime
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 1000
+
+_stats = sa.table(
+    "stats",
+    sa.column("id", sa.Integer),
+    sa.column("user_id", sa.Integer),
+    sa.column("commands_used", sa.JSON),
+    sa.column("start_date", sa.DateTime),
+    sa.column("updated_at", sa.DateTime),
+)
+
+
+def _day(value) -> str:
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, str) and len(value) >= 10:
+        return value[:10]
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def upgrade() -> None:
+    command_usage = op.create_table(
+        "command_usage",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("command", sa.String(100), nullable=False),
+        sa.Column("day", sa.String(10), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "uq_command_usage_user_command_day",
+        "command_usage",
+        ["user_id", "command", "day"],
+        unique=True,
+    )
+    op.create_index("ix_command_usage_day_command", "command_usage", ["day", "command"])
+
+    # stats пачками по id (keyset): таблица целиком в памяти не нужна
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        stats_rows = conn.execute(
+            sa.select(
+                _stats.c.id,
+                _stats.c.user_id,
+                _stats.c.commands_used,
+                _stats.c.updated_at,
+                _stats.c.start_date,
+            )
+            .where(_stats.c.id > last_id, _stats.c.commands_used.isnot(None))
+            .order_by(_stats.c.id)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not stats_rows:
+            break
+        last_id = stats_rows[-1][0]
+        rows = []
+        for _, user_id, commands, updated_at, start_date in stats_rows:
+            if not isinstance(commands, dict):
+                continue
+            day = _day(updated_at or start_date)
+            for command, count in commands.items():
+                if isinstance(count, int) and count > 0:
+                    rows.append(
+                        {
+                            "user_id": user_id,
+                            "command": str(command)[:100],
+                            "day": day,
+                            "count": count,
+                        }
+                    )
+        if rows:
+            op.bulk_insert(command_usage, rows)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_command_usage_day_command", table_name="command_usage")
+    op.drop_index("uq_command_usage_user_command_day", table_name="command_usage")
+    op.drop_table("command_usage")
@@ -0,0 +1,39 @@
+"""Composite (user_id, created_at DESC) indexes for per-user history queries
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19
+
+Запросы вида WHERE user_id = ? ORDER BY created_at DESC LIMIT n (история, факты, избранное)
+читают индекс по порядку, без сортировки. usage_daily (user_id, date) уже покрыт
+уникальным индексом из миграции 007. Проверка планов: python -m database.query_plans
+"""
+
+from typing import Sequence, Union
+
+from sqlalchemy import text
+
+from alembic import op
+
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_messages_user_created",
+        "messages",
+        ["user_id", text("created_at DESC"), text("id DESC")],
+    )
+    op.create_index(
+        "ix_user_facts_user_created", "user_facts", ["user_id", text("created_at DESC")]
+    )
+    op.create_index("ix_favorites_user_created", "favorites", ["user_id", text("created_at DESC")])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_favorites_user_created", table_name="favorites")
+    op.drop_index("ix_user_facts_user_created", table_name="user_facts")
+    op.drop_index("ix_messages_user_created", table_name="messages")
@@ -0,0 +1,148 @@
+"""Add messages_archive; PostgreSQL: range-partition messages by month
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19
+
+messages_archive — сжатые пачки старых сообщений (database.retention).
+PostgreSQL: messages пересоздаётся как PARTITION BY RANGE (created_at) с месячными
+партициями messages_pYYYY_MM (от самого старого сообщения до +2 месяцев) и DEFAULT;
+первичный ключ — (id, created_at), последовательность id сохраняется. SQLite не меняется.
+"""
+
+from datetime import datetime
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from alembic import op
+
+revision: str = "010"
+down_revision: Union[str, None] = "009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS_AHEAD = 2
+
+_MESSAGE_INDEXES = (
+    "CREATE INDEX ix_messages_user_id ON messages (user_id)",
+    "CREATE INDEX ix_messages_created_at ON messages (created_at)",
+    "CREATE INDEX ix_messages_user_created ON messages (user_id, created_at DESC, id DESC)",
+)
+
+
+def _add_months(year: int, month: int, n: int):
+    index = year * 12 + (month - 1) + n
+    return index // 12, index % 12 + 1
+
+
+def _partition_messages() -> None:
+    conn = op.get_bind()
+    oldest = conn.execute(text("SELECT MIN(created_at) FROM messages")).scalar()
+    now = datetime.utcnow()
+    start = oldest or now
+
+    for name in ("ix_messages_user_id", "ix_messages_created_at", "ix_messages_user_created"):
+        op.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    op.execute(text("ALTER TABLE messages RENAME TO messages_unpartitioned"))
+    op.execute(
+        text(
+            "ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey"
+        )
+    )
+    # Последовательность id переживёт DROP старой таблицы
+    op.execute(text("ALTER SEQUENCE messages_id_seq OWNED BY NONE"))
+    op.execute(
+        text(
+            "CREATE TABLE messages ("
+            "id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'), "
+            "user_id INTEGER NOT NULL, "
+            "role VARCHAR(20) NOT NULL, "
+            "content TEXT NOT NULL, "
+            "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'), "
+            "PRIMARY KEY (id, created_at)"
+            ") PARTITION BY RANGE (created_at)"
+        )
+    )
+    op.execute(text("ALTER SEQUENCE messages_id_seq OWNED BY messages.id"))
+
+    year, month = start.year, start.month
+    last = _add_months(now.year, now.month, PARTITIONS_AHEAD)
+    while (year, month) <= last:
+        ny, nm = _add_months(year, month, 1)
+        op.execute(
+            text(
+                f"CREATE TABLE messages_p{year:04d}_{month:02d} PARTITION OF messages "
+                f"FOR VALUES FROM ('{year:04d}-{month:02d}-01') TO ('{ny:04d}-{nm:02d}-01')"
+            )
+        )
+        year, month = ny, nm
+    op.execute(text("CREATE TABLE messages_default PARTITION OF messages DEFAULT"))
+    for ddl in _MESSAGE_INDEXES:
+        op.execute(text(ddl))
+
+    op.execute(
+        text(
+            "INSERT INTO messages (id, user_id, role, content, created_at) "
+            "SELECT id, user_id, role, content, COALESCE(created_at, now() AT TIME ZONE 'utc') "
+            "FROM messages_unpartitioned"
+        )
+    )
+    op.execute(text("DROP TABLE messages_unpartitioned"))
+
+
+def _unpartition_messages() -> None:
+    op.execute(text("ALTER TABLE messages RENAME TO messages_partitioned"))
+    op.execute(
+        text(
+            "ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey"
+        )
+    )
+    for name in ("ix_messages_user_id", "ix_messages_created_at", "ix_messages_user_created"):
+        op.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    op.execute(text("ALTER SEQUENCE messages_id_seq OWNED BY NONE"))
+    op.execute(
+        text(
+            "CREATE TABLE messages ("
+            "id INTEGER NOT NULL DEFAULT nextval('messages_id_seq') PRIMARY KEY, "
+            "user_id INTEGER NOT NULL, "
+            "role VARCHAR(20) NOT NULL, "
+            "content TEXT NOT NULL, "
+            "created_at TIMESTAMP WITHOUT TIME ZONE)"
+        )
+    )
+    op.execute(text("ALTER SEQUENCE messages_id_seq OWNED BY messages.id"))
+    op.execute(
+        text(
+            "INSERT INTO messages (id, user_id, role, content, created_at) "
+            "SELECT id, user_id, role, content, created_at FROM messages_partitioned"
+        )
+    )
+    op.execute(text("DROP TABLE messages_partitioned CASCADE"))
+    for ddl in _MESSAGE_INDEXES:
+        op.execute(text(ddl))
+
+
+def upgrade() -> None:
+    op.create_table(
+        "messages_archive",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("first_message_at", sa.DateTime(), nullable=False),
+        sa.Column("last_message_at", sa.DateTime(), nullable=False),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_messages_archive_user_id", "messages_archive", ["user_id"])
+    if op.get_bind().dialect.name == "postgresql":
+        _partition_messages()
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        _unpartition_messages()
+    op.drop_index("ix_messages_archive_user_id", table_name="messages_archive")
+    op.drop_table("messages_archive")
@@ -0,0 +1,93 @@
+"""Compress large messages.content / favorites.content (CompressedText)
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19
+
+Колонки content хранят значение database.compressed_text: длинные тексты сжаты deflate
+с общим словарём, короткие — UTF-8 как есть. PostgreSQL: тип text → bytea
+(convert_to, UTF-8). SQLite: тип колонки не меняется (TEXT-колонка хранит BLOB как есть).
+Существующие строки пересжимаются пачками по id; downgrade распаковывает обратно.
+"""
+
+from typing import Sequence, Union
+
+from sqlalchemy import text
+
+from alembic import op
+from database.compressed_text import decode_text, encode_text
+
+revision: str = "011"
+down_revision: Union[str, None] = "010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("messages", "favorites")
+BATCH_SIZE = 1000
+
+
+def _rewrite(table: str, convert) -> None:
+    """Пройти таблицу пачками по id и перезаписать content, где convert(value) его меняет"""
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text(f"SELECT id, content FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, value in rows:
+            new_value = convert(value)
+            if new_value is not None:
+                updates.append({"id": row_id, "content": new_value})
+        if updates:
+            conn.execute(text(f"UPDATE {table} SET content = :content WHERE id = :id"), updates)
+
+
+def _compress(value):
+    current = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+    encoded = encode_text(decode_text(value))
+    return encoded if encoded != current else None
+
+
+def _decompress_bytes(value):
+    """PostgreSQL: перед обратным convert_from нужен чистый UTF-8"""
+    data = bytes(value)
+    plain = decode_text(data).encode("utf-8")
+    return plain if plain != data else None
+
+
+def _decompress_str(value):
+    """SQLite: сжатые и помеченные значения → обычная строка"""
+    return None if isinstance(value, str) else decode_text(value)
+
+
+def upgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == "postgresql"
+    for table in TABLES:
+        if is_postgres:
+            op.execute(
+                text(
+                    f"ALTER TABLE {table} ALTER COLUMN content TYPE bytea "
+                    "USING convert_to(content, 'UTF8')"
+                )
+            )
+        _rewrite(table, _compress)
+
+
+def downgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == "postgresql"
+    for table in TABLES:
+        if is_postgres:
+            _rewrite(table, _decompress_bytes)
+            op.execute(
+                text(
+                    f"ALTER TABLE {table} ALTER COLUMN content TYPE text "
+                    "USING convert_from(content, 'UTF8')"
+                )
+            )
+        else:
+            _rewrite(table, _decompress_str)
@@ -0,0 +1,69 @@
+"""Add daily_metrics rollup and backfill it from messages, users and command_usage
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-19
+
+daily_metrics (day, metric, dimension, value) — дневные агрегаты дашбордов
+(database.daily_metrics). История восстанавливается из того, что есть: dau и messages
+по ролям — из messages (без перенесённого в messages_archive), new_users — из
+users.created_at, commands — из command_usage. Токены, запросы и изображения по дням
+не хранились (stats — итог на пользователя): их ряд начинается с этой миграции,
+как и mau (первый пересчёт — задача daily_metrics_job).
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from alembic import op
+
+revision: str = "012"
+down_revision: Union[str, None] = "011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _day_sql(is_postgres: bool) -> str:
+    """created_at → 'YYYY-MM-DD' (формат day у command_usage и usage_daily)"""
+    if is_postgres:
+        return "to_char(created_at, 'YYYY-MM-DD')"
+    return "strftime('%Y-%m-%d', created_at)"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "daily_metrics",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.String(10), nullable=False),
+        sa.Column("metric", sa.String(50), nullable=False),
+        sa.Column("dimension", sa.String(100), nullable=False, server_default=""),
+        sa.Column("value", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "uq_daily_metrics_metric_day_dimension",
+        "daily_metrics",
+        ["metric", "day", "dimension"],
+        unique=True,
+    )
+
+    # Разовый полный проход по таблицам: дальше агрегаты ведутся инкрементально
+    day = _day_sql(op.get_bind().dialect.name == "postgresql")
+    backfill = (
+        f"SELECT {day}, 'dau', '', COUNT(DISTINCT user_id) FROM messages "
+        f"WHERE created_at IS NOT NULL GROUP BY {day}",
+        f"SELECT {day}, 'messages', role, COUNT(*) FROM messages "
+        f"WHERE created_at IS NOT NULL GROUP BY {day}, role",
+        f"SELECT {day}, 'new_users', '', COUNT(*) FROM users "
+        f"WHERE created_at IS NOT NULL GROUP BY {day}",
+        "SELECT day, 'commands', command, SUM(count) FROM command_usage GROUP BY day, command",
+    )
+    for select_sql in backfill:
+        op.execute(text(f"INSERT INTO daily_metrics (day, metric, dimension, value) {select_sql}"))
+
+
+def downgrade() -> None:
+    op.drop_index("uq_daily_metrics_metric_day_dimension", table_name="daily_metrics")
+    op.drop_table("daily_metrics")
@@ -0,0 +1,50 @@
+"""Add broadcasts checkpoint table and users.bot_blocked_at
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-19
+
+broadcasts — рассылки админа (services.broadcast): текст, статус, чекпоинт (users.id
+последней отправленной пачки) и счётчики, чтобы рассылка продолжалась после перезапуска.
+users.bot_blocked_at — пользователь заблокировал бота; рассылки его пропускают.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "013"
+down_revision: Union[str, None] = "012"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("bot_blocked_at", sa.DateTime(), nullable=True))
+    op.create_table(
+        "broadcasts",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False, server_default="running"),
+        sa.Column("admin_chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("status_message_id", sa.BigInteger(), nullable=True),
+        sa.Column("cursor", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("total", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("sent", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("blocked", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("failed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_broadcasts_status", "broadcasts", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_broadcasts_status", table_name="broadcasts")
+    op.drop_table("broadcasts")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("bot_blocked_at")
@@ -0,0 +1,38 @@
+"""Add data_migration_state for migrate_data.py checkpoints
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-19
+
+data_migration_state — контрольная точка миграции bot_data.json (migrate_data.py):
+завершённые разделы и позиция в текущем. Пишется в той же транзакции, что и пачка строк,
+поэтому повторный запуск продолжает ровно с последней закоммиченной пачки.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "014"
+down_revision: Union[str, None] = "013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "data_migration_state",
+        sa.Column("source", sa.String(500), nullable=False),
+        sa.Column("file_size", sa.BigInteger(), nullable=False),
+        sa.Column("sections_done", sa.JSON(), nullable=False),
+        sa.Column("section", sa.String(50), nullable=True),
+        sa.Column("entries", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("source"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("data_migration_state")
@@ -0,0 +1,35 @@
+"""Add job_state for periodic job cursors
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-19
+
+job_state — позиция периодической задачи между запусками. Ретеншн истории
+(database.retention) продолжает перебор пользователей с сохранённого user_id, а не с
+начала таблицы на каждом запуске.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "015"
+down_revision: Union[str, None] = "014"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "job_state",
+        sa.Column("name", sa.String(64), nullable=False),
+        sa.Column("cursor", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("job_state")
@@ -0,0 +1 @@
+"""Бенчмарки: python -m benchmarks.<модуль> --help"""
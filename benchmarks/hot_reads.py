@@ -0,0 +1,138 @@
+"""
+Бенчмарк горячего чтения Database: Core-запросы со строками-dataclass (текущие get_user,
+get_user_messages, get_user_facts) против прежних ORM-запросов (select(Model) →
+объекты с identity map).
+
+Для каждого метода печатает CPU на вызов (process_time, включая поток aiosqlite) и
+память, выделенную за вызов (пик tracemalloc). Данные — временная SQLite.
+
+python -m benchmarks.hot_reads --calls 2000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List
+
+from sqlalchemy import select
+
+from database.db import Database
+from database.models import Message, User, UserFact
+
+USER_ID = 424242
+HISTORY = 20
+FACTS = 10
+
+
+async def _orm_get_user(database: Database) -> Any:
+    async with database._session() as session:
+        result = await session.execute(select(User).where(User.telegram_id == USER_ID))
+        return result.scalar_one_or_none()
+
+
+async def _orm_get_user_messages(database: Database) -> Any:
+    async with database._session() as session:
+        result = await session.execute(
+            select(Message)
+            .where(Message.user_id == USER_ID)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(HISTORY)
+        )
+        return list(reversed(result.scalars().all()))
+
+
+async def _orm_get_user_facts(database: Database) -> Any:
+    async with database._session() as session:
+        result = await session.execute(
+            select(UserFact)
+            .where(UserFact.user_id == USER_ID)
+            .order_by(UserFact.created_at.desc())
+            .limit(FACTS)
+        )
+        return list(result.scalars().all())
+
+
+async def _seed(database: Database) -> None:
+    await database.create_or_update_user(USER_ID, username="bench", first_name="Bench")
+    for i in range(HISTORY * 2):
+        role = "user" if i % 2 == 0 else "assistant"
+        await database.add_message(USER_ID, role, f"Сообщение {i}: " + "текст ответа " * 30)
+    await database.message_buffer.flush()
+    await database.upsert_user_facts(USER_ID, {f"fact{i}": f"значение {i}" for i in range(FACTS)})
+
+
+async def _measure(call: Callable[[], Awaitable[Any]], calls: int) -> Dict[str, float]:
+    for _ in range(50):  # прогрев: пул соединений, кэш компиляции
+        await call()
+    cpu_start = time.process_time()
+    for _ in range(calls):
+        await call()
+    cpu_us = (time.process_time() - cpu_start) / calls * 1e6
+
+    sample = min(calls, 200)
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(sample):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await call()
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {"cpu_us": cpu_us, "alloc_kib": allocated / sample / 1024}
+
+
+async def run(url: str, calls: int) -> List[Dict[str, Any]]:
+    database = Database()
+    database.profiles.use_redis = False
+    await database.init(url)
+    try:
+        await _seed(database)
+        cases = [
+            ("get_user", lambda: _orm_get_user(database), lambda: database.get_user(USER_ID)),
+            (
+                "get_user_messages",
+                lambda: _orm_get_user_messages(database),
+                lambda: database.get_user_messages(USER_ID, limit=HISTORY),
+            ),
+            (
+                "get_user_facts",
+                lambda: _orm_get_user_facts(database),
+                lambda: database.get_user_facts(USER_ID, limit=FACTS),
+            ),
+        ]
+        results = []
+        for name, orm_call, core_call in cases:
+            orm = await _measure(orm_call, calls)
+            core = await _measure(core_call, calls)
+            results.append({"method": name, "orm": orm, "core": core})
+        return results
+    finally:
+        await database.close()
+
+
+async def main_async(calls: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        results = await run(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}", calls)
+    print(f"calls={calls}")
+    for r in results:
+        orm, core = r["orm"], r["core"]
+        print(
+            f"{r['method']:>18}: ORM {orm['cpu_us']:7.1f} us {orm['alloc_kib']:6.1f} KiB | "
+            f"Core {core['cpu_us']:7.1f} us {core['alloc_kib']:6.1f} KiB | "
+            f"CPU x{orm['cpu_us'] / core['cpu_us']:.2f}, "
+            f"alloc x{orm['alloc_kib'] / max(core['alloc_kib'], 0.01):.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.calls))
+
+
+if __name__ == "__main__":
+    main()
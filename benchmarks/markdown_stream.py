@@ -0,0 +1,137 @@
+"""
+Бенчмарк разметки потокового ответа: sanitize_markdown по всему накопленному тексту
+на каждом шаге (прежний стриминг) против TelegramHTMLStream — feed() только нового
+фрагмента и render().
+
+Ответ LLM ~4000 символов (жирный, курсив, списки, инлайн-код, блоки кода) приходит
+фрагментами по --chunk символов, разметка строится после каждого фрагмента (худший
+случай: правка на каждом шаге). Печатает время на поток и на последний шаг (рост
+с длиной текста), а также проверяет, что каждый HTML-префикс корректно вложен.
+
+python -m benchmarks.markdown_stream --streams 200 --chunk 20
+"""
+
+import argparse
+import time
+from html.parser import HTMLParser
+from typing import Callable, Dict, List
+
+from utils.text_tools import TelegramHTMLStream, markdown_to_html, sanitize_markdown
+
+PARAGRAPH = (
+    "**Коротко:** функция `parse_items(data)` читает *каждую* запись, а snake_case_имена "
+    "и выражения вроде 2 * 3 < 4 остаются текстом.\n"
+    "* первый пункт с **жирным** и _курсивом_\n"
+    "* второй пункт: **жирный с *вложенным* курсивом**\n\n"
+    "```python\ndef parse_items(data):\n    return [x * 2 for x in data if x < 10]\n```\n\n"
+)
+
+
+def make_answer(size: int) -> str:
+    text = ""
+    while len(text) < size:
+        text += PARAGRAPH
+    return text[:size]
+
+
+class _NestingCheck(HTMLParser):
+    """Теги закрываются в обратном порядке открытия и все закрыты"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.stack: List[str] = []
+        self.ok = True
+
+    def handle_starttag(self, tag, attrs):
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack.pop() != tag:
+            self.ok = False
+
+
+def well_nested(rendered: str) -> bool:
+    check = _NestingCheck()
+    check.feed(rendered)
+    check.close()
+    return check.ok and not check.stack
+
+
+def _legacy_stream(chunks: List[str]) -> str:
+    accumulated, rendered = "", ""
+    for chunk in chunks:
+        accumulated += chunk
+        rendered = sanitize_markdown(accumulated)
+    return rendered
+
+
+def _incremental_stream(chunks: List[str]) -> str:
+    stream, rendered = TelegramHTMLStream(), ""
+    for chunk in chunks:
+        stream.feed(chunk)
+        rendered = stream.render()
+    return rendered
+
+
+def _measure(run: Callable[[List[str]], str], chunks: List[str], streams: int) -> float:
+    for _ in range(5):  # прогрев
+        run(chunks)
+    started = time.perf_counter()
+    for _ in range(streams):
+        run(chunks)
+    return (time.perf_counter() - started) / streams * 1e3
+
+
+def _last_step_us(text: str, chunk: int, repeat: int = 2000) -> Dict[str, float]:
+    """Стоимость одного шага в конце ответа: вся история уже накоплена"""
+    head, tail = text[:-chunk], text[-chunk:]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        sanitize_markdown(head + tail)
+    legacy = (time.perf_counter() - started) / repeat * 1e6
+
+    total = 0.0
+    for _ in range(repeat):
+        stream = TelegramHTMLStream()
+        stream.feed(head)
+        stream.render()
+        started = time.perf_counter()
+        stream.feed(tail)
+        stream.render()
+        total += time.perf_counter() - started
+    return {"legacy": legacy, "incremental": total / repeat * 1e6}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=4000)
+    parser.add_argument("--chunk", type=int, default=20)
+    parser.add_argument("--streams", type=int, default=200)
+    args = parser.parse_args()
+
+    text = make_answer(args.size)
+    chunks = [text[i : i + args.chunk] for i in range(0, len(text), args.chunk)]
+
+    stream, invalid = TelegramHTMLStream(), 0
+    for chunk in chunks:
+        stream.feed(chunk)
+        invalid += not well_nested(stream.render())
+    assert stream.finish() == markdown_to_html(text)
+
+    legacy_ms = _measure(_legacy_stream, chunks, args.streams)
+    incremental_ms = _measure(_incremental_stream, chunks, args.streams)
+    step = _last_step_us(text, args.chunk)
+    print(f"size={len(text)} chunk={args.chunk} steps={len(chunks)} streams={args.streams}")
+    print(
+        f"на поток:        sanitize_markdown {legacy_ms:7.3f} ms | "
+        f"TelegramHTMLStream {incremental_ms:7.3f} ms"
+    )
+    print(
+        f"последний шаг:   sanitize_markdown {step['legacy']:7.1f} us | "
+        f"TelegramHTMLStream {step['incremental']:7.1f} us"
+    )
+    print(f"HTML-префиксов с нарушенной вложенностью: {invalid} из {len(chunks)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк режима SQLite (database.sqlite_mode) против прежнего подключения без прагм.
+
+Каждый «обработчик» повторяет типичный апдейт: create_or_update_user, update_stats,
+increment_daily_usage, add_message, get_user_messages, get_stats — внутри
+db.unit_of_work(), как обработчики бота (middlewares.db_session), все конкурентно.
+Печатает апдейты/с, p50/p95 задержки апдейта и число ошибок (database is locked).
+
+python -m benchmarks.sqlite_mode --workers 50 --iterations 40
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from database.db import Database
+
+
+async def _update(database: Database, user_id: int, day: str) -> None:
+    async with database.unit_of_work():
+        await database.create_or_update_user(user_id, username=f"bench{user_id}")
+        await database.update_stats(user_id, requests_count=1, tokens_used=42, command="bench")
+        await database.increment_daily_usage(user_id, day)
+        await database.add_message(user_id, "user", "benchmark message " * 8)
+        await database.get_user_messages(user_id, limit=20)
+        await database.get_stats(user_id)
+
+
+async def run(url: str, tuned: bool, workers: int, iterations: int) -> Dict[str, float]:
+    database = Database()
+    database.profiles.use_redis = False
+    await database.init(url, sqlite_tuned=tuned)
+    day = datetime.utcnow().strftime("%Y-%m-%d")
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker(n: int) -> None:
+        nonlocal errors
+        for i in range(iterations):
+            t0 = time.perf_counter()
+            try:
+                await _update(database, 100000 + n * iterations + i % 10, day)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker(n) for n in range(workers)))
+        await database.message_buffer.flush()
+    finally:
+        elapsed = time.perf_counter() - started
+        await database.close()
+    latencies.sort()
+    return {
+        "updates_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+        "seconds": elapsed,
+    }
+
+
+async def main_async(workers: int, iterations: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, tuned in (("legacy", False), ("wal_writer", True)):
+            path = os.path.join(tmp, f"{name}.db")
+            results[name] = await run(f"sqlite+aiosqlite:///{path}", tuned, workers, iterations)
+    print(f"workers={workers} iterations={iterations}")
+    for name, r in results.items():
+        print(
+            f"{name:>10}: {r['updates_per_sec']:8.1f} upd/s  p50 {r['p50_ms']:7.1f} ms  "
+            f"p95 {r['p95_ms']:7.1f} ms  errors {int(r['errors'])}  ({r['seconds']:.1f} s)"
+        )
+    gain = results["wal_writer"]["updates_per_sec"] / results["legacy"]["updates_per_sec"]
+    print(f"speedup: x{gain:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=40)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.workers, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,33 @@
 """Модуль для работы с базой данных"""
 
-from .db import Database, db
-from .models import Achievement, Favorite, Message, Stats, User
+from .db import Database, FactRow, MessageRow, TelegramIdBatch, UserFilter, UserRow, db
+from .models import (
+    Achievement,
+    Broadcast,
+    CommandUsage,
+    DailyMetric,
+    Favorite,
+    Message,
+    Stats,
+    User,
+)
+from .profile_cache import UserProfile
 
-__all__ = ["Database", "db", "User", "Message", "Stats", "Favorite", "Achievement"]
+__all__ = [
+    "Database",
+    "db",
+    "User",
+    "Message",
+    "Stats",
+    "CommandUsage",
+    "DailyMetric",
+    "Broadcast",
+    "Favorite",
+    "Achievement",
+    "UserProfile",
+    "UserFilter",
+    "TelegramIdBatch",
+    "UserRow",
+    "MessageRow",
+    "FactRow",
+]
@@ -0,0 +1,132 @@
+"""
+Прозрачное сжатие больших текстов в БД (messages.content, favorites.content).
+
+Кодек для типа колонки models.CompressedText: строка короче COMPRESS_THRESHOLD_BYTES
+хранится как UTF-8 как есть, длиннее — deflate с общим словарём (zlib zdict), собранным
+из типичных ответов бота: markdown, код, частые русские и английские обороты. Словарь
+выручает на ответах в 0,5–4 КБ, где обычному deflate не хватает собственного контекста.
+
+Формат значения (BLOB / bytea), по первому байту:
+- 0x01 — raw deflate со словарём _DICTIONARY_V1;
+- 0x00 — несжатый UTF-8 после маркера (текст сам начинается с \\x00 или \\x01);
+- иначе — несжатый UTF-8 целиком (короткие тексты и строки до миграции 011).
+Строки (str), оставшиеся в SQLite до миграции, читаются как есть.
+
+Словарь не меняется: уже сжатые строки читаются только с ним. Новый словарь — новый
+маркер (0x02 …) и пересжатие миграцией.
+"""
+
+import zlib
+from typing import Union
+
+COMPRESS_THRESHOLD_BYTES = 512  # короче — сжатие почти не даёт выигрыша
+COMPRESS_LEVEL = 6
+_WBITS = -15  # raw deflate: без заголовка и контрольной суммы zlib (словарь общий)
+
+_TAG_RAW = b"\x00"
+_TAG_ZDICT_V1 = b"\x01"
+
+# Общий словарь: фрагменты ближе к концу кодируются короче — самые частые в конце
+_DICTIONARY_V1 = "\n".join(
+    (
+        "```javascript\nconst result = await fetch(url);\nconsole.log(result);\n```",
+        "```bash\npip install -r requirements.txt\npython main.py\n```",
+        "```sql\nSELECT * FROM users WHERE id = ? ORDER BY created_at DESC;\n```",
+        "```python\nimport asyncio\nimport json\nfrom typing import Any, Dict, List, Optional\n\n",
+        "class Config:\n    def __init__(self, *args, **kwargs):\n        super().__init__()\n",
+        "async def main():\n    try:\n        result = await client.get(url)\n"
+        '    except Exception as e:\n        print(f"Ошибка: {e}")\n\n'
+        'if __name__ == "__main__":\n    asyncio.run(main())\n```',
+        "def get(self, key: str, default=None):\n    return self.data.get(key, default)\n",
+        "for item in items:\n    if item is not None:\n        result.append(item)\nreturn result\n",
+        "Here is an example of how you can do it:\n",
+        "Let me know if you have any questions!",
+        "In summary, the main difference is that the function returns ",
+        "Note that this is an approximation. For more details, see the documentation.",
+        "Я — ИИ-ассистент. Чем могу помочь?",
+        "Если у вас есть дополнительные вопросы, обращайтесь!",
+        "Надеюсь, это поможет! Если нужно, могу объяснить подробнее.",
+        "Давайте разберём по шагам:\n\n1. ",
+        "### Пример кода\n\n",
+        "### Объяснение\n\n",
+        "### Вывод\n\n",
+        "**Важно:** ",
+        "**Итог:** ",
+        "**Преимущества:**\n- ",
+        "**Недостатки:**\n- ",
+        "Вот пример, как это можно сделать:\n\n",
+        "Это означает, что ",
+        "Например, ",
+        "Таким образом, ",
+        "В этом случае ",
+        "Кроме того, ",
+        "Во-первых, ",
+        "Во-вторых, ",
+        "В-третьих, ",
+        "Однако стоит учитывать, что ",
+        "с помощью функции ",
+        "для того чтобы ",
+        "который позволяет ",
+        "можно использовать ",
+        "в зависимости от ",
+        "следующим образом:\n\n",
+        "Основные особенности:\n\n- ",
+        "Рекомендации:\n\n1. ",
+        "Ответ: ",
+        "\n\n---\n\n",
+        "\n\n## ",
+        "\n\n### ",
+        "\n\n1. **",
+        "\n2. **",
+        "\n3. **",
+        ":** ",
+        "\n- **",
+        "\n\n```python\n",
+        "\n```\n\n",
+        ", что ",
+        ", и ",
+        ", а также ",
+        ", но ",
+        " это ",
+        " не ",
+        " на ",
+        " для ",
+        " или ",
+        " как ",
+        " если ",
+        " при ",
+        " the ",
+        " and ",
+        " of ",
+        " to ",
+    )
+).encode("utf-8")
+
+TextValue = Union[str, bytes, bytearray, memoryview]
+
+
+def encode_text(value: str, threshold: int = COMPRESS_THRESHOLD_BYTES) -> bytes:
+    """Строка → значение колонки (сжатое, если не короче threshold байт)"""
+    raw = value.encode("utf-8")
+    if len(raw) >= threshold:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, _WBITS, zdict=_DICTIONARY_V1)
+        packed = compressor.compress(raw) + compressor.flush()
+        if len(packed) + 1 < len(raw):
+            return _TAG_ZDICT_V1 + packed
+    if raw[:1] in (_TAG_RAW, _TAG_ZDICT_V1):
+        return _TAG_RAW + raw
+    return raw
+
+
+def decode_text(value: TextValue) -> str:
+    """Значение колонки → строка (любой из форматов, включая str до миграции)"""
+    if isinstance(value, str):
+        return value
+    data = bytes(value)
+    tag = data[:1]
+    if tag == _TAG_ZDICT_V1:
+        decompressor = zlib.decompressobj(_WBITS, zdict=_DICTIONARY_V1)
+        return (decompressor.decompress(data[1:]) + decompressor.flush()).decode("utf-8")
+    if tag == _TAG_RAW:
+        return data[1:].decode("utf-8")
+    return data.decode("utf-8")
@@ -2,13 +2,46 @@
 Работа с базой данных: PostgreSQL (пул соединений) или SQLite.
 При DATABASE_URL (postgresql://...) — PostgreSQL + пул для высокой нагрузки (~80k пользователей).
 Иначе — SQLite для разработки.
+
+Unit of work: внутри `async with db.unit_of_work()` (один на Telegram-апдейт) все методы
+Database работают в одной сессии — одно соединение из пула и один COMMIT в конце
+вместо отдельной сессии и коммита на каждый вызов. Вне unit of work — как раньше.
+
+Профиль пользователя (бан, премиум, персонаж, модели) читается через кэш
+database.profile_cache; методы записи сбрасывают его после COMMIT.
+
+Аналитика, админка и отчёты читают через `db.read_only_session()` — отдельный пул на
+реплике (DATABASE_REPLICA_URL) или, без реплики, небольшой отдельный пул на основной БД,
+чтобы тяжёлые агрегаты не занимали соединения чата.
+
+Горячее чтение (get_user, get_user_messages, get_user_facts) — заранее собранные Core-запросы
+(кэш компиляции SQLAlchemy и подготовленные запросы asyncpg), результат — лёгкие
+неизменяемые строки UserRow / MessageRow / FactRow вместо ORM-объектов.
+
+Дашборды админки (DAU, MAU, токены по моделям) читают дневные агрегаты daily_metrics
+(database.daily_metrics): методы записи копят счётчики в DailyMetricsBuffer, задача
+job-queue пересчитывает dau / mau.
+
+Метрики (database.instrumentation): время каждого публичного метода, ожидание и
+заполнение пулов, лог медленных запросов — на /metrics из utils.metrics.
+
+Файловая SQLite работает в режиме database.sqlite_mode: WAL, одна задача-писатель
+(методы записи — через `_write_session()`), чтение — из пула читателей. Unit of work
+в этом режиме не открывается: коммиты и так объединяет писатель.
 """
 
-import logging
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from sqlalchemy import delete, func, select
+import structlog
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -16,9 +49,24 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 
+from .daily_metrics import (
+    METRIC_COMMANDS,
+    METRIC_DAU,
+    METRIC_IMAGES,
+    METRIC_MESSAGES,
+    METRIC_NEW_USERS,
+    METRIC_REQUESTS,
+    METRIC_TOKENS,
+    DailyMetricsBuffer,
+    MetricKey,
+)
+from .instrumentation import instrument_engine, instrument_methods, timed_pool_class
 from .models import (
     Achievement,
     Base,
+    Broadcast,
+    CommandUsage,
+    DailyMetric,
     Favorite,
     Message,
     Stats,
@@ -27,14 +75,47 @@ from .models import (
     User,
     UserFact,
 )
+from .profile_cache import UserProfile, UserProfileCache
+from .sqlite_mode import (
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLiteWriter,
+    create_reader_engine,
+    create_writer_engine,
+    current_writer_session,
+    enable_savepoints,
+    is_file_sqlite,
+)
 
-logger = logging.getLogger(__name__)
+logger = structlog.get_logger(__name__)
 
 DB_PATH = "bot_database.db"
 
 # Пул для PostgreSQL (при ~80k пользователей)
 POSTGRES_POOL_SIZE = 20
 POSTGRES_MAX_OVERFLOW = 10
+# Подготовленные запросы asyncpg на соединение (по умолчанию у SQLAlchemy — 100)
+POSTGRES_STATEMENT_CACHE_SIZE = 500
+# Пул read-only сессий (реплика или основная БД): аналитика, админка, рассылка
+READ_POOL_SIZE = 5
+READ_MAX_OVERFLOW = 5
+# Основной пул админ-панели (init_admin): только бан и премиум
+ADMIN_POOL_SIZE = 2
+
+# Write-behind буфер истории диалогов (MessageWriteBuffer)
+MESSAGE_BUFFER_MAXSIZE = 5000  # при заполнении add_message ждёт сброса (backpressure)
+MESSAGE_FLUSH_BATCH = 500  # сброс по размеру
+MESSAGE_FLUSH_INTERVAL_SEC = 1.0  # и по времени
+MESSAGE_FLUSH_MAX_ATTEMPTS = 3  # неудачных INSERT строки, после которых она выбрасывается
+
+# Массовые задачи (рассылка): пачка iter_telegram_ids — один короткий запрос к read-only пулу
+USER_ITER_BATCH_SIZE = 1000
+
+
+def _async_url(url: str) -> str:
+    """SQLAlchemy async: postgresql:// → postgresql+asyncpg://"""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
 
 
 def _get_engine_url() -> str:
@@ -43,34 +124,369 @@ def _get_engine_url() -> str:
         import config
 
         url = (getattr(config.settings, "DATABASE_URL", None) or "").strip()
-        if url and url.startswith("postgresql://"):
-            # SQLAlchemy async: postgresql+asyncpg://
-            if "postgresql+asyncpg" not in url:
-                url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
-            return url
+        if url and url.startswith("postgresql"):
+            return _async_url(url)
     except Exception:
         pass
     return f"sqlite+aiosqlite:///{DB_PATH}"
 
 
+def _get_statement_cache_size() -> int:
+    """DATABASE_STATEMENT_CACHE_SIZE (0 — без подготовленных запросов, PgBouncer)"""
+    try:
+        import config
+
+        return int(
+            getattr(config.settings, "DATABASE_STATEMENT_CACHE_SIZE", POSTGRES_STATEMENT_CACHE_SIZE)
+        )
+    except Exception:
+        return POSTGRES_STATEMENT_CACHE_SIZE
+
+
+def _get_replica_url() -> str:
+    """URL реплики для чтения (DATABASE_REPLICA_URL) или пустая строка"""
+    try:
+        import config
+
+        return _async_url((getattr(config.settings, "DATABASE_REPLICA_URL", None) or "").strip())
+    except Exception:
+        return ""
+
+
 def _is_postgres(url: str) -> bool:
     return "postgresql" in url
 
 
+@dataclass
+class _UnitOfWorkState:
+    """Сессия unit of work, задача-владелец и действия после COMMIT"""
+
+    session: AsyncSession
+    owner: "asyncio.Task[Any] | None"
+    after_commit: List[Tuple[Callable[..., Awaitable[Any]], Tuple[Any, ...]]] = field(
+        default_factory=list
+    )
+
+
+@dataclass(frozen=True)
+class UserFilter:
+    """Фильтр массовых выборок пользователей; None — без ограничения по полю"""
+
+    is_premium: Optional[bool] = None
+    is_banned: Optional[bool] = None
+    language: Optional[str] = None
+    active_since: Optional[datetime] = None  # последняя активность — stats.updated_at
+    bot_blocked: Optional[bool] = None  # пользователь заблокировал бота (users.bot_blocked_at)
+
+
+@dataclass(frozen=True)
+class TelegramIdBatch:
+    """Пачка iter_telegram_ids; cursor — users.id последней строки (after_id для продолжения)"""
+
+    telegram_ids: List[int]
+    cursor: int
+
+
+@dataclass(frozen=True, slots=True)
+class UserRow:
+    """Строка users без ORM (get_user)"""
+
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    language: Optional[str]
+    persona: Optional[str]
+    model: Optional[str]
+    image_model: Optional[str]
+    age: Optional[int]
+    is_banned: bool
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    bot_blocked_at: Optional[datetime]  # заблокировал бота (рассылки его пропускают)
+
+
+@dataclass(frozen=True, slots=True)
+class MessageRow:
+    """Сообщение истории диалога без ORM (get_user_messages)"""
+
+    role: str
+    content: str
+    created_at: Optional[datetime]
+
+
+@dataclass(frozen=True, slots=True)
+class FactRow:
+    """Факт о пользователе без ORM (get_user_facts)"""
+
+    fact_type: str
+    fact_value: str
+    created_at: Optional[datetime]
+
+
+_users = User.__table__.c
+_messages = Message.__table__.c
+_facts = UserFact.__table__.c
+
+# Горячие запросы собраны один раз: на вызове только параметры, компиляция — из кэша
+_SELECT_USER = select(
+    _users.id,
+    _users.telegram_id,
+    _users.username,
+    _users.first_name,
+    _users.language,
+    _users.persona,
+    _users.model,
+    _users.image_model,
+    _users.age,
+    _users.is_banned,
+    _users.created_at,
+    _users.updated_at,
+    _users.bot_blocked_at,
+).where(_users.telegram_id == bindparam("telegram_id"))
+_SELECT_MESSAGES = (
+    select(_messages.role, _messages.content, _messages.created_at)
+    .where(_messages.user_id == bindparam("user_id"))
+    .order_by(_messages.created_at.desc(), _messages.id.desc())
+    .limit(bindparam("limit"))
+)
+_SELECT_FACTS = (
+    select(_facts.fact_type, _facts.fact_value, _facts.created_at)
+    .where(_facts.user_id == bindparam("user_id"))
+    .order_by(_facts.created_at.desc())
+    .limit(bindparam("limit"))
+)
+
+
+# Задачи, порождённые внутри апдейта (create_task копирует контекст), получают
+# собственные сессии, а не чужую — поэтому храним владельца
+_unit_of_work: ContextVar[Optional[_UnitOfWorkState]] = ContextVar("db_unit_of_work", default=None)
+
+
+_MESSAGE_COLUMNS = ("user_id", "role", "content", "created_at")
+
+
+def _is_row_error(error: Exception) -> bool:
+    """Ошибка из-за данных строк (ограничение, тип значения), а не из-за недоступности БД"""
+    if isinstance(error, (IntegrityError, DataError)):
+        return True
+    return isinstance(error, StatementError) and not isinstance(error, DBAPIError)
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind буфер для истории диалогов: строки Message всех пользователей копятся
+    в памяти и пишутся многострочным INSERT не больше batch_size строк по размеру или по
+    таймеру (flush_interval). Буфер ограничен (maxsize): при заполнении add() ждёт, пока
+    фоновый сброс освободит место. Несброшенные строки видны в get_user_messages
+    (read-your-writes), close() сбрасывает остаток.
+
+    Пачка, упавшая из-за данных (ограничение, тип), пишется половинами; строка, которая
+    не записалась MESSAGE_FLUSH_MAX_ATTEMPTS раз, выбрасывается в лог message_dropped.
+    При недоступности БД строки остаются в буфере до следующего сброса.
+    """
+
+    def __init__(
+        self,
+        database: "Database",
+        maxsize: int = MESSAGE_BUFFER_MAXSIZE,
+        batch_size: int = MESSAGE_FLUSH_BATCH,
+        flush_interval: float = MESSAGE_FLUSH_INTERVAL_SEC,
+        max_attempts: int = MESSAGE_FLUSH_MAX_ATTEMPTS,
+    ) -> None:
+        self._db = database
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        if not self.running:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Остановить фоновый сброс и записать всё, что осталось в буфере: при недоступности
+        БД — не больше max_attempts попыток подряд, затем ошибка (остаток теряется)
+        """
+        if self._task is not None:
+            # Не cancel: прерванный посреди COMMIT сброс оставил бы строки в неизвестном состоянии
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        self._space.set()  # add(), ждущие места, допишут строки — их сбросит цикл ниже
+        failures = 0
+        while self._pending:
+            try:
+                await self.flush()
+                failures = 0
+            except Exception:
+                failures += 1
+                if failures >= self.max_attempts:
+                    raise
+                await asyncio.sleep(self.flush_interval)
+
+    async def add(self, user_id: int, role: str, content: str) -> None:
+        """Поставить сообщение в буфер; created_at фиксируется сейчас (порядок истории)"""
+        while len(self._pending) >= self.maxsize and self.running:
+            # Backpressure: ждём фоновый сброс, а не пишем сами на каждом сообщении
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+        self._pending.append(
+            {
+                "user_id": user_id,
+                "role": role,
+                "content": content,
+                "created_at": datetime.utcnow(),
+            }
+        )
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending_for(self, user_id: int) -> List[Dict[str, Any]]:
+        """Несброшенные строки пользователя (в порядке добавления)"""
+        return [row for row in self._pending if row["user_id"] == user_id]
+
+    def paused(self) -> asyncio.Lock:
+        """Блокировка сброса: пока она взята, буфер ничего не пишет в БД"""
+        return self._flush_lock
+
+    def discard(self, user_id: int) -> None:
+        """Выбросить несброшенные сообщения пользователя (очистка истории)"""
+        self._pending = [row for row in self._pending if row["user_id"] != user_id]
+
+    async def flush(self) -> int:
+        """
+        Записать до batch_size накопленных строк; вернуть число записанных. Ошибка
+        недоступности БД пробрасывается, строки остаются в буфере.
+        """
+        async with self._flush_lock:
+            batch = self._pending[: self.batch_size]
+            if not batch:
+                return 0
+            done: List[Dict[str, Any]] = []
+            try:
+                written = await self._write(batch, done)
+            finally:
+                # Пока шёл INSERT, add() мог только дописать строки в конец (discard — под
+                # блокировкой); записанные и выброшенные строки убираем из буфера
+                if done:
+                    finished = {id(row) for row in done}
+                    self._pending = [row for row in self._pending if id(row) not in finished]
+            logger.debug("messages_flushed", rows=written, pending=len(self._pending))
+            return written
+
+    async def _write(self, rows: List[Dict[str, Any]], done: List[Dict[str, Any]]) -> int:
+        """INSERT строк; при ошибке данных — половинами, до одной строки"""
+        try:
+            await self._insert(rows)
+        except Exception as e:
+            if not _is_row_error(e):
+                raise
+            if len(rows) > 1:
+                middle = len(rows) // 2
+                return await self._write(rows[:middle], done) + await self._write(
+                    rows[middle:], done
+                )
+            row = rows[0]
+            row["attempts"] = row.get("attempts", 0) + 1
+            if row["attempts"] >= self.max_attempts:
+                done.append(row)
+                logger.error(
+                    "message_dropped",
+                    user_id=row["user_id"],
+                    role=row["role"],
+                    created_at=row["created_at"].isoformat(),
+                    attempts=row["attempts"],
+                    error=str(e),
+                )
+            return 0
+        done.extend(rows)
+        return len(rows)
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        params = [{name: row[name] for name in _MESSAGE_COLUMNS} for row in rows]
+        if self._db.writer is not None:
+            # SQLite: через единственного писателя, в его пачке
+            async with self._db.writer.session() as session:
+                await session.execute(insert(Message), params)
+        else:
+            async with self._db.async_session() as session:
+                await session.execute(insert(Message), params)
+                await session.commit()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                if len(self._pending) >= self.batch_size:
+                    self._wakeup.set()  # накопилось больше пачки — следующая сразу
+            except Exception as e:
+                logger.warning("messages_flush_failed", pending=len(self._pending), error=str(e))
+            if len(self._pending) < self.maxsize:
+                self._space.set()
+
+
+@instrument_methods
 class Database:
     """Класс для работы с базой данных"""
 
     engine: AsyncEngine | None
     async_session: async_sessionmaker[AsyncSession] | None
+    read_engine: AsyncEngine | None
+    read_session: async_sessionmaker[AsyncSession] | None
 
     def __init__(self, db_path: str = DB_PATH) -> None:
         self.db_path = db_path
         self.engine: AsyncEngine | None = None
         self.async_session: async_sessionmaker[AsyncSession] | None = None
+        self.read_engine: AsyncEngine | None = None
+        self.read_session: async_sessionmaker[AsyncSession] | None = None
+        # Сессии обычного чтения: пул читателей SQLite или основной пул
+        self._reader: async_sessionmaker[AsyncSession] | None = None
+        self.writer: Optional[SQLiteWriter] = None
+        self.message_buffer = MessageWriteBuffer(self)
+        self.daily_metrics = DailyMetricsBuffer(self)
+        self.profiles = UserProfileCache(self._load_user_profile)
 
-    async def init(self) -> None:
-        """Инициализация базы данных (PostgreSQL с пулом или SQLite)."""
-        url = _get_engine_url()
+    async def init(
+        self,
+        url: Optional[str] = None,
+        replica_url: Optional[str] = None,
+        sqlite_tuned: bool = True,
+    ) -> None:
+        """
+        Инициализация базы данных (PostgreSQL с пулом или SQLite).
+        url / replica_url — явные URL (инструменты, админка, тесты); по умолчанию —
+        DATABASE_URL и DATABASE_REPLICA_URL. sqlite_tuned=False — SQLite без WAL и
+        писателя (одно соединение на сессию, как раньше; бенчмарк).
+        """
+        if url:
+            # Явный URL (инструменты, тесты): реплика — только если передана явно
+            url, replica_url = _async_url(url), _async_url(replica_url or "")
+        else:
+            url, replica_url = _get_engine_url(), _get_replica_url()
         if _is_postgres(url):
             self.engine = create_async_engine(
                 url,
@@ -79,6 +495,8 @@ class Database:
                 max_overflow=POSTGRES_MAX_OVERFLOW,
                 pool_pre_ping=True,
                 pool_recycle=300,
+                poolclass=timed_pool_class("primary"),
+                connect_args={"prepared_statement_cache_size": _get_statement_cache_size()},
             )
             logger.info(
                 "database_initialized",
@@ -86,40 +504,318 @@ class Database:
                 pool_size=POSTGRES_POOL_SIZE,
                 max_overflow=POSTGRES_MAX_OVERFLOW,
             )
+        elif sqlite_tuned and is_file_sqlite(url):
+            self.engine = create_writer_engine(url)
+            logger.info("database_initialized", backend="sqlite", mode="wal_writer", url=url)
         else:
             self.engine = create_async_engine(url, echo=False)
+            enable_savepoints(self.engine)
             logger.info("database_initialized", backend="sqlite", path=self.db_path)
 
+        instrument_engine(self.engine, "primary")
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
 
         self.async_session = async_sessionmaker(
             self.engine, class_=AsyncSession, expire_on_commit=False
         )
+        sqlite_mode = sqlite_tuned and not _is_postgres(url) and is_file_sqlite(url)
+        self._init_read_engine(url, "" if sqlite_mode else replica_url, sqlite_mode)
+        if sqlite_mode:
+            self.writer = SQLiteWriter(self.async_session)
+            self.writer.start()
+        self._reader = self.read_session if sqlite_mode else self.async_session
+        self.message_buffer.start()
+        self.daily_metrics.start()
+
+    async def init_admin(self, url: str, replica_url: Optional[str] = None) -> None:
+        """
+        Подключение админ-панели — отдельного процесса рядом с ботом: без create_all,
+        писателя SQLite и фоновых буферов (схему и запись ведёт бот). Дашборды читают
+        read-only пулом (реплика, отдельный пул PostgreSQL или query_only-читатели
+        SQLite); редкие действия (бан, премиум) — через основной пул без писателя, на
+        SQLite — с ожиданием блокировки писателя бота (busy_timeout).
+        """
+        url, replica_url = _async_url(url), _async_url(replica_url or "")
+        if _is_postgres(url):
+            self.engine = create_async_engine(
+                url,
+                echo=False,
+                pool_size=ADMIN_POOL_SIZE,
+                max_overflow=0,
+                pool_pre_ping=True,
+                pool_recycle=300,
+                poolclass=timed_pool_class("primary"),
+                connect_args={"prepared_statement_cache_size": _get_statement_cache_size()},
+            )
+        else:
+            self.engine = create_async_engine(
+                url, echo=False, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+            )
+            enable_savepoints(self.engine)
+        instrument_engine(self.engine, "primary")
+        self.async_session = async_sessionmaker(
+            self.engine, class_=AsyncSession, expire_on_commit=False
+        )
+        sqlite_mode = not _is_postgres(url) and is_file_sqlite(url)
+        self._init_read_engine(url, "" if sqlite_mode else replica_url, sqlite_mode)
+        self._reader = self.async_session
+        logger.info("database_initialized", backend=self.engine.dialect.name, mode="admin")
+
+    def _init_read_engine(self, url: str, replica_url: str, sqlite_mode: bool = False) -> None:
+        """Read-only пул: реплика, отдельный пул на основной PostgreSQL, читатели SQLite"""
+        read_url = replica_url or url
+        if sqlite_mode:
+            self.read_engine = create_reader_engine(url)
+        elif _is_postgres(read_url):
+            self.read_engine = create_async_engine(
+                read_url,
+                echo=False,
+                pool_size=READ_POOL_SIZE,
+                max_overflow=READ_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                pool_recycle=300,
+                poolclass=timed_pool_class("read"),
+                connect_args={"prepared_statement_cache_size": _get_statement_cache_size()},
+                execution_options={"postgresql_readonly": True},
+            )
+            logger.info(
+                "database_read_pool_initialized",
+                replica=bool(replica_url),
+                pool_size=READ_POOL_SIZE,
+            )
+        elif replica_url:
+            self.read_engine = create_async_engine(read_url, echo=False)
+        else:
+            self.read_engine = self.engine
+        if self.read_engine is not self.engine:
+            instrument_engine(self.read_engine, "read")
+        self.read_session = async_sessionmaker(
+            self.read_engine, class_=AsyncSession, expire_on_commit=False
+        )
 
     async def close(self) -> None:
-        """Закрытие соединения с базой данных"""
+        """Закрытие соединения с базой данных (с сбросом буфера сообщений)"""
+        if self.async_session is not None:
+            try:
+                await self.message_buffer.stop()
+            except Exception as e:
+                logger.error(
+                    "messages_flush_on_close_failed", lost=len(self.message_buffer), error=str(e)
+                )
+            try:
+                await self.daily_metrics.stop()
+            except Exception as e:
+                logger.error(
+                    "daily_metrics_flush_on_close_failed",
+                    lost=len(self.daily_metrics),
+                    error=str(e),
+                )
+        if self.writer is not None:
+            await self.writer.stop()
+            self.writer = None
+        if self.read_engine is not None and self.read_engine is not self.engine:
+            await self.read_engine.dispose()
         if self.engine:
             await self.engine.dispose()
             logger.info("Соединение с базой данных закрыто")
 
+    def _current_state(self) -> Optional[_UnitOfWorkState]:
+        state = _unit_of_work.get()
+        if state is None or state.owner is not asyncio.current_task():
+            return None
+        return state
+
+    def _current_uow(self) -> Optional[AsyncSession]:
+        """Сессия unit of work текущей задачи (или None)"""
+        state = self._current_state()
+        return state.session if state is not None else None
+
+    async def _after_commit(self, callback: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        """Выполнить callback после COMMIT: сразу вне unit of work, иначе — после его коммита"""
+        state = self._current_state()
+        if state is None:
+            await callback(*args)
+        else:
+            state.after_commit.append((callback, args))
+
+    @staticmethod
+    async def _run_after_commit(state: _UnitOfWorkState) -> None:
+        callbacks, state.after_commit = state.after_commit, []
+        for callback, args in callbacks:
+            try:
+                await callback(*args)
+            except Exception as e:
+                logger.warning("after_commit_callback_failed", error=str(e))
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncSession]:
+        """Сессия для метода: общая сессия unit of work или новая"""
+        slot = current_writer_session()
+        if slot is not None:
+            # Внутри блока записи SQLite читаем в его же транзакции (свои изменения видны)
+            yield slot
+            return
+        uow = self._current_uow()
+        if uow is None:
+            async with self._reader() as session:
+                yield session
+            return
+        # Метод — в своём SAVEPOINT: ошибка откатывает только его изменения, а записи
+        # апдейта до него (и их after_commit) остаются в транзакции unit of work
+        async with uow.begin_nested():
+            yield uow
+
+    @asynccontextmanager
+    async def _write_session(self) -> AsyncIterator[AsyncSession]:
+        """Сессия для метода записи: блок писателя SQLite или как _session()"""
+        if self.writer is None:
+            async with self._session() as session:
+                yield session
+        else:
+            async with self.writer.session() as session:
+                yield session
+
+    async def _commit(self, session: AsyncSession) -> None:
+        """
+        COMMIT вне unit of work; внутри unit of work или блока писателя SQLite — только
+        flush (коммит в конце апдейта или пачки писателя)
+        """
+        if session is self._current_uow() or session is current_writer_session():
+            await session.flush()
+        else:
+            await session.commit()
+
+    @asynccontextmanager
+    async def read_only_session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Сессия только для чтения (аналитика, админка, отчёты): реплика или отдельный пул.
+        Не участвует в unit of work; данные реплики могут отставать от основной БД.
+        """
+        async with self.read_session() as session:
+            yield session
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[None]:
+        """
+        Одна сессия и одна транзакция на весь блок (Telegram-апдейт): COMMIT при выходе,
+        ROLLBACK при исключении. Вложенные вызовы переиспользуют внешний unit of work.
+        Каждый метод Database выполняется в своём SAVEPOINT: пойманная обработчиком ошибка
+        метода откатывает только его изменения.
+        """
+        if self.async_session is None or self.writer is not None or self._current_uow() is not None:
+            yield
+            return
+        session = self.async_session()
+        state = _UnitOfWorkState(session, asyncio.current_task())
+        token = _unit_of_work.set(state)
+        try:
+            yield
+            await session.commit()
+            await self._run_after_commit(state)
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            _unit_of_work.reset(token)
+            await session.close()
+
+    async def checkpoint(self) -> None:
+        """
+        Закоммитить накопленное в unit of work и вернуть соединение в пул — перед долгим
+        ожиданием (LLM, генерация изображения), чтобы апдейт не держал соединение.
+        """
+        state = self._current_state()
+        if state is not None and state.session.in_transaction():
+            await state.session.commit()
+            await self._run_after_commit(state)
+
+    def _insert(self, model):
+        """INSERT с поддержкой ON CONFLICT для текущего диалекта (PostgreSQL или SQLite)"""
+        if self.engine is not None and self.engine.dialect.name == "postgresql":
+            return pg_insert(model)
+        return sqlite_insert(model)
+
     # ========== Работа с пользователями ==========
 
-    async def get_user(self, telegram_id: int) -> Optional[User]:
-        """Получить пользователя по telegram_id"""
-        async with self.async_session() as session:
-            result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-            return result.scalar_one_or_none()
+    async def get_user(self, telegram_id: int) -> Optional[UserRow]:
+        """Получить пользователя по telegram_id (строка без ORM)"""
+        async with self._session() as session:
+            row = (await session.execute(_SELECT_USER, {"telegram_id": telegram_id})).first()
+            return UserRow(*row) if row is not None else None
 
     async def get_all_telegram_ids(self) -> List[int]:
-        """Получить все telegram_id пользователей (для рассылки)"""
-        async with self.async_session() as session:
+        """Получить все telegram_id пользователей (для рассылки; read-only пул)"""
+        async with self.read_only_session() as session:
             result = await session.execute(select(User.telegram_id))
             return [row[0] for row in result.all()]
 
+    async def iter_telegram_ids(
+        self,
+        batch_size: int = USER_ITER_BATCH_SIZE,
+        filters: Optional[UserFilter] = None,
+        after_id: int = 0,
+    ) -> AsyncIterator[TelegramIdBatch]:
+        """
+        telegram_id пользователей пачками в порядке users.id (read-only пул) — память
+        не зависит от числа пользователей. Keyset-пагинация: каждая пачка — отдельный
+        запрос WHERE users.id > cursor, результат читается потоково (server-side cursor
+        в PostgreSQL), соединение не держится между пачками. Продолжить после сбоя —
+        after_id = cursor последней обработанной пачки.
+        """
+        stmt = select(User.id, User.telegram_id).order_by(User.id).limit(batch_size)
+        if filters is not None:
+            stmt = self._apply_user_filter(stmt, filters)
+        cursor = after_id
+        while True:
+            async with self.read_only_session() as session:
+                result = await session.stream(stmt.where(User.id > cursor))
+                rows = [tuple(row) async for row in result]
+            if not rows:
+                return
+            cursor = rows[-1][0]
+            yield TelegramIdBatch([telegram_id for _, telegram_id in rows], cursor)
+            if len(rows) < batch_size:
+                return
+
+    async def count_users(self, filters: Optional[UserFilter] = None) -> int:
+        """Количество пользователей под фильтром (read-only пул)"""
+        stmt = select(func.count(User.id))
+        if filters is not None:
+            stmt = self._apply_user_filter(stmt, filters)
+        async with self.read_only_session() as session:
+            return (await session.execute(stmt)).scalar() or 0
+
+    @staticmethod
+    def _apply_user_filter(stmt, filters: UserFilter):
+        if filters.is_banned is not None:
+            banned = func.coalesce(User.is_banned, False)
+            stmt = stmt.where(banned.is_(True) if filters.is_banned else banned.is_(False))
+        if filters.language is not None:
+            stmt = stmt.where(User.language == filters.language)
+        if filters.bot_blocked is not None:
+            blocked_at = User.bot_blocked_at
+            stmt = stmt.where(
+                blocked_at.is_not(None) if filters.bot_blocked else blocked_at.is_(None)
+            )
+        if filters.is_premium is not None:
+            premium = (
+                select(Subscription.id)
+                .where(Subscription.user_id == User.telegram_id, Subscription.tier == "premium")
+                .exists()
+            )
+            stmt = stmt.where(premium if filters.is_premium else ~premium)
+        if filters.active_since is not None:
+            stmt = stmt.where(
+                select(Stats.id)
+                .where(Stats.user_id == User.telegram_id, Stats.updated_at >= filters.active_since)
+                .exists()
+            )
+        return stmt
+
     async def get_users_count(self) -> int:
-        """Получить количество пользователей"""
-        async with self.async_session() as session:
+        """Получить количество пользователей (read-only пул)"""
+        async with self.read_only_session() as session:
             result = await session.execute(select(func.count(User.id)))
             return result.scalar() or 0
 
@@ -131,10 +827,11 @@ class Database:
         **kwargs: Any,
     ) -> User:
         """Создать или обновить пользователя"""
-        async with self.async_session() as session:
+        async with self._write_session() as session:
             result = await session.execute(select(User).where(User.telegram_id == telegram_id))
             user = result.scalar_one_or_none()
 
+            created = user is None
             if user:
                 # Обновляем существующего пользователя
                 for key, value in kwargs.items():
@@ -152,42 +849,63 @@ class Database:
                 )
                 session.add(user)
 
-            await session.commit()
+            await self._commit(session)
             await session.refresh(user)
-            return user
+        await self._after_commit(self.profiles.invalidate, telegram_id)
+        if created:
+            await self._after_commit(self.daily_metrics.record, METRIC_NEW_USERS)
+        return user
 
     # ========== Работа с сообщениями ==========
 
     async def add_message(self, user_id: int, role: str, content: str) -> None:
-        """Добавить сообщение в историю"""
-        async with self.async_session() as session:
+        """Добавить сообщение в историю (через write-behind буфер, если он запущен)"""
+        # Активный пользователь дня (DAU / MAU) — тот, кто написал боту
+        active_user = user_id if role == "user" else None
+        if self.message_buffer.running:
+            await self.message_buffer.add(user_id, role, content)
+            await self.daily_metrics.record(METRIC_MESSAGES, 1, role, active_user)
+            return
+        async with self._write_session() as session:
             message = Message(user_id=user_id, role=role, content=content)
             session.add(message)
-            await session.commit()
+            await self._commit(session)
+        await self._after_commit(self.daily_metrics.record, METRIC_MESSAGES, 1, role, active_user)
 
-    async def get_user_messages(self, user_id: int, limit: int = 20) -> List[Message]:
-        """Получить последние сообщения пользователя"""
-        async with self.async_session() as session:
-            result = await session.execute(
-                select(Message)
-                .where(Message.user_id == user_id)
-                .order_by(Message.created_at.desc())
-                .limit(limit)
-            )
-            messages = result.scalars().all()
-            return list(reversed(messages))  # Возвращаем в хронологическом порядке
+    async def get_user_messages(self, user_id: int, limit: int = 20) -> List[MessageRow]:
+        """Получить последние сообщения пользователя (включая ещё не сброшенные из буфера)"""
+        # Снимок буфера — до запроса: строка, сброшенная во время запроса, найдётся в одном
+        # из источников, а дубликат отсекается по (created_at, role, content)
+        pending = self.message_buffer.pending_for(user_id)
+        async with self._session() as session:
+            result = await session.execute(_SELECT_MESSAGES, {"user_id": user_id, "limit": limit})
+            messages = [MessageRow(*row) for row in result.all()]
+        messages.reverse()  # В хронологическом порядке
+        if not pending:
+            return messages
+        stored = {(m.created_at, m.role, m.content) for m in messages}
+        messages.extend(
+            MessageRow(row["role"], row["content"], row["created_at"])
+            for row in pending
+            if (row["created_at"], row["role"], row["content"]) not in stored
+        )
+        messages.sort(key=lambda m: m.created_at)
+        return messages[-limit:]
 
     async def clear_user_messages(self, user_id: int) -> None:
         """Очистить историю сообщений пользователя"""
-        async with self.async_session() as session:
-            await session.execute(delete(Message).where(Message.user_id == user_id))
-            await session.commit()
+        # Под блокировкой сброса: строки из буфера не допишутся в БД после DELETE
+        async with self.message_buffer.paused():
+            self.message_buffer.discard(user_id)
+            async with self._write_session() as session:
+                await session.execute(delete(Message).where(Message.user_id == user_id))
+                await self._commit(session)
 
     # ========== Работа со статистикой ==========
 
     async def get_stats(self, user_id: int) -> Optional[Stats]:
         """Получить статистику пользователя"""
-        async with self.async_session() as session:
+        async with self._session() as session:
             result = await session.execute(select(Stats).where(Stats.user_id == user_id))
             return result.scalar_one_or_none()
 
@@ -198,31 +916,86 @@ class Database:
         tokens_used: Optional[int] = None,
         images_generated: Optional[int] = None,
         command: Optional[str] = None,
+        model: Optional[str] = None,
     ) -> None:
-        """Обновить статистику пользователя"""
-        async with self.async_session() as session:
-            # Получаем статистику через текущую сессию
-            result = await session.execute(select(Stats).where(Stats.user_id == user_id))
-            stats = result.scalar_one_or_none()
-
-            if not stats:
-                stats = Stats(user_id=user_id)
-                session.add(stats)
-                await session.flush()  # Получаем ID для нового объекта
-
-            if requests_count is not None:
-                stats.requests_count += requests_count
-            if tokens_used is not None:
-                stats.tokens_used += tokens_used
-            if images_generated is not None:
-                stats.images_generated += images_generated
+        """
+        Обновить статистику пользователя: счётчики — одним атомарным
+        INSERT ... ON CONFLICT (user_id) DO UPDATE SET x = x + excluded.x,
+        команда — атомарный инкремент в command_usage за сегодня.
+        model — разрез токенов и изображений в дневных агрегатах (daily_metrics)
+        """
+        now = datetime.utcnow()
+        deltas = {
+            "requests_count": requests_count or 0,
+            "tokens_used": tokens_used or 0,
+            "images_generated": images_generated or 0,
+        }
+        stmt = self._insert(Stats).values(user_id=user_id, start_date=now, updated_at=now, **deltas)
+        set_ = {
+            name: func.coalesce(getattr(Stats, name), 0) + getattr(stmt.excluded, name)
+            for name, delta in deltas.items()
+            if delta
+        }
+        set_["updated_at"] = now
+        stmt = stmt.on_conflict_do_update(index_elements=[Stats.user_id], set_=set_)
+        async with self._write_session() as session:
+            await session.execute(stmt)
             if command:
-                commands = stats.commands_used or {}
-                commands[command] = commands.get(command, 0) + 1
-                stats.commands_used = commands
+                await session.execute(self._command_usage_upsert(user_id, command, now))
+            await self._commit(session)
+        for metric, amount, dimension in (
+            (METRIC_REQUESTS, deltas["requests_count"], ""),
+            (METRIC_TOKENS, deltas["tokens_used"], model or ""),
+            (METRIC_IMAGES, deltas["images_generated"], model or ""),
+            (METRIC_COMMANDS, 1 if command else 0, command or ""),
+        ):
+            if amount:
+                await self._after_commit(self.daily_metrics.record, metric, amount, dimension)
 
-            stats.updated_at = datetime.utcnow()
-            await session.commit()
+    def _command_usage_upsert(
+        self, user_id: int, command: str, now: datetime, amount: int = 1, day: str = ""
+    ):
+        """INSERT ... ON CONFLICT (user_id, command, day) DO UPDATE SET count = count + amount"""
+        stmt = self._insert(CommandUsage).values(
+            user_id=user_id, command=command, day=day or now.strftime("%Y-%m-%d"), count=amount
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=[CommandUsage.user_id, CommandUsage.command, CommandUsage.day],
+            set_={"count": CommandUsage.count + stmt.excluded.count},
+        )
+
+    async def increment_command_usage(
+        self, user_id: int, command: str, amount: int = 1, day: str = ""
+    ) -> None:
+        """Атомарно увеличить счётчик команды пользователя за день (по умолчанию — сегодня)"""
+        async with self._write_session() as session:
+            await session.execute(
+                self._command_usage_upsert(user_id, command, datetime.utcnow(), amount, day)
+            )
+            await self._commit(session)
+
+    async def get_command_usage(self, user_id: int) -> Dict[str, int]:
+        """Сколько раз пользователь вызывал каждую команду (за всё время)"""
+        async with self._session() as session:
+            result = await session.execute(
+                select(CommandUsage.command, func.sum(CommandUsage.count))
+                .where(CommandUsage.user_id == user_id)
+                .group_by(CommandUsage.command)
+            )
+            return {command: int(total) for command, total in result.all()}
+
+    async def get_top_commands(self, since_day: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """Самые популярные команды всех пользователей начиная с since_day (YYYY-MM-DD)"""
+        total = func.sum(CommandUsage.count).label("total")
+        async with self.read_only_session() as session:
+            result = await session.execute(
+                select(CommandUsage.command, total)
+                .where(CommandUsage.day >= since_day)
+                .group_by(CommandUsage.command)
+                .order_by(total.desc())
+                .limit(limit)
+            )
+            return [(command, int(count)) for command, count in result.all()]
 
     # ========== Работа с избранным ==========
 
@@ -234,18 +1007,18 @@ class Database:
         tags: Optional[List[str]] = None,
     ) -> Favorite:
         """Добавить в избранное"""
-        async with self.async_session() as session:
+        async with self._write_session() as session:
             favorite = Favorite(
                 user_id=user_id, content=content, content_type=content_type, tags=tags or []
             )
             session.add(favorite)
-            await session.commit()
+            await self._commit(session)
             await session.refresh(favorite)
             return favorite
 
     async def get_user_favorites(self, user_id: int, limit: int = 50) -> List[Favorite]:
         """Получить избранное пользователя"""
-        async with self.async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(Favorite)
                 .where(Favorite.user_id == user_id)
@@ -258,7 +1031,7 @@ class Database:
 
     async def add_achievement(self, user_id: int, achievement_id: str) -> None:
         """Добавить достижение пользователю"""
-        async with self.async_session() as session:
+        async with self._write_session() as session:
             # Проверяем, есть ли уже это достижение
             result = await session.execute(
                 select(Achievement).where(
@@ -270,11 +1043,11 @@ class Database:
 
             achievement = Achievement(user_id=user_id, achievement_id=achievement_id)
             session.add(achievement)
-            await session.commit()
+            await self._commit(session)
 
     async def get_user_achievements(self, user_id: int) -> List[str]:
         """Получить список достижений пользователя"""
-        async with self.async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(Achievement.achievement_id).where(Achievement.user_id == user_id)
             )
@@ -284,47 +1057,56 @@ class Database:
 
     async def add_user_fact(self, user_id: int, fact_type: str, fact_value: str) -> None:
         """Добавить факт о пользователе (дедупликация по типу: храним последний)"""
-        async with self.async_session() as session:
-            result = await session.execute(
-                select(UserFact).where(
-                    UserFact.user_id == user_id,
-                    UserFact.fact_type == fact_type,
-                )
-            )
-            existing = result.scalar_one_or_none()
-            if existing:
-                existing.fact_value = fact_value
-            else:
-                session.add(UserFact(user_id=user_id, fact_type=fact_type, fact_value=fact_value))
-            await session.commit()
+        await self.upsert_user_facts(user_id, {fact_type: fact_value})
 
-    async def get_user_facts(self, user_id: int, limit: int = 5) -> List[UserFact]:
+    async def upsert_user_facts(self, user_id: int, facts: Dict[str, str]) -> int:
+        """Атомарно сохранить факты пользователя {fact_type: fact_value} одним запросом"""
+        return await self.upsert_user_facts_batch({user_id: facts})
+
+    async def upsert_user_facts_batch(self, facts_by_user: Dict[int, Dict[str, str]]) -> int:
+        """
+        Факты нескольких пользователей {user_id: {type: value}} — один многострочный
+        INSERT ... ON CONFLICT (user_id, fact_type) DO UPDATE (PostgreSQL и SQLite).
+        Обновлённый факт получает новый created_at: get_user_facts отдаёт последние.
+        """
+        now = datetime.utcnow()
+        rows = [
+            {
+                "user_id": user_id,
+                "fact_type": fact_type,
+                "fact_value": fact_value,
+                "created_at": now,
+            }
+            for user_id, facts in facts_by_user.items()
+            for fact_type, fact_value in facts.items()
+        ]
+        if not rows:
+            return 0
+        stmt = self._insert(UserFact).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserFact.user_id, UserFact.fact_type],
+            set_={"fact_value": stmt.excluded.fact_value, "created_at": stmt.excluded.created_at},
+        )
+        async with self._write_session() as session:
+            await session.execute(stmt)
+            await self._commit(session)
+        return len(rows)
+
+    async def get_user_facts(self, user_id: int, limit: int = 5) -> List[FactRow]:
         """Получить последние факты пользователя"""
-        async with self.async_session() as session:
-            result = await session.execute(
-                select(UserFact)
-                .where(UserFact.user_id == user_id)
-                .order_by(UserFact.created_at.desc())
-                .limit(limit)
-            )
-            return list(result.scalars().all())
+        async with self._session() as session:
+            result = await session.execute(_SELECT_FACTS, {"user_id": user_id, "limit": limit})
+            return [FactRow(*row) for row in result.all()]
 
     # ========== Подписка и лимиты ==========
 
     async def is_premium(self, user_id: int) -> bool:
-        """Проверка премиум-подписки"""
-        async with self.async_session() as session:
-            result = await session.execute(
-                select(Subscription).where(
-                    Subscription.user_id == user_id,
-                    Subscription.tier == "premium",
-                )
-            )
-            return result.scalar_one_or_none() is not None
+        """Проверка премиум-подписки (из кэша профиля)"""
+        return (await self.profiles.get(user_id)).is_premium
 
     async def get_daily_usage(self, user_id: int, date_str: str) -> int:
         """Получить количество запросов за день"""
-        async with self.async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(UsageDaily).where(
                     UsageDaily.user_id == user_id,
@@ -335,27 +1117,48 @@ class Database:
             return row.count if row else 0
 
     async def increment_daily_usage(self, user_id: int, date_str: str) -> int:
-        """Увеличить счётчик за день, вернуть новое значение"""
-        async with self.async_session() as session:
-            result = await session.execute(
-                select(UsageDaily).where(
-                    UsageDaily.user_id == user_id,
-                    UsageDaily.date == date_str,
-                )
-            )
-            row = result.scalar_one_or_none()
-            if row:
-                row.count += 1
-                count = row.count
-            else:
-                session.add(UsageDaily(user_id=user_id, date=date_str, count=1))
-                count = 1
-            await session.commit()
+        """
+        Увеличить счётчик за день, вернуть новое значение — одним атомарным
+        INSERT ... ON CONFLICT (user_id, date) DO UPDATE SET count = count + 1 RETURNING count
+        """
+        stmt = self._insert(UsageDaily).values(user_id=user_id, date=date_str, count=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UsageDaily.user_id, UsageDaily.date],
+            set_={"count": func.coalesce(UsageDaily.count, 0) + 1},
+        ).returning(UsageDaily.count)
+        async with self._write_session() as session:
+            result = await session.execute(stmt)
+            count = result.scalar_one()
+            await self._commit(session)
             return count
 
+    async def upsert_daily_usage_batch(self, date_str: str, counts: Dict[int, int]) -> int:
+        """
+        Записать дневные счётчики из Redis (сверка): count = max(текущий, переданный),
+        чтобы запросы, учтённые в БД во время недоступности Redis, не терялись
+        """
+        if not counts:
+            return 0
+        stmt = self._insert(UsageDaily).values(
+            [{"user_id": uid, "date": date_str, "count": n} for uid, n in counts.items()]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UsageDaily.user_id, UsageDaily.date],
+            set_={
+                "count": case(
+                    (UsageDaily.count > stmt.excluded.count, UsageDaily.count),
+                    else_=stmt.excluded.count,
+                )
+            },
+        )
+        async with self._write_session() as session:
+            await session.execute(stmt)
+            await self._commit(session)
+        return len(counts)
+
     async def set_premium(self, user_id: int) -> None:
         """Установить премиум-подписку"""
-        async with self.async_session() as session:
+        async with self._write_session() as session:
             result = await session.execute(
                 select(Subscription).where(Subscription.user_id == user_id)
             )
@@ -365,11 +1168,12 @@ class Database:
                 sub.stars_paid_at = datetime.utcnow()
             else:
                 session.add(Subscription(user_id=user_id, tier="premium"))
-            await session.commit()
+            await self._commit(session)
+        await self._after_commit(self.profiles.invalidate, user_id)
 
     async def remove_premium(self, user_id: int) -> None:
         """Снять премиум-подписку"""
-        async with self.async_session() as session:
+        async with self._write_session() as session:
             result = await session.execute(
                 select(Subscription).where(Subscription.user_id == user_id)
             )
@@ -377,34 +1181,286 @@ class Database:
             if sub:
                 sub.tier = "free"
                 sub.stars_paid_at = None
-                await session.commit()
+                await self._commit(session)
+        await self._after_commit(self.profiles.invalidate, user_id)
 
     async def ban_user(self, telegram_id: int) -> None:
         """Забанить пользователя"""
-        async with self.async_session() as session:
+        async with self._write_session() as session:
             result = await session.execute(select(User).where(User.telegram_id == telegram_id))
             user = result.scalar_one_or_none()
             if user:
                 user.is_banned = True
-                await session.commit()
+                await self._commit(session)
+        await self._after_commit(self.profiles.invalidate, telegram_id)
 
     async def unban_user(self, telegram_id: int) -> None:
         """Разбанить пользователя"""
-        async with self.async_session() as session:
+        async with self._write_session() as session:
             result = await session.execute(select(User).where(User.telegram_id == telegram_id))
             user = result.scalar_one_or_none()
             if user:
                 user.is_banned = False
-                await session.commit()
+                await self._commit(session)
+        await self._after_commit(self.profiles.invalidate, telegram_id)
 
     async def is_banned(self, telegram_id: int) -> bool:
-        """Проверить, забанен ли пользователь"""
-        async with self.async_session() as session:
+        """Проверить, забанен ли пользователь (из кэша профиля)"""
+        return (await self.profiles.get(telegram_id)).is_banned
+
+    # ========== Аналитика (read-only пул) ==========
+
+    async def get_overview_totals(self) -> Dict[str, int]:
+        """Итоги для дашборда: пользователи, токены, изображения"""
+        async with self.read_only_session() as session:
+            users = (await session.execute(select(func.count(User.id)))).scalar() or 0
+            tokens, images = (
+                await session.execute(
+                    select(
+                        func.coalesce(func.sum(Stats.tokens_used), 0),
+                        func.coalesce(func.sum(Stats.images_generated), 0),
+                    )
+                )
+            ).one()
+            return {"users": int(users), "tokens": int(tokens), "images": int(images)}
+
+    async def get_daily_active(self, since: datetime) -> List[Tuple[str, int]]:
+        """DAU: [(YYYY-MM-DD, уникальных пользователей)] из daily_metrics начиная с since"""
+        rows = await self.get_daily_metrics(METRIC_DAU, since.strftime("%Y-%m-%d"))
+        return [(day, value) for day, _, value in rows]
+
+    async def get_active_users_count(
+        self, since: datetime, until: Optional[datetime] = None
+    ) -> int:
+        """
+        Уникальные пользователи с сообщениями в [since, until) — точный COUNT(DISTINCT) по
+        диапазону индекса created_at (пересчёт dau / mau без Redis, database.daily_metrics)
+        """
+        stmt = select(func.count(func.distinct(Message.user_id))).where(Message.created_at >= since)
+        if until is not None:
+            stmt = stmt.where(Message.created_at < until)
+        async with self.read_only_session() as session:
+            result = await session.execute(stmt)
+            return int(result.scalar() or 0)
+
+    async def get_token_usage(self, since: datetime) -> List[Tuple[str, int]]:
+        """Токены по дням (все модели): [(YYYY-MM-DD, токенов)] из daily_metrics"""
+        totals: Dict[str, int] = {}
+        for day, _, value in await self.get_daily_metrics(
+            METRIC_TOKENS, since.strftime("%Y-%m-%d")
+        ):
+            totals[day] = totals.get(day, 0) + value
+        return list(totals.items())
+
+    # ========== Дневные агрегаты (database.daily_metrics) ==========
+
+    async def increment_daily_metrics(self, counters: Dict[MetricKey, int]) -> None:
+        """Прибавить счётчики {(day, metric, dimension): n} — один INSERT ... ON CONFLICT"""
+        if not counters:
+            return
+        stmt = self._insert(DailyMetric).values(
+            [
+                {"day": day, "metric": metric, "dimension": dimension, "value": value}
+                for (day, metric, dimension), value in counters.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyMetric.metric, DailyMetric.day, DailyMetric.dimension],
+            set_={"value": DailyMetric.value + stmt.excluded.value},
+        )
+        async with self._write_session() as session:
+            await session.execute(stmt)
+            await self._commit(session)
+
+    async def set_daily_metrics(self, values: Dict[MetricKey, int]) -> None:
+        """Записать значения {(day, metric, dimension): n} поверх прежних (dau, mau)"""
+        if not values:
+            return
+        stmt = self._insert(DailyMetric).values(
+            [
+                {"day": day, "metric": metric, "dimension": dimension, "value": value}
+                for (day, metric, dimension), value in values.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyMetric.metric, DailyMetric.day, DailyMetric.dimension],
+            set_={"value": stmt.excluded.value},
+        )
+        async with self._write_session() as session:
+            await session.execute(stmt)
+            await self._commit(session)
+
+    async def get_daily_metrics(self, metric: str, since_day: str) -> List[Tuple[str, str, int]]:
+        """Ряд метрики начиная с since_day (YYYY-MM-DD): [(день, разрез, значение)] по дням"""
+        async with self.read_only_session() as session:
             result = await session.execute(
-                select(User.is_banned).where(User.telegram_id == telegram_id)
+                select(DailyMetric.day, DailyMetric.dimension, DailyMetric.value)
+                .where(DailyMetric.metric == metric, DailyMetric.day >= since_day)
+                .order_by(DailyMetric.day, DailyMetric.dimension)
             )
-            row = result.scalar_one_or_none()
-            return bool(row) if row is not None else False
+            return [(day, dimension, int(value)) for day, dimension, value in result.all()]
+
+    async def get_latest_daily_metric(self, metric: str) -> Optional[int]:
+        """Значение метрики за последний записанный день (mau) или None"""
+        async with self.read_only_session() as session:
+            result = await session.execute(
+                select(DailyMetric.value)
+                .where(DailyMetric.metric == metric)
+                .order_by(DailyMetric.day.desc())
+                .limit(1)
+            )
+            value = result.scalar()
+            return int(value) if value is not None else None
+
+    # ========== Рассылки (services.broadcast) ==========
+
+    async def create_broadcast(
+        self, text: str, admin_chat_id: int, total: int, status_message_id: Optional[int] = None
+    ) -> Broadcast:
+        """Новая рассылка в статусе running"""
+        async with self._write_session() as session:
+            broadcast = Broadcast(
+                text=text,
+                admin_chat_id=admin_chat_id,
+                status_message_id=status_message_id,
+                total=total,
+            )
+            session.add(broadcast)
+            await self._commit(session)
+            await session.refresh(broadcast)
+        return broadcast
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Broadcast]:
+        async with self._session() as session:
+            return await session.get(Broadcast, broadcast_id)
+
+    async def get_unfinished_broadcasts(self, status: str = "running") -> List[Broadcast]:
+        """
+        Незавершённые рассылки: running — продолжить после перезапуска, paused —
+        остановлены после сбоев, продолжаются по /broadcast resume
+        """
+        async with self._session() as session:
+            result = await session.execute(
+                select(Broadcast).where(Broadcast.status == status).order_by(Broadcast.id)
+            )
+            return list(result.scalars().all())
+
+    async def save_broadcast_progress(
+        self,
+        broadcast_id: int,
+        cursor: int,
+        sent: int,
+        blocked: int,
+        failed: int,
+        status: Optional[str] = None,
+    ) -> None:
+        """Чекпоинт рассылки: cursor — users.id последней пачки; status — завершение"""
+        values: Dict[str, Any] = {
+            "cursor": cursor,
+            "sent": sent,
+            "blocked": blocked,
+            "failed": failed,
+            "updated_at": datetime.utcnow(),
+        }
+        if status is not None:
+            values["status"] = status
+            values["finished_at"] = datetime.utcnow() if status != "running" else None
+        async with self._write_session() as session:
+            await session.execute(
+                update(Broadcast).where(Broadcast.id == broadcast_id).values(**values)
+            )
+            await self._commit(session)
+
+    async def set_broadcast_status(self, broadcast_id: int, status: str) -> None:
+        """Сменить статус рассылки (отмена админом)"""
+        async with self._write_session() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id)
+                .values(status=status, updated_at=datetime.utcnow(), finished_at=datetime.utcnow())
+            )
+            await self._commit(session)
+
+    async def set_users_bot_blocked(self, telegram_ids: List[int], blocked: bool = True) -> int:
+        """Отметить, что пользователи заблокировали бота (или сняли блокировку)"""
+        if not telegram_ids:
+            return 0
+        stmt = update(User).where(User.telegram_id.in_(telegram_ids))
+        if blocked:
+            stmt = stmt.values(bot_blocked_at=datetime.utcnow())
+        else:
+            stmt = stmt.where(User.bot_blocked_at.is_not(None)).values(bot_blocked_at=None)
+        async with self._write_session() as session:
+            result = await session.execute(stmt)
+            await self._commit(session)
+            return result.rowcount or 0
+
+    async def get_users_overview(self, limit: int = 200) -> List[Dict[str, Any]]:
+        """Последние пользователи со статистикой, баном и тарифом (таблица админки)"""
+        async with self.read_only_session() as session:
+            result = await session.execute(
+                select(
+                    User.telegram_id,
+                    User.first_name,
+                    User.username,
+                    User.created_at,
+                    func.coalesce(User.is_banned, False).label("is_banned"),
+                    func.coalesce(Subscription.tier, "free").label("tier"),
+                    func.coalesce(Stats.requests_count, 0).label("requests"),
+                    func.coalesce(Stats.tokens_used, 0).label("tokens"),
+                    func.coalesce(Stats.images_generated, 0).label("images"),
+                )
+                .outerjoin(Stats, Stats.user_id == User.telegram_id)
+                .outerjoin(Subscription, Subscription.user_id == User.telegram_id)
+                .order_by(User.created_at.desc())
+                .limit(limit)
+            )
+            return [dict(row._mapping) for row in result.all()]
+
+    # ========== Профиль (кэш) ==========
+
+    async def get_user_profile(self, telegram_id: int) -> UserProfile:
+        """Бан, премиум, персонаж и модели пользователя — из кэша, без запроса в БД"""
+        return await self.profiles.get(telegram_id)
+
+    async def _load_user_profile(self, telegram_id: int) -> UserProfile:
+        """
+        Загрузка профиля для кэша: users + subscriptions одним запросом. Всегда отдельная
+        сессия, а не unit of work: в кэш попадают только закоммиченные данные.
+        """
+        async with self._reader() as session:
+            row = (
+                await session.execute(
+                    select(
+                        User.is_banned,
+                        User.persona,
+                        User.model,
+                        User.image_model,
+                        User.language,
+                        Subscription.tier,
+                    )
+                    .outerjoin(Subscription, Subscription.user_id == User.telegram_id)
+                    .where(User.telegram_id == telegram_id)
+                )
+            ).first()
+            if row is None:
+                # Премиум мог быть выдан до первого /start
+                tier = (
+                    await session.execute(
+                        select(Subscription.tier).where(Subscription.user_id == telegram_id)
+                    )
+                ).scalar_one_or_none()
+                return UserProfile(telegram_id=telegram_id, is_premium=tier == "premium")
+        return UserProfile(
+            telegram_id=telegram_id,
+            exists=True,
+            is_banned=bool(row.is_banned),
+            is_premium=row.tier == "premium",
+            persona=row.persona or "assistant",
+            model=row.model or "auto",
+            image_model=row.image_model or "auto",
+            language=row.language or "ru",
+        )
 
 
 # Глобальный экземпляр базы данных
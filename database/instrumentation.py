@@ -0,0 +1,209 @@
+"""
+Наблюдаемость слоя БД: метрики Prometheus (utils.metrics, эндпоинт /metrics) и лог
+медленных запросов.
+
+- instrument_methods(Database): каждый публичный метод — гистограмма db_call_seconds
+  {method, outcome}; у асинхронных генераторов (iter_telegram_ids) — каждая пачка.
+- timed_pool_class(name): пул, который меряет ожидание соединения
+  (db_pool_checkout_wait_seconds) — у событий пула SQLAlchemy нет «начала ожидания».
+- instrument_engine(engine, name): по событиям checkout/checkin — размер, занятые и
+  overflow пула; по событиям курсора — запросы дольше DB_SLOW_QUERY_MS в лог
+  db_slow_query (SQL и форма параметров без значений) и db_slow_queries_total.
+
+Без prometheus_client или utils (админка без .env) метрики молча отключаются.
+"""
+
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+import structlog
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = structlog.get_logger(__name__)
+
+DB_SLOW_QUERY_MS = 500
+SLOW_QUERY_SQL_MAX_CHARS = 1000
+NOT_INSTRUMENTED = {"init", "close"}
+
+# Метод Database, выполняющийся в текущей задаче: подпись медленных запросов
+_current_method: ContextVar[str] = ContextVar("db_current_method", default="other")
+
+_metrics: Any = None
+_metrics_loaded = False
+
+
+def _get_metrics() -> Any:
+    """utils.metrics (один раз) или None, если Prometheus / config недоступны"""
+    global _metrics, _metrics_loaded
+    if not _metrics_loaded:
+        _metrics_loaded = True
+        try:
+            from utils import metrics
+
+            _metrics = metrics if metrics.PROMETHEUS_AVAILABLE else None
+        except (Exception, SystemExit):
+            _metrics = None
+    return _metrics
+
+
+def _get_slow_query_ms() -> int:
+    try:
+        import config
+
+        return int(getattr(config.settings, "DB_SLOW_QUERY_MS", DB_SLOW_QUERY_MS))
+    except (Exception, SystemExit):
+        return DB_SLOW_QUERY_MS
+
+
+def _observe_call(method: str, outcome: str, started: float) -> None:
+    metrics = _get_metrics()
+    if metrics is not None:
+        metrics.record_db_call(method, outcome, time.perf_counter() - started)
+
+
+def _wrap_coroutine(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = _current_method.set(name)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await func(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            _current_method.reset(token)
+            _observe_call(name, outcome, started)
+
+    return wrapper
+
+
+def _wrap_async_generator(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        generator = func(*args, **kwargs)
+        try:
+            while True:
+                # Меряется только выборка очередной пачки, не обработка у вызывающего
+                token = _current_method.set(name)
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    item = await generator.__anext__()
+                    outcome = "ok"
+                except StopAsyncIteration:
+                    outcome = "ok"
+                    return
+                finally:
+                    _current_method.reset(token)
+                    _observe_call(name, outcome, started)
+                yield item
+        finally:
+            await generator.aclose()
+
+    return wrapper
+
+
+def instrument_methods(cls: type) -> type:
+    """Обернуть публичные async-методы класса метриками (кроме NOT_INSTRUMENTED)"""
+    for name, member in list(vars(cls).items()):
+        if name.startswith("_") or name in NOT_INSTRUMENTED:
+            continue
+        if inspect.iscoroutinefunction(member):
+            setattr(cls, name, _wrap_coroutine(name, member))
+        elif inspect.isasyncgenfunction(member):
+            setattr(cls, name, _wrap_async_generator(name, member))
+    return cls
+
+
+def timed_pool_class(pool_name: str) -> type:
+    """Класс пула (poolclass) с замером ожидания соединения; имя переживает recreate()"""
+
+    class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+        metrics_name = pool_name
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                metrics = _get_metrics()
+                if metrics is not None:
+                    metrics.record_db_pool_wait(self.metrics_name, time.perf_counter() - started)
+
+    return TimedAsyncQueuePool
+
+
+def _parameters_shape(parameters: Any, executemany: bool) -> str:
+    """Форма параметров без значений: типы по позициям / ключам, число строк executemany"""
+
+    def shape(params: Any) -> str:
+        if isinstance(params, dict):
+            return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+        if isinstance(params, (list, tuple)):
+            return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+        return type(params).__name__
+
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = shape(parameters[0]) if parameters else "()"
+        return f"{len(parameters)} x {first}"
+    return shape(parameters)
+
+
+def instrument_engine(
+    engine: AsyncEngine, pool_name: str, slow_query_ms: Optional[int] = None
+) -> None:
+    """Метрики пула и лог медленных запросов для движка"""
+    sync_engine = engine.sync_engine
+    threshold = (_get_slow_query_ms() if slow_query_ms is None else slow_query_ms) / 1000
+
+    def _pool_state(returning: int) -> None:
+        pool = sync_engine.pool
+        metrics = _get_metrics()
+        if metrics is None or not isinstance(pool, QueuePool):
+            return
+        checked_out = max(pool.checkedout() - returning, 0)
+        metrics.set_db_pool_state(pool_name, pool.size(), checked_out, pool.overflow())
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, record, proxy):
+        _pool_state(0)
+
+    @event.listens_for(sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, record):
+        # Событие приходит до возврата соединения в очередь пула
+        _pool_state(1)
+
+    if threshold <= 0:
+        return
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < threshold:
+            return
+        method = _current_method.get()
+        logger.warning(
+            "db_slow_query",
+            method=method,
+            pool=pool_name,
+            duration_ms=round(elapsed * 1000, 1),
+            statement=" ".join(statement.split())[:SLOW_QUERY_SQL_MAX_CHARS],
+            parameters=_parameters_shape(parameters, executemany),
+        )
+        metrics = _get_metrics()
+        if metrics is not None:
+            metrics.record_db_slow_query(method)
@@ -3,13 +3,45 @@
 """
 
 from datetime import datetime
-
-from sqlalchemy import JSON, Boolean, Column, DateTime, Integer, String, Text
+from typing import Optional
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
+
+from .compressed_text import TextValue, decode_text, encode_text
 
 Base = declarative_base()
 
 
+class CompressedText(TypeDecorator):
+    """Text-колонка со сжатием больших значений (BLOB / bytea, database.compressed_text)"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return encode_text(value)
+
+    def process_result_value(self, value: Optional[TextValue], dialect) -> Optional[str]:
+        if value is None:
+            return None
+        return decode_text(value)
+
+
 class User(Base):
     """Модель пользователя"""
 
@@ -25,6 +57,8 @@ class User(Base):
     image_model = Column(String(100), default="auto")
     age = Column(Integer, nullable=True)  # пример: добавлено через миграцию 002
     is_banned = Column(Boolean, default=False, nullable=False)
+    # Пользователь заблокировал бота (ошибка Forbidden при рассылке / my_chat_member) — рассылки пропускают
+    bot_blocked_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -37,9 +71,36 @@ class Message(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False, index=True)
     role = Column(String(20), nullable=False)  # 'user' или 'assistant'
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)  # длинные ответы сжаты (миграция 011)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
+    # История пользователя: WHERE user_id = ? ORDER BY created_at DESC, id DESC — без сортировки
+    __table_args__ = (Index("ix_messages_user_created", user_id, created_at.desc(), id.desc()),)
+
+
+class MessageArchive(Base):
+    """Архив старых сообщений: пачка сообщений пользователя одним сжатым блобом (database.retention)"""
+
+    __tablename__ = "messages_archive"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    first_message_at = Column(DateTime, nullable=False)
+    last_message_at = Column(DateTime, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # zlib(JSON [{id, role, content, created_at}])
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobState(Base):
+    """Позиция периодической задачи между запусками (курсор ретеншна database.retention)"""
+
+    __tablename__ = "job_state"
+
+    name = Column(String(64), primary_key=True)
+    cursor = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 
 class Stats(Base):
     """Модель статистики пользователя"""
@@ -51,11 +112,86 @@ class Stats(Base):
     requests_count = Column(Integer, default=0)
     tokens_used = Column(Integer, default=0)
     images_generated = Column(Integer, default=0)
+    # Устарело: счётчики команд — в таблице command_usage (CommandUsage), колонка не пишется
     commands_used = Column(JSON, default=dict)  # {"start": 5, "help": 2}
     start_date = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class CommandUsage(Base):
+    """Счётчик команд пользователя за день (вместо JSON Stats.commands_used)"""
+
+    __tablename__ = "command_usage"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    command = Column(String(100), nullable=False)
+    day = Column(String(10), nullable=False)  # YYYY-MM-DD
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Цель для INSERT ... ON CONFLICT и выборка команд пользователя
+        Index("uq_command_usage_user_command_day", "user_id", "command", "day", unique=True),
+        # Агрегаты по всем пользователям за период (админка)
+        Index("ix_command_usage_day_command", "day", "command"),
+    )
+
+
+class DailyMetric(Base):
+    """Дневной агрегат для дашбордов (database.daily_metrics): метрика с разрезом за день"""
+
+    __tablename__ = "daily_metrics"
+
+    id = Column(Integer, primary_key=True)
+    day = Column(String(10), nullable=False)  # YYYY-MM-DD (UTC)
+    metric = Column(String(50), nullable=False)  # dau, mau, messages, tokens, ...
+    dimension = Column(String(100), nullable=False, default="")  # модель, команда, роль
+    value = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        # Цель для INSERT ... ON CONFLICT и выборка ряда метрики за период (по порядку дней)
+        Index("uq_daily_metrics_metric_day_dimension", "metric", "day", "dimension", unique=True),
+    )
+
+
+class Broadcast(Base):
+    """Рассылка админа (services.broadcast): текст, прогресс и чекпоинт для продолжения"""
+
+    __tablename__ = "broadcasts"
+
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    status = Column(
+        String(20), nullable=False, default="running"
+    )  # running, paused, done, cancelled
+    admin_chat_id = Column(BigInteger, nullable=False)
+    status_message_id = Column(BigInteger, nullable=True)  # сообщение с живым прогрессом
+    cursor = Column(Integer, nullable=False, default=0)  # users.id последней отправленной пачки
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Незавершённые рассылки для продолжения после перезапуска
+    __table_args__ = (Index("ix_broadcasts_status", "status"),)
+
+
+class DataMigrationState(Base):
+    """Контрольная точка migrate_data.py: пишется в транзакции пачки, продолжение — ровно с неё"""
+
+    __tablename__ = "data_migration_state"
+
+    source = Column(String(500), primary_key=True)  # абсолютный путь к JSON-файлу
+    file_size = Column(BigInteger, nullable=False)
+    sections_done = Column(JSON, nullable=False, default=list)
+    section = Column(String(50), nullable=True)  # текущий раздел и число его записей
+    entries = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
 class Favorite(Base):
     """Модель избранного"""
 
@@ -63,11 +199,13 @@ class Favorite(Base):
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False, index=True)
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)
     content_type = Column(String(50), default="text")  # 'text' или 'image'
     tags = Column(JSON, default=list)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_favorites_user_created", user_id, created_at.desc()),)
+
 
 class Subscription(Base):
     """Подписка пользователя (Telegram Stars)"""
@@ -91,7 +229,12 @@ class UsageDaily(Base):
     user_id = Column(Integer, nullable=False, index=True)
     date = Column(String(10), nullable=False, index=True)  # YYYY-MM-DD
     count = Column(Integer, default=0)
-    __table_args__ = ({"sqlite_autoincrement": True},)
+
+    # Один счётчик на пользователя в день — цель для INSERT ... ON CONFLICT
+    __table_args__ = (
+        Index("uq_usage_daily_user_date", "user_id", "date", unique=True),
+        {"sqlite_autoincrement": True},
+    )
 
 
 class UserFact(Base):
@@ -105,6 +248,13 @@ class UserFact(Base):
     fact_value = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Один факт каждого типа на пользователя — цель для INSERT ... ON CONFLICT
+        Index("uq_user_facts_user_type", "user_id", "fact_type", unique=True),
+        # Последние факты пользователя без сортировки
+        Index("ix_user_facts_user_created", user_id, created_at.desc()),
+    )
+
 
 class Achievement(Base):
     """Модель достижений пользователя"""
@@ -0,0 +1,75 @@
+"""
+Горячий кэш профиля пользователя (бан, премиум, персонаж, модели) перед database.db:
+L1 — LRU в памяти процесса с коротким TTL, L2 — Redis (если доступен, общий для реплик).
+При записи профиль инвалидируется: DEL ключа в Redis + PUBLISH в канал, подписчики
+всех реплик сбрасывают L1 — бан или премиум видны везде в течение секунды. Механика
+кэша — database.redis_cache.InvalidatingCache.
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Optional
+
+from .redis_cache import InvalidatingCache
+
+PROFILE_CACHE_TTL_SEC = 60.0  # L1 и L2: страховка, если инвалидация не дошла
+PROFILE_CACHE_MAX_USERS = 50000  # LRU-лимит L1
+PROFILE_REDIS_PREFIX = "nero:profile:"
+PROFILE_INVALIDATE_CHANNEL = "nero:profile:invalidate"
+PROFILE_LISTENER_RETRY_SEC = 5.0
+
+
+@dataclass(frozen=True)
+class UserProfile:
+    """Поля пользователя, нужные на каждом апдейте (без обращения к БД)"""
+
+    telegram_id: int
+    exists: bool = False
+    is_banned: bool = False
+    is_premium: bool = False
+    persona: str = "assistant"
+    model: str = "auto"
+    image_model: str = "auto"
+    language: str = "ru"
+
+
+class UserProfileCache(InvalidatingCache[UserProfile]):
+    """LRU + TTL в процессе, опционально Redis (L2); loader читает профиль из БД"""
+
+    def __init__(
+        self,
+        loader: Callable[[int], Awaitable[UserProfile]],
+        ttl_sec: float = PROFILE_CACHE_TTL_SEC,
+        max_users: int = PROFILE_CACHE_MAX_USERS,
+        use_redis: bool = True,
+    ) -> None:
+        super().__init__(
+            "profile_cache",
+            loader,
+            PROFILE_INVALIDATE_CHANNEL,
+            ttl_sec,
+            max_users,
+            redis_prefix=PROFILE_REDIS_PREFIX,
+            use_redis=use_redis,
+            listener_retry_sec=PROFILE_LISTENER_RETRY_SEC,
+        )
+
+    @staticmethod
+    def redis_key(telegram_id: int) -> str:
+        return f"{PROFILE_REDIS_PREFIX}{telegram_id}"
+
+    def encode(self, value: UserProfile) -> str:
+        return json.dumps(asdict(value))
+
+    def decode(self, raw: Optional[str]) -> Optional[UserProfile]:
+        return self.parse(raw)
+
+    @staticmethod
+    def parse(raw: Optional[str]) -> Optional[UserProfile]:
+        """Профиль из JSON-значения Redis (None — нет или битое значение)"""
+        if not raw:
+            return None
+        try:
+            return UserProfile(**json.loads(raw))
+        except (TypeError, ValueError):
+            return None
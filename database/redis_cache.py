@@ -0,0 +1,197 @@
+"""
+Redis для кэшей и счётчиков процесса.
+
+- get_redis() — общий клиент (utils.redis_client) или None: Redis недоступен или config
+  не загружается (скрипты и тесты без токенов).
+- InvalidatingCache — LRU + TTL в памяти процесса (L1), опционально L2 в Redis. При
+  записи ключ инвалидируется: DEL в L2 + PUBLISH в канал, подписчики всех процессов
+  сбрасывают свой L1. Загрузка, во время которой ключ сбросили, не кэшируется.
+  Пользователи: database.profile_cache (профили), services.memory (индекс фактов).
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+CACHE_LISTENER_RETRY_SEC = 5.0
+
+V = TypeVar("V")
+
+
+async def get_redis():
+    """Общий async Redis-клиент или None"""
+    try:
+        from utils.redis_client import get_redis as connect
+
+        return await connect()
+    except (Exception, SystemExit):  # config без токенов — работаем без Redis
+        return None
+
+
+class InvalidatingCache(Generic[V]):
+    """
+    Значения по int-ключу: loader читает их из БД. L2 в Redis включается redis_prefix
+    (значения сериализуют encode / decode наследника). name — префикс событий лога.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[int], Awaitable[V]],
+        channel: str,
+        ttl_sec: float,
+        max_entries: int,
+        redis_prefix: Optional[str] = None,
+        use_redis: bool = True,
+        listener_retry_sec: float = CACHE_LISTENER_RETRY_SEC,
+    ) -> None:
+        self.name = name
+        self._loader = loader
+        self.channel = channel
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.redis_prefix = redis_prefix
+        self.use_redis = use_redis
+        self.listener_retry_sec = listener_retry_sec
+        self._entries: "OrderedDict[int, Tuple[float, V]]" = OrderedDict()
+        # Загрузки в процессе: ключ → [число загрузок, число инвалидаций за время
+        # загрузки]; загрузка, во время которой ключ инвалидировали, не кэшируется.
+        # Запись есть только пока идёт загрузка — словарь не растёт с числом ключей
+        self._loading: Dict[int, List[int]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: int) -> V:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[0] < self.ttl_sec:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        loading = self._loading.setdefault(key, [0, 0])
+        loading[0] += 1
+        generation = loading[1]
+        try:
+            value = await self._fetch(key, loading, generation)
+        finally:
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[key]
+
+        if loading[1] == generation:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    async def _fetch(self, key: int, loading: List[int], generation: int) -> V:
+        """Значение из L2 или loader; в L2 пишется, только если инвалидации не было"""
+        redis = await get_redis() if self.use_redis and self.redis_prefix else None
+        if redis is not None:
+            try:
+                value = self.decode(await redis.get(self.redis_key(key)))
+                if value is not None:
+                    return value
+            except Exception as e:
+                logger.debug(f"{self.name}_redis_error", error=str(e))
+        value = await self._loader(key)
+        if redis is not None and loading[1] == generation:
+            try:
+                await redis.set(self.redis_key(key), self.encode(value), ex=int(self.ttl_sec))
+            except Exception as e:
+                logger.debug(f"{self.name}_redis_error", error=str(e))
+        return value
+
+    def peek(self, key: int) -> Optional[V]:
+        """Значение из L1 без обращения к Redis и БД (None — нет или устарело)"""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl_sec:
+            return None
+        return entry[1]
+
+    def redis_key(self, key: int) -> str:
+        return f"{self.redis_prefix}{key}"
+
+    def encode(self, value: V) -> str:
+        raise NotImplementedError
+
+    def decode(self, raw: Optional[str]) -> Optional[V]:
+        """Значение из Redis (None — нет или битое)"""
+        raise NotImplementedError
+
+    def _drop_local(self, key: int) -> None:
+        self._entries.pop(key, None)
+        loading = self._loading.get(key)
+        if loading is not None:
+            loading[1] += 1
+
+    async def invalidate(self, key: int) -> None:
+        """Сбросить ключ во всех уровнях и оповестить другие процессы"""
+        self._drop_local(key)
+        redis = await get_redis() if self.use_redis else None
+        if redis is None:
+            return
+        try:
+            if self.redis_prefix:
+                await redis.delete(self.redis_key(key))
+            await redis.publish(self.channel, str(key))
+        except Exception as e:
+            logger.warning(f"{self.name}_invalidate_failed", key=key, error=str(e))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        for loading in self._loading.values():
+            loading[1] += 1
+
+    async def start(self) -> None:
+        """Подписка на инвалидации других процессов (если Redis доступен)"""
+        if not self.use_redis:
+            return
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self) -> None:
+        while True:
+            redis = await get_redis()
+            if redis is None:
+                await asyncio.sleep(self.listener_retry_sec)
+                continue
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Пока подписки не было, сообщения могли потеряться — L1 мог устареть
+                self.clear()
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self._drop_local(int(message["data"]))
+                    except (TypeError, ValueError):
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.name}_listener_error", error=str(e))
+                await asyncio.sleep(self.listener_retry_sec)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
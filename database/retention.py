@@ -0,0 +1,351 @@
+"""
+Ретеншн истории диалогов: в messages остаются последние MESSAGE_RETENTION_KEEP сообщений
+каждого пользователя (бот читает 10–20), остальное пачками переносится в messages_archive
+одним zlib-сжатым JSON-блобом на пачку. На PostgreSQL messages разбита по месяцам
+(миграция 010): партиции создаются заранее, а старше MESSAGE_PARTITION_RETENTION_MONTHS
+отсоединяются и удаляются (копия в архив — MESSAGE_PARTITION_ARCHIVE). Перебор
+пользователей продолжается с позиции прошлого запуска (job_state). Запуск — периодическая задача job-queue (main).
+На SQLite пачки пишутся через SQLiteWriter (как все записи процесса), кандидаты читаются
+пулом читателей — единственное соединение писателя ретеншн не занимает.
+"""
+
+import asyncio
+import json
+import re
+import time
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import structlog
+from sqlalchemy import delete, insert, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import JobState, Message, MessageArchive
+
+logger = structlog.get_logger(__name__)
+
+MAX_BATCHES_PER_RUN = 100  # за один запуск — не больше batch_size * 100 строк
+PARTITIONS_AHEAD = 2  # сколько будущих месячных партиций держать созданными
+OVERFLOW_CURSOR_JOB = "message_retention"  # job_state: user_id, с которого продолжить
+ARCHIVE_COMPRESS_LEVEL = 6
+
+_PARTITION_RE = re.compile(r"^messages_p(\d{4})_(\d{2})$")
+
+
+def pack_messages(rows: Sequence[Message]) -> bytes:
+    """Пачка сообщений → zlib(JSON)"""
+    data = [
+        {
+            "id": r.id,
+            "role": r.role,
+            "content": r.content,
+            "created_at": r.created_at.isoformat() if r.created_at else None,
+        }
+        for r in rows
+    ]
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, ARCHIVE_COMPRESS_LEVEL)
+
+
+def unpack_messages(payload: bytes) -> List[Dict[str, Any]]:
+    """Обратное к pack_messages (для выгрузки архива)"""
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def _add_months(year: int, month: int, n: int) -> Tuple[int, int]:
+    index = year * 12 + (month - 1) + n
+    return index // 12, index % 12 + 1
+
+
+def partition_name(year: int, month: int) -> str:
+    return f"messages_p{year:04d}_{month:02d}"
+
+
+def partition_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    """[начало месяца, начало следующего)"""
+    ny, nm = _add_months(year, month, 1)
+    return datetime(year, month, 1), datetime(ny, nm, 1)
+
+
+@asynccontextmanager
+async def _read_session(database) -> AsyncIterator[AsyncSession]:
+    """
+    Чтение кандидатов: на SQLite — пул читателей (WAL), не единственное соединение
+    писателя; иначе — основной пул (реплика может отставать и вернуть уже архивированное)
+    """
+    factory = database.read_session if database.writer is not None else database.async_session
+    async with factory() as session:
+        yield session
+
+
+@asynccontextmanager
+async def _write_session(database) -> AsyncIterator[AsyncSession]:
+    """Запись пачки: на SQLite — блок SQLiteWriter (его транзакция и COMMIT), иначе — своя"""
+    if database.writer is not None:
+        async with database.writer.session() as session:
+            yield session
+    else:
+        async with database.async_session() as session:
+            yield session
+            await session.commit()
+
+
+async def _select_rows(database, stmt) -> List[Message]:
+    async with _read_session(database) as session:
+        return list((await session.execute(stmt)).scalars().all())
+
+
+def _archive_values(rows: Sequence[Message]) -> List[Dict[str, Any]]:
+    """Строки архива для пачки сообщений: по блобу на пользователя"""
+    by_user: Dict[int, List[Message]] = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row)
+    now = datetime.utcnow()
+    values = []
+    for user_id, items in by_user.items():
+        times = [r.created_at for r in items if r.created_at] or [now]
+        values.append(
+            {
+                "user_id": user_id,
+                "first_message_at": min(times),
+                "last_message_at": max(times),
+                "message_count": len(items),
+                "payload": pack_messages(items),
+                "archived_at": now,
+            }
+        )
+    return values
+
+
+async def _archive_rows(session, rows: Sequence[Message]) -> int:
+    """Записать строки в архив (по блобу на пользователя) и удалить их из messages"""
+    await session.execute(insert(MessageArchive), _archive_values(rows))
+    await session.execute(delete(Message).where(Message.id.in_([r.id for r in rows])))
+    return len(rows)
+
+
+async def _load_cursor(database) -> int:
+    async with _read_session(database) as session:
+        result = await session.execute(
+            select(JobState.cursor).where(JobState.name == OVERFLOW_CURSOR_JOB)
+        )
+        return result.scalar() or 0
+
+
+async def _save_cursor(database, cursor: int) -> None:
+    values = {"cursor": cursor, "updated_at": datetime.utcnow()}
+    stmt = database._insert(JobState).values(name=OVERFLOW_CURSOR_JOB, **values)
+    stmt = stmt.on_conflict_do_update(index_elements=[JobState.name], set_=values)
+    async with _write_session(database) as session:
+        await session.execute(stmt)
+
+
+async def _next_user(session, after: int) -> Optional[int]:
+    """Следующий user_id с сообщениями (keyset по индексу user_id, без GROUP BY по таблице)"""
+    result = await session.execute(
+        select(Message.user_id).where(Message.user_id > after).order_by(Message.user_id).limit(1)
+    )
+    return result.scalar()
+
+
+async def _overflow_cutoff(session, user_id: int, keep_last: int):
+    """
+    Самое новое из «лишних» сообщений пользователя — (created_at, id) keep_last-го с конца
+    по индексу (user_id, created_at DESC, id DESC); None — лишних нет
+    """
+    result = await session.execute(
+        select(Message.created_at, Message.id)
+        .where(Message.user_id == user_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .offset(keep_last)
+        .limit(1)
+    )
+    return result.first()
+
+
+async def archive_overflow(
+    database, keep_last: int, batch_size: int, max_batches: int = MAX_BATCHES_PER_RUN
+) -> int:
+    """
+    Перенести в архив всё, что старше keep_last последних сообщений каждого пользователя.
+    Пользователи перебираются по индексу user_id, у каждого проверяется только строка
+    на позиции keep_last — стоимость не зависит от объёма всей истории. Запуск,
+    упёршийся в max_batches, сохраняет позицию в job_state: следующий продолжает с
+    недоархивированного пользователя, а с начала таблицы — только после её конца.
+    """
+    if keep_last <= 0:
+        return 0
+    moved = batches = 0
+    start = after = await _load_cursor(database)
+    while batches < max_batches:
+        async with _read_session(database) as session:
+            user_id = await _next_user(session, after)
+        if user_id is None:
+            after = 0  # дошли до конца — следующий запуск с начала
+            break
+        after = user_id - 1  # пока пользователь не пройден до конца, продолжать с него
+        while batches < max_batches:
+            async with _read_session(database) as session:
+                cutoff = await _overflow_cutoff(session, user_id, keep_last)
+            if cutoff is None:
+                break
+            rows = await _select_rows(
+                database,
+                select(Message)
+                .where(
+                    Message.user_id == user_id,
+                    tuple_(Message.created_at, Message.id) <= tuple_(cutoff.created_at, cutoff.id),
+                )
+                .order_by(Message.created_at, Message.id)
+                .limit(batch_size),
+            )
+            if not rows:
+                break
+            async with _write_session(database) as session:
+                moved += await _archive_rows(session, rows)
+            batches += 1
+            await asyncio.sleep(0)  # не занимать event loop надолго
+        else:
+            break
+        after = user_id
+        await asyncio.sleep(0)
+    if after != start:
+        await _save_cursor(database, after)
+    if batches >= max_batches:
+        logger.info("message_retention_batch_limit", batches=batches, moved=moved, cursor=after)
+    return moved
+
+
+# ========== PostgreSQL: месячные партиции messages ==========
+
+
+async def is_partitioned(database) -> bool:
+    """messages — партиционированная таблица PostgreSQL (после миграции 010)"""
+    if database.engine is None or database.engine.dialect.name != "postgresql":
+        return False
+    async with database.engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('messages')")
+        )
+        return result.scalar() == "p"
+
+
+async def list_partitions(database) -> List[Tuple[str, int, int]]:
+    """Месячные партиции messages: [(имя, год, месяц)] по возрастанию"""
+    async with database.engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass('messages')"
+            )
+        )
+        names = [row[0] for row in result.all()]
+    parts = []
+    for name in names:
+        match = _PARTITION_RE.match(name)
+        if match:
+            parts.append((name, int(match.group(1)), int(match.group(2))))
+    return sorted(parts, key=lambda p: (p[1], p[2]))
+
+
+async def ensure_partitions(database, now: datetime, ahead: int = PARTITIONS_AHEAD) -> int:
+    """Создать партиции текущего и ahead следующих месяцев; вернуть число созданных"""
+    existing = {name for name, _, _ in await list_partitions(database)}
+    created = 0
+    for i in range(ahead + 1):
+        year, month = _add_months(now.year, now.month, i)
+        name = partition_name(year, month)
+        if name in existing:
+            continue
+        start, end = partition_bounds(year, month)
+        try:
+            async with database.engine.begin() as conn:
+                await conn.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages "
+                        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+                    )
+                )
+            created += 1
+        except Exception as e:
+            # Например, в DEFAULT-партиции уже есть строки этого месяца
+            logger.warning("message_partition_create_failed", partition=name, error=str(e))
+    return created
+
+
+async def archive_partition(conn, start: datetime, end: datetime, batch_size: int) -> int:
+    """
+    Скопировать сообщения [start, end) в архив, не удаляя их: партиция следом удаляется
+    целиком. Keyset по (user_id, created_at, id) — пачки читаются по индексу истории
+    """
+    archived = 0
+    columns = (Message.id, Message.user_id, Message.role, Message.content, Message.created_at)
+    key = tuple_(Message.user_id, Message.created_at, Message.id)
+    last = None
+    while True:
+        stmt = select(*columns).where(Message.created_at >= start, Message.created_at < end)
+        if last is not None:
+            stmt = stmt.where(key > tuple_(*last))
+        rows = (
+            await conn.execute(
+                stmt.order_by(Message.user_id, Message.created_at, Message.id).limit(batch_size)
+            )
+        ).all()
+        if not rows:
+            return archived
+        await conn.execute(insert(MessageArchive), _archive_values(rows))
+        archived += len(rows)
+        last = (rows[-1].user_id, rows[-1].created_at, rows[-1].id)
+        await asyncio.sleep(0)
+
+
+async def drop_expired_partitions(
+    database, retention_months: int, batch_size: int, now: datetime, archive: bool = True
+) -> Tuple[int, int]:
+    """
+    Удалить партиции старше retention_months (с archive — сначала скопировав их в архив);
+    вернуть (строк, партиций). Партиция обрабатывается одной транзакцией: сбой
+    откатывает и архив, и DETACH — повтор не задвоит блобы
+    """
+    cutoff = _add_months(now.year, now.month, -retention_months)
+    archived = dropped = 0
+    for name, year, month in await list_partitions(database):
+        if (year, month) >= cutoff:
+            break
+        async with database.engine.begin() as conn:
+            if archive:
+                archived += await archive_partition(
+                    conn, *partition_bounds(year, month), batch_size
+                )
+            await conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+            await conn.execute(text(f"DROP TABLE {name}"))
+        dropped += 1
+        logger.info("message_partition_dropped", partition=name, archived=archive)
+    return archived, dropped
+
+
+async def run_retention(
+    database,
+    keep_last: int,
+    batch_size: int,
+    partition_retention_months: int = 0,
+    archive_partitions: bool = True,
+) -> Dict[str, int]:
+    """Один проход ретеншна: архивация лишней истории + обслуживание партиций"""
+    t0 = time.perf_counter()
+    now = datetime.utcnow()
+    stats = {"archived": await archive_overflow(database, keep_last, batch_size)}
+    if await is_partitioned(database):
+        stats["partitions_created"] = await ensure_partitions(database, now)
+        if partition_retention_months > 0:
+            rows, parts = await drop_expired_partitions(
+                database, partition_retention_months, batch_size, now, archive_partitions
+            )
+            stats["partition_rows_archived"] = rows
+            stats["partitions_dropped"] = parts
+    logger.info(
+        "message_retention_done", duration_ms=round((time.perf_counter() - t0) * 1000), **stats
+    )
+    return stats
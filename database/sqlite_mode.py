@@ -0,0 +1,255 @@
+"""
+Продакшен-режим SQLite (небольшие инсталляции без PostgreSQL).
+
+- WAL + synchronous=NORMAL, увеличенные cache_size / mmap_size, busy_timeout.
+- Один писатель: все записи процесса идут через SQLiteWriter — фоновую задачу с
+  единственным соединением, которая выполняет накопившиеся блоки записи в одной
+  транзакции (BEGIN IMMEDIATE … COMMIT, каждый блок — в своём SAVEPOINT). Вместо
+  «database is locked» при всплесках — очередь в памяти и один fsync на пачку.
+- Чтение — небольшой пул соединений (WAL: читатели не ждут писателя), query_only.
+
+Подключается в Database.init для файловых sqlite-URL (sqlite_tuned=True).
+Бенчмарк: python -m benchmarks.sqlite_mode
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Optional
+
+import structlog
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+logger = structlog.get_logger(__name__)
+
+SQLITE_BUSY_TIMEOUT_MS = 5000  # ожидание чужой блокировки (админка, миграции, бэкап)
+SQLITE_CACHE_SIZE_KIB = 65536  # cache_size = -N → N КиБ страничного кэша на соединение
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_READER_POOL_SIZE = 4
+WRITER_BATCH_MAX = 200  # блоков записи в одной транзакции
+WRITER_QUEUE_MAXSIZE = 10000  # при заполнении вызывающие ждут (backpressure)
+
+# Сессия блока записи, который сейчас выполняется в текущей задаче: вложенные вызовы
+# методов Database (чтение и запись) работают в ней же, а не встают в очередь заново
+_writer_slot: ContextVar[Optional[AsyncSession]] = ContextVar("sqlite_writer_slot", default=None)
+
+
+def current_writer_session() -> Optional[AsyncSession]:
+    """Сессия блока записи SQLiteWriter, выполняющегося в текущей задаче (или None)"""
+    return _writer_slot.get()
+
+
+def is_file_sqlite(url: str) -> bool:
+    """Файловая SQLite (для :memory: отдельные пулы писателя и читателей невозможны)"""
+    if not url.startswith("sqlite"):
+        return False
+    path = url.split(":///", 1)[1] if ":///" in url else ""
+    return bool(path) and ":memory:" not in path and "mode=memory" not in path
+
+
+def _apply_pragmas(dbapi_connection, query_only: bool) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    if query_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def create_writer_engine(url: str) -> AsyncEngine:
+    """Единственное пишущее соединение; транзакции — BEGIN IMMEDIATE (блокировка сразу)"""
+    engine = create_async_engine(
+        url,
+        echo=False,
+        pool_size=1,
+        max_overflow=0,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _record):
+        # Транзакциями управляет SQLAlchemy (иначе pysqlite ломает SAVEPOINT)
+        dbapi_connection.isolation_level = None
+        _apply_pragmas(dbapi_connection, query_only=False)
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+def enable_savepoints(engine: AsyncEngine) -> None:
+    """SQLite без писателя: транзакциями управляет SQLAlchemy (SAVEPOINT в unit of work)"""
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+def create_reader_engine(url: str, pool_size: int = SQLITE_READER_POOL_SIZE) -> AsyncEngine:
+    """Пул читателей (WAL) с query_only — случайная запись в обход писателя упадёт сразу"""
+    engine = create_async_engine(
+        url,
+        echo=False,
+        pool_size=pool_size,
+        max_overflow=0,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _record):
+        _apply_pragmas(dbapi_connection, query_only=True)
+
+    return engine
+
+
+class _WriteJob:
+    __slots__ = ("slot", "done", "committed")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.slot: asyncio.Future = loop.create_future()  # → сессия писателя
+        self.done: asyncio.Future = loop.create_future()  # ← блок завершён (None или ошибка)
+        self.committed: asyncio.Future = loop.create_future()  # → пачка закоммичена
+
+
+def _resolve(future: asyncio.Future, result=None, error: Optional[BaseException] = None) -> None:
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+        future.exception()  # вызывающий мог уже уйти — без «exception was never retrieved»
+    else:
+        future.set_result(result)
+
+
+class SQLiteWriter:
+    """Фоновая задача-писатель: блоки записи всех обработчиков — одной транзакцией"""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        batch_max: int = WRITER_BATCH_MAX,
+        queue_maxsize: int = WRITER_QUEUE_MAXSIZE,
+    ) -> None:
+        self._session_factory = session_factory
+        self.batch_max = batch_max
+        self._queue: "asyncio.Queue[_WriteJob]" = asyncio.Queue(maxsize=queue_maxsize)
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.jobs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дождаться уже поставленных блоков и остановить задачу"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Блок записи: ждёт очереди к писателю, выполняется в его транзакции (SAVEPOINT)
+        и возвращает управление после COMMIT всей пачки. Ошибка в блоке откатывает
+        только его SAVEPOINT.
+        """
+        current = _writer_slot.get()
+        if current is not None:
+            yield current
+            return
+        if not self.running:
+            raise RuntimeError("SQLiteWriter не запущен")
+        job = _WriteJob(asyncio.get_running_loop())
+        await self._queue.put(job)
+        try:
+            session = await job.slot
+        except BaseException as e:
+            # Отмена до выдачи слота отменяет slot (писатель пропустит блок), после — он
+            # уже ждёт done: откатываем пустой SAVEPOINT
+            _resolve(job.done, e)
+            raise
+        token = _writer_slot.set(session)
+        try:
+            yield session
+        except BaseException as e:
+            _resolve(job.done, e)
+            raise
+        else:
+            _resolve(job.done)
+        finally:
+            _writer_slot.reset(token)
+        await job.committed
+
+    async def _run_job(self, session: AsyncSession, job: _WriteJob) -> bool:
+        """Выполнить один блок в SAVEPOINT; False — блок пропущен или откатен"""
+        if job.slot.done():  # вызывающий отменён, пока ждал очереди
+            _resolve(job.committed)
+            return False
+        savepoint = await session.begin_nested()
+        job.slot.set_result(session)
+        error = await job.done
+        if error is None and savepoint.is_active:
+            # SAVEPOINT не отпускаем: COMMIT пачки освободит всю вложенную цепочку, а
+            # откат следующего блока затронет только его (он — самый внутренний)
+            return True
+        # Откат нужен и неактивному SAVEPOINT (ошибка flush): иначе сессия остаётся в ошибке
+        await savepoint.rollback()
+        _resolve(job.committed)  # ошибку вызывающий уже получил сам
+        return False
+
+    async def _run(self) -> None:
+        while True:
+            job = await self._queue.get()
+            batch: List[_WriteJob] = []
+            try:
+                async with self._session_factory() as session:
+                    while True:
+                        if await self._run_job(session, job):
+                            batch.append(job)
+                        if len(batch) >= self.batch_max or self._queue.empty():
+                            break
+                        self._queue.task_done()
+                        job = self._queue.get_nowait()
+                    await session.commit()
+                for item in batch:
+                    _resolve(item.committed)
+                self.batches += 1
+                self.jobs += len(batch)
+            except asyncio.CancelledError:
+                for item in batch + [job]:
+                    _resolve(item.committed, error=RuntimeError("SQLiteWriter остановлен"))
+                raise
+            except Exception as e:
+                logger.error("sqlite_writer_batch_failed", jobs=len(batch), error=str(e))
+                for item in batch + [job]:
+                    _resolve(item.slot, error=e)
+                    _resolve(item.committed, error=e)
+            finally:
+                self._queue.task_done()
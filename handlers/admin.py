@@ -6,11 +6,13 @@ import logging
 from pathlib import Path
 
 from telegram import Update
-from telegram.constants import ParseMode
+from telegram.constants import ChatMemberStatus, ChatType, ParseMode
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
 import config
 from database import db
+from services.broadcast import broadcaster
 
 logger = logging.getLogger(__name__)
 
@@ -21,47 +23,84 @@ def is_admin(user_id: int) -> bool:
 
 
 async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Рассылка сообщения всем пользователям: /broadcast <текст>"""
+    """
+    Рассылка всем пользователям фоновой задачей (services.broadcast):
+    /broadcast <текст> — запустить, /broadcast status — прогресс, /broadcast stop — остановить,
+    /broadcast resume — продолжить приостановленные после сбоев
+    """
     user_id = update.effective_user.id
     if not is_admin(user_id):
         await update.message.reply_text("⛔ Команда доступна только администраторам.")
         return
 
-    text = " ".join(context.args) if context.args else ""
+    args = context.args or []
+    active = broadcaster.active()
+    if len(args) == 1 and args[0].lower() == "resume":
+        resumed = await broadcaster.resume_paused(context.bot)
+        await update.message.reply_text(
+            f"▶️ Продолжены рассылки: {', '.join(f'#{i}' for i in resumed)}"
+            if resumed
+            else "📭 Приостановленных рассылок нет."
+        )
+        return
+    if len(args) == 1 and args[0].lower() in ("status", "stop"):
+        paused = [] if args[0].lower() == "stop" else await broadcaster.paused()
+        if not active and not paused:
+            await update.message.reply_text("📭 Активных рассылок нет.")
+            return
+        for progress in paused:
+            await update.message.reply_text(progress.status_text())
+        for progress in active:
+            if args[0].lower() == "stop":
+                await broadcaster.cancel(progress.broadcast_id)
+                await update.message.reply_text(
+                    f"⛔ Рассылка #{progress.broadcast_id} останавливается..."
+                )
+            else:
+                await update.message.reply_text(progress.status_text())
+        return
+
+    text = " ".join(args)
     if not text:
         await update.message.reply_text(
             "📢 Использование: /broadcast <сообщение>\n\n"
-            "Пример: /broadcast Добрый день! Добавлена новая функция."
+            "Пример: /broadcast Добрый день! Добавлена новая функция.\n"
+            "/broadcast status — прогресс, /broadcast stop — остановить, "
+            "/broadcast resume — продолжить приостановленные"
+        )
+        return
+    if active:
+        await update.message.reply_text(
+            f"⏳ Уже идёт рассылка #{active[0].broadcast_id}. "
+            "Дождитесь окончания или остановите: /broadcast stop"
         )
         return
 
     try:
-        telegram_ids = await db.get_all_telegram_ids()
-        success = 0
-        failed = 0
-
-        status_msg = await update.message.reply_text(
-            f"📤 Рассылка {len(telegram_ids)} пользователям..."
-        )
+        # Образец уходит админу первым: ошибка разметки — до начала рассылки
+        broadcast = await broadcaster.start(context.bot, text, update.effective_chat.id)
+        logger.info(f"Broadcast #{broadcast.id} started by {user_id}: {broadcast.total} recipients")
+    except BadRequest as e:
+        await update.message.reply_text(f"❌ Сообщение не отправляется: {str(e)[:200]}")
+    except Exception as e:
+        logger.error(f"Broadcast error: {e}")
+        await update.message.reply_text(f"❌ Ошибка рассылки: {str(e)[:200]}")
 
-        for tg_id in telegram_ids:
-            try:
-                await context.bot.send_message(
-                    chat_id=tg_id,
-                    text=f"📢 **Объявление:**\n\n{text}",
-                    parse_mode=ParseMode.MARKDOWN,
-                )
-                success += 1
-            except Exception as e:
-                failed += 1
-                logger.warning(f"Broadcast failed for {tg_id}: {e}")
 
-        await status_msg.edit_text(
-            f"✅ Рассылка завершена!\n\nДоставлено: {success}\nНе доставлено: {failed}"
+async def bot_membership_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пользователь заблокировал / разблокировал бота (my_chat_member): учёт для рассылок"""
+    member = update.my_chat_member
+    if member is None or member.chat.type != ChatType.PRIVATE:
+        return
+    status = member.new_chat_member.status
+    if status not in (ChatMemberStatus.BANNED, ChatMemberStatus.MEMBER):
+        return
+    try:
+        await db.set_users_bot_blocked(
+            [member.from_user.id], blocked=status == ChatMemberStatus.BANNED
         )
     except Exception as e:
-        logger.error(f"Broadcast error: {e}")
-        await update.message.reply_text(f"❌ Ошибка рассылки: {str(e)[:200]}")
+        logger.warning(f"Bot membership update failed for {member.from_user.id}: {e}")
 
 
 async def health_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -73,10 +112,15 @@ async def health_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     lines = ["🩺 **Health check**\n"]
     try:
-        n = await db.get_users_count()
-        lines.append(f"✅ БД: ok (пользователей: {n})")
+        await db.get_user(user_id)
+        lines.append("✅ БД: ok")
     except Exception as e:
         lines.append(f"❌ БД: {str(e)[:80]}")
+    try:
+        n = await db.get_users_count()  # read-only пул (реплика, если задана)
+        lines.append(f"✅ БД (чтение): ok (пользователей: {n})")
+    except Exception as e:
+        lines.append(f"❌ БД (чтение): {str(e)[:80]}")
     try:
         from utils.redis_client import get_redis
 
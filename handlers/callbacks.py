@@ -470,8 +470,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Меню персонажей
     elif data == "menu_personas" or data == "menu_persona":
         await safe_callback_answer(query, "👤 Выбор персонажа...")
-        user = await db.get_user(user_id)
-        current_persona_key = user.persona if user else "assistant"
+        profile = await db.get_user_profile(user_id)
+        current_persona_key = profile.persona
         current_persona_name = config.PERSONAS.get(current_persona_key, {}).get("name", "Помощник")
 
         text = f"""👤 ВЫБОР ПЕРСОНАЖА
@@ -663,9 +663,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Меню настроек
     elif data == "menu_settings_new":
         await safe_callback_answer(query, "⚙️ Открываю настройки...")
-        user = await db.get_user(user_id)
+        user = await db.get_user_profile(user_id)
 
-        if user:
+        if user.exists:
             persona_name = config.PERSONAS.get(user.persona, {}).get("name", "Помощник")
             text = f"""⚙️ НАСТРОЙКИ БОТА
 
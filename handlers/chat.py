@@ -3,9 +3,7 @@
 """
 
 import re
-import time
 import uuid
-from datetime import datetime, timezone
 
 import structlog
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
@@ -23,12 +21,13 @@ except ImportError:
     generate_image_task = None
     get_taskiq_queue_length = None
 from middlewares.rate_limit import rate_limit_middleware
-from middlewares.usage_limit import check_can_make_request
-from services.memory import extract_and_save_facts
+from middlewares.usage_limit import check_can_make_request, record_usage
+from services.memory import schedule_fact_extraction
 from services.rag import get_rag_context
 from utils.analytics import track
 from utils.i18n import t
-from utils.text_tools import sanitize_markdown
+from utils.stream_renderer import StreamRenderer
+from utils.text_tools import TelegramHTMLStream, markdown_to_html, sanitize_markdown
 
 logger = structlog.get_logger(__name__)
 
@@ -59,9 +58,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_message = update.message.text
     logger.info("message_received", user_id=user_id, text_len=len(user_message))
 
-    # RAG Lite: извлекаем факты из сообщения
-    await extract_and_save_facts(user_id, user_message)
-
     # Проверка rate limit
     if not await rate_limit_middleware.check_rate_limit(user_id):
         await update.message.reply_text(
@@ -71,6 +67,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    # RAG Lite: извлечение фактов уходит в фоновую очередь и не задерживает ответ
+    await schedule_fact_extraction(user_id, user_message)
+
     # Лимит бесплатных запросов (10/день)
     can_proceed, limit_msg = await check_can_make_request(user_id)
     if not can_proceed:
@@ -89,8 +88,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not prompt:
             prompt = "красивое изображение"
 
-        date_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        await db.increment_daily_usage(user_id, date_str)
+        await record_usage(user_id)
         track("generated_image", str(user_id), {"async": True})
 
         # Фоновая задача (Taskiq + Redis): бот сразу отвечает с позицией в очереди, воркер шлёт результат позже
@@ -177,20 +175,22 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_chat_action("typing")
 
-    date_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    await db.increment_daily_usage(user_id, date_str)
+    await record_usage(user_id)
     track("sent_message", str(user_id), {"type": "text"})
 
     # RAG: подтянуть контекст из загруженных PDF (если есть документы и запрос похож на вопрос)
     rag_context = await get_rag_context(user_id, user_message)
 
-    stream_edit_interval = (
-        1.5  # обновлять сообщение не чаще раз в 1.5 сек (защита от лимитов Telegram)
-    )
     try:
         status_msg = await update.message.reply_text(t("thinking"))
-        accumulated = ""
-        last_edit_at = 0.0
+        # Темп правок, лимиты чата и общий бюджет, переход на новое сообщение — в StreamRenderer
+        renderer = StreamRenderer(
+            status_msg,
+            send_message=update.message.reply_text,
+            chat_id=update.effective_chat.id,
+            chat_type=update.effective_chat.type,
+            markup=TelegramHTMLStream,
+        )
         try:
             async for chunk in gemini_service.generate_content_stream(
                 prompt=user_message,
@@ -198,39 +198,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 use_context=True,
                 rag_context=rag_context,
             ):
-                accumulated += chunk
-                now = time.monotonic()
-                # Обновляем сообщение раз в 1–2 сек, чтобы не спамить API и выглядело как стриминг
-                if len(accumulated) > 50 and (now - last_edit_at >= stream_edit_interval):
-                    try:
-                        safe = sanitize_markdown(accumulated)
-                        await status_msg.edit_text(safe, parse_mode="Markdown")
-                        last_edit_at = now
-                    except BadRequest as e:
-                        if "parse" in str(e).lower() or "entities" in str(e).lower():
-                            try:
-                                await status_msg.edit_text(accumulated, parse_mode=None)
-                            except Exception:
-                                pass
-                        last_edit_at = now
-                    except Exception:
-                        pass
-            response = accumulated
-            # Финальное обновление: если не успели обновить в последнем интервале — показываем полный текст
-            if response and (
-                time.monotonic() - last_edit_at >= stream_edit_interval or last_edit_at == 0
-            ):
-                try:
-                    safe = sanitize_markdown(response)
-                    await status_msg.edit_text(safe, parse_mode="Markdown")
-                except BadRequest as e:
-                    if "parse" in str(e).lower() or "entities" in str(e).lower():
-                        try:
-                            await status_msg.edit_text(response, parse_mode=None)
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
+                await renderer.feed(chunk)
+            response = renderer.text
         except Exception as stream_err:
             logger.warning(
                 "stream_error", user_id=user_id, error=str(stream_err), fallback="non_stream"
@@ -238,10 +207,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             response = await generate_and_reply_text(
                 update.effective_chat, user_id, user_message, context, rag_context=rag_context
             )
-        try:
-            await status_msg.delete()
-        except Exception:
-            pass
+        # Ответ уходит заново, с клавиатурой: черновик (и его продолжения) удаляем,
+        # поэтому финальная правка перед удалением не нужна
+        await renderer.discard()
 
         def make_regenerate_keyboard(uid: int, req_id: str):
             return InlineKeyboardMarkup(
@@ -275,10 +243,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup = (
                     make_regenerate_keyboard(user_id, request_id) if i == len(parts) - 1 else None
                 )
-                safe_part = sanitize_markdown(part)
                 try:
                     await update.message.reply_text(
-                        safe_part, parse_mode="Markdown", reply_markup=reply_markup
+                        markdown_to_html(part), parse_mode="HTML", reply_markup=reply_markup
                     )
                 except BadRequest as e:
                     if "parse" in str(e).lower() or "entities" in str(e).lower():
@@ -289,10 +256,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         raise
         else:
             reply_markup = make_regenerate_keyboard(user_id, request_id)
-            safe_response = sanitize_markdown(response)
             try:
                 await update.message.reply_text(
-                    safe_response, parse_mode="Markdown", reply_markup=reply_markup
+                    markdown_to_html(response), parse_mode="HTML", reply_markup=reply_markup
                 )
             except BadRequest as e:
                 if "parse" in str(e).lower() or "entities" in str(e).lower():
@@ -590,9 +590,9 @@ async def image_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /settings для просмотра настроек"""
     user_id = update.effective_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user_profile(user_id)
 
-    if user:
+    if user.exists:
         persona_name = config.PERSONAS.get(user.persona, {}).get("name", "Помощник")
         text = f"""⚙️ **НАСТРОЙКИ БОТА**
 
@@ -7,6 +7,7 @@ from telegram import Update
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
+    ChatMemberHandler,
     CommandHandler,
     MessageHandler,
     PreCheckoutQueryHandler,
@@ -17,7 +18,15 @@ from telegram.request import HTTPXRequest
 # Импорты модулей (config валидирует ключи при импорте — бот не запустится без них)
 import config
 from database import db
-from handlers.admin import broadcast_command, health_command, logs_command, users_command
+from database.daily_metrics import run_daily_rollup
+from database.retention import run_retention
+from handlers.admin import (
+    bot_membership_handler,
+    broadcast_command,
+    health_command,
+    logs_command,
+    users_command,
+)
 from handlers.basic import clear_command, help_command, start_command
 from handlers.callbacks import button_callback
 from handlers.chat import handle_message
@@ -39,8 +48,13 @@ from handlers.conversation import get_wizard_conversation_handler
 from handlers.documents import handle_document, rag_clear_command, rag_docs_command
 from handlers.media import handle_photo, handle_voice
 from handlers.payments import pre_checkout_handler, subscribe_command, successful_payment_handler
+from middlewares.db_session import with_unit_of_work
+from middlewares.usage_limit import usage_reconcile_job
+from services.broadcast import broadcaster
+from services.memory import fact_index, fact_queue
 from utils.error_middleware import global_error_handler
 from utils.logging_config import setup_logging
+from utils.update_processor import ChatOrderedUpdateProcessor
 
 # Логирование с ротацией файлов (5 MB, 3 резервных копии) через structlog
 setup_logging()
@@ -58,15 +72,28 @@ except Exception as e:
     logger.debug("metrics_disabled", error=str(e))
 
 
-async def post_init(_application):
+async def post_init(application):
     """Вызывается после инициализации приложения (перед polling)"""
     await db.init()
     logger.info("database_initialized")
+    await db.profiles.start()  # подписка на инвалидации кэша профилей (Redis pub/sub)
+    await fact_index.start()  # сбросы индекса фактов из воркера Taskiq (Redis pub/sub)
+    await fact_queue.start()
+    await broadcaster.resume(application.bot)  # рассылки, прерванные перезапуском
+
+
+async def post_stop(_application):
+    """После остановки приложения, пока бот ещё может отправлять сообщения"""
+    await broadcaster.stop()  # дослать текущие пачки; продолжение — с чекпоинта
 
 
 async def post_shutdown(_application):
     """Вызывается после остановки приложения"""
-    await db.close()
+    await fact_queue.stop()
+    await fact_index.stop()
+    await db.profiles.stop()
+    await usage_reconcile_job(None)  # последние счётчики дня из Redis — в usage_daily
+    await db.close()  # в т.ч. сброс write-behind буфера истории сообщений
     try:
         from utils.redis_client import close_redis
 
@@ -76,6 +103,28 @@ async def post_shutdown(_application):
     logger.info("database_closed")
 
 
+async def retention_job(_context):
+    """Периодический ретеншн истории: архивация старых сообщений и партиций (database.retention)"""
+    try:
+        await run_retention(
+            db,
+            keep_last=config.settings.MESSAGE_RETENTION_KEEP,
+            batch_size=config.settings.MESSAGE_RETENTION_BATCH,
+            partition_retention_months=config.settings.MESSAGE_PARTITION_RETENTION_MONTHS,
+            archive_partitions=config.settings.MESSAGE_PARTITION_ARCHIVE,
+        )
+    except Exception as e:
+        logger.warning("message_retention_failed", error=str(e))
+
+
+async def daily_metrics_job(_context):
+    """Периодический пересчёт DAU / MAU в daily_metrics (database.daily_metrics)"""
+    try:
+        await run_daily_rollup(db)
+    except Exception as e:
+        logger.warning("daily_metrics_rollup_failed", error=str(e))
+
+
 def main():
     """Основная функция запуска бота"""
     logger.info("bot_initializing")
@@ -91,7 +140,15 @@ def main():
         Application.builder()
         .token(config.TELEGRAM_BOT_TOKEN)
         .request(request)
+        .concurrent_updates(
+            ChatOrderedUpdateProcessor(
+                max_concurrent=config.settings.UPDATE_CONCURRENCY,
+                max_backlog=config.settings.UPDATE_MAX_BACKLOG,
+                max_chat_backlog=config.settings.UPDATE_MAX_CHAT_BACKLOG,
+            )
+        )
         .post_init(post_init)
+        .post_stop(post_stop)
         .post_shutdown(post_shutdown)
         .build()
     )
@@ -113,6 +170,9 @@ def main():
     application.add_handler(CommandHandler("image", image_command))
     application.add_handler(CommandHandler("settings", settings_command))
     application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(
+        ChatMemberHandler(bot_membership_handler, ChatMemberHandler.MY_CHAT_MEMBER)
+    )
     application.add_handler(CommandHandler("health", health_command))
     application.add_handler(CommandHandler("users", users_command))
     application.add_handler(CommandHandler("logs", logs_command))
@@ -124,14 +184,38 @@ def main():
 
     # Регистрация обработчиков сообщений
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
-    application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-    application.add_handler(MessageHandler(filters.VOICE, handle_voice))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    # Unit of work: один апдейт — одна сессия БД и один COMMIT (middlewares.db_session)
+    application.add_handler(MessageHandler(filters.PHOTO, with_unit_of_work(handle_photo)))
+    application.add_handler(MessageHandler(filters.VOICE, with_unit_of_work(handle_voice)))
+    application.add_handler(
+        MessageHandler(filters.TEXT & ~filters.COMMAND, with_unit_of_work(handle_message))
+    )
 
     # ConversationHandler для /wizard (пошаговая настройка)
     application.add_handler(get_wizard_conversation_handler())
     # Обработчик callback кнопок
-    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(CallbackQueryHandler(with_unit_of_work(button_callback)))
+
+    # Ретеншн истории, сверка дневных счётчиков Redis → usage_daily, DAU / MAU (job-queue)
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(
+            retention_job,
+            interval=config.settings.MESSAGE_RETENTION_INTERVAL_SEC,
+            first=60,
+            name="message_retention",
+        )
+        application.job_queue.run_repeating(
+            usage_reconcile_job,
+            interval=config.settings.USAGE_RECONCILE_INTERVAL_SEC,
+            first=config.settings.USAGE_RECONCILE_INTERVAL_SEC,
+            name="usage_reconcile",
+        )
+        application.job_queue.run_repeating(
+            daily_metrics_job,
+            interval=config.settings.DAILY_METRICS_INTERVAL_SEC,
+            first=30,
+            name="daily_metrics",
+        )
 
     # Централизованная обработка ошибок: лог в файл + пользователю "Что-то пошло не так" + админу трейсбек
     application.add_error_handler(global_error_handler)
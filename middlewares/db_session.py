@@ -0,0 +1,19 @@
+"""
+Unit of work на Telegram-апдейт: все обращения к БД внутри хендлера идут через одну
+сессию и коммитятся одной транзакцией в конце (см. Database.unit_of_work)
+"""
+
+from functools import wraps
+
+from database import db
+
+
+def with_unit_of_work(handler):
+    """Декоратор хендлера: оборачивает обработку апдейта в db.unit_of_work()"""
+
+    @wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        async with db.unit_of_work():
+            return await handler(update, context, *args, **kwargs)
+
+    return wrapper
@@ -1,11 +1,92 @@
 """
-Лимит бесплатных запросов: 10/день, премиум — без лимита
+Лимит бесплатных запросов: 10/день, премиум — без лимита.
+
+Счётчик дня живёт в Redis: INCR ключа usage:{YYYY-MM-DD}:{user_id}, истекающего после
+полуночи UTC (+ запас на последнюю сверку). Проверка читает счётчик и профиль
+(премиум) одним MGET; если профиль уже в L1-кэше — только счётчик. Ключа нет (Redis
+перезапускался или счётчик вёлся в БД) — он засевается из usage_daily: SET NX (INCR,
+успевший раньше, не перезаписывается) + EXPIREAT. Id пользователей
+с изменёнными счётчиками копятся в множестве usage:dirty:{дата}, задача job-queue
+usage_reconcile_job переносит их значения в usage_daily (аналитика).
+Без Redis — как раньше: счётчик в usage_daily.
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import structlog
 
 import config
 from database import db
+from database.redis_cache import get_redis
+
+logger = structlog.get_logger(__name__)
+
+USAGE_KEY_PREFIX = "usage:"
+USAGE_DIRTY_PREFIX = "usage:dirty:"
+# Ключ живёт до полуночи UTC + запас: сверка успевает забрать хвост прошедшего дня
+USAGE_KEY_GRACE_SEC = 2 * 3600
+USAGE_RECONCILE_BATCH = 1000
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _usage_key(user_id: int, date_str: str) -> str:
+    return f"{USAGE_KEY_PREFIX}{date_str}:{user_id}"
+
+
+def _expire_at(date_str: str) -> int:
+    """Unix-время истечения ключей дня: следующая полночь UTC + запас"""
+    day = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int((day + timedelta(days=1)).timestamp()) + USAGE_KEY_GRACE_SEC
+
+
+def _limit_message(limit: int) -> str:
+    return (
+        f"⏳ Достигнут дневной лимит ({limit} запросов).\n\n"
+        "💎 Оформите подписку для безлимитного доступа."
+    )
+
+
+async def _seed_usage(redis, user_id: int, date_str: str) -> int:
+    """Ключа дня нет в Redis: значение из usage_daily, в Redis — SET NX + EXPIREAT"""
+    stored = await db.get_daily_usage(user_id, date_str)
+    if stored:
+        key = _usage_key(user_id, date_str)
+        pipe = redis.pipeline(transaction=False)
+        pipe.set(key, stored, nx=True)
+        pipe.expireat(key, _expire_at(date_str))
+        await pipe.execute()
+    return stored
+
+
+async def _read_usage(user_id: int, date_str: str) -> tuple[bool, int]:
+    """(премиум, запросов за день): Redis одним запросом, при сбое — БД"""
+    profile = db.profiles.peek(user_id)
+    redis = await get_redis()
+    if redis is not None:
+        try:
+            if profile is not None:
+                raw_used = await redis.get(_usage_key(user_id, date_str))
+            else:
+                raw_profile, raw_used = await redis.mget(
+                    db.profiles.redis_key(user_id), _usage_key(user_id, date_str)
+                )
+                profile = db.profiles.parse(raw_profile)
+            is_premium = profile.is_premium if profile else await db.is_premium(user_id)
+            if is_premium:
+                return True, 0
+            if raw_used is None:
+                return False, await _seed_usage(redis, user_id, date_str)
+            return False, int(raw_used)
+        except Exception as e:
+            logger.warning("usage_redis_error", user_id=user_id, error=str(e))
+    is_premium = profile.is_premium if profile else await db.is_premium(user_id)
+    if is_premium:
+        return True, 0
+    return False, await db.get_daily_usage(user_id, date_str)
 
 
 async def check_can_make_request(user_id: int) -> tuple[bool, str]:
@@ -13,16 +94,74 @@ async def check_can_make_request(user_id: int) -> tuple[bool, str]:
     Проверка: может ли пользователь сделать запрос.
     Returns: (can_proceed, message)
     """
-    is_premium = await db.is_premium(user_id)
+    is_premium, used = await _read_usage(user_id, _today())
     if is_premium:
         return True, ""
-
-    date_str = datetime.utcnow().strftime("%Y-%m-%d")
-    used = await db.get_daily_usage(user_id, date_str)
     limit = config.FREE_DAILY_LIMIT
     if used >= limit:
-        return False, (
-            f"⏳ Достигнут дневной лимит ({limit} запросов).\n\n"
-            "💎 Оформите подписку для безлимитного доступа."
-        )
+        return False, _limit_message(limit)
     return True, ""
+
+
+async def record_usage(user_id: int) -> int:
+    """Учесть запрос в дневном счётчике; вернуть новое значение"""
+    date_str = _today()
+    redis = await get_redis()
+    if redis is not None:
+        try:
+            key = _usage_key(user_id, date_str)
+            dirty = f"{USAGE_DIRTY_PREFIX}{date_str}"
+            expire_at = _expire_at(date_str)
+            pipe = redis.pipeline(transaction=False)
+            pipe.incr(key)
+            pipe.expireat(key, expire_at)
+            pipe.sadd(dirty, user_id)
+            pipe.expireat(dirty, expire_at)
+            count = (await pipe.execute())[0]
+            if count == 1:
+                # Новый ключ: Redis перезапускался или счётчик вёлся в БД — догоняем из usage_daily
+                stored = await db.get_daily_usage(user_id, date_str)
+                if stored:
+                    count = await redis.incrby(key, stored)
+            return count
+        except Exception as e:
+            logger.warning("usage_redis_error", user_id=user_id, error=str(e))
+    return await db.increment_daily_usage(user_id, date_str)
+
+
+async def reconcile_usage(dates: Optional[List[str]] = None) -> int:
+    """Перенести счётчики из Redis в usage_daily (сегодня и вчера); вернуть число строк"""
+    redis = await get_redis()
+    if redis is None:
+        return 0
+    if dates is None:
+        now = datetime.now(timezone.utc)
+        dates = [(now - timedelta(days=1)).strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d")]
+    written = 0
+    for date_str in dates:
+        dirty = f"{USAGE_DIRTY_PREFIX}{date_str}"
+        while True:
+            # SPOP: id, изменившиеся во время сверки, снова попадут в множество и в следующий проход
+            user_ids = await redis.spop(dirty, USAGE_RECONCILE_BATCH)
+            if not user_ids:
+                break
+            values = await redis.mget([_usage_key(int(uid), date_str) for uid in user_ids])
+            counts: Dict[int, int] = {
+                int(uid): int(value) for uid, value in zip(user_ids, values) if value is not None
+            }
+            try:
+                written += await db.upsert_daily_usage_batch(date_str, counts)
+            except Exception:
+                await redis.sadd(dirty, *user_ids)
+                raise
+    return written
+
+
+async def usage_reconcile_job(_context) -> None:
+    """Периодическая задача job-queue: сверка дневных счётчиков Redis → usage_daily"""
+    try:
+        written = await reconcile_usage()
+        if written:
+            logger.info("usage_reconciled", rows=written)
+    except Exception as e:
+        logger.warning("usage_reconcile_failed", error=str(e))
@@ -1,131 +1,484 @@
 """
-Скрипт миграции данных из JSON в SQLite
+Скрипт миграции данных из JSON (bot_data.json) в базу данных (SQLite или PostgreSQL).
+
+Файл читается потоково: разделы settings / conversations / stats / favorites /
+achievements разбираются по одной записи пользователя (json.JSONDecoder.raw_decode по
+буферу), в памяти — только текущая запись и пачка строк. Строки пишутся пачками:
+executemany (INSERT / INSERT … ON CONFLICT), сообщения на PostgreSQL — COPY.
+
+Контрольная точка (раздел и число обработанных записей) хранится в таблице
+data_migration_state и пишется в той же транзакции, что и пачка: повторный запуск
+продолжает ровно с последней закоммиченной пачки, после успешного завершения точка
+удаляется. Запись идемпотентна — повторный импорт того же файла (или --restart) ничего
+не задваивает: счётчики пишутся как максимум из БД и файла, команды — на день файла,
+история — только пользователям без неё, избранное и достижения сверяются с уже
+записанными. Бот на время миграции лучше остановить.
+
+python migrate_data.py [bot_data.json] [--batch-rows 10000] [--history-limit 20] [--restart]
 """
 
+import argparse
 import asyncio
+import codecs
 import json
 import logging
 import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from database import db
+from database.compressed_text import encode_text
+from database.models import (
+    Achievement,
+    CommandUsage,
+    DataMigrationState,
+    Favorite,
+    Message,
+    Stats,
+    User,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SECTIONS = ("settings", "conversations", "stats", "favorites", "achievements")
+BATCH_ROWS = 10000  # строк в одной транзакции (и между контрольными точками)
+HISTORY_LIMIT = 20  # последних сообщений пользователя (0 — все)
+READ_CHUNK_BYTES = 1 << 20
+_WHITESPACE = " \t\r\n"
 
-async def migrate_from_json(json_file: str = "bot_data.json"):
-    """Миграция данных из JSON файла в SQLite"""
 
-    # Инициализация базы данных
-    await db.init()
+class JsonSectionReader:
+    """
+    Потоковый разбор {раздел: {user_id: значение}}: записи (раздел, user_id, значение)
+    по одной. Неизвестные разделы пропускаются (читаются целиком).
+    """
 
-    if not json_file or not os.path.exists(json_file):
-        logger.warning(f"Файл {json_file} не найден. Миграция пропущена.")
-        return
+    def __init__(self, path: str, chunk_bytes: int = READ_CHUNK_BYTES) -> None:
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.bytes_read = 0
+        self._chunk_bytes = chunk_bytes
+        self._decoder = json.JSONDecoder()
+        self._file = None
+        self._text_decoder = None
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
 
-    logger.info(f"Начинаю миграцию данных из {json_file}...")
+    def entries(self) -> Iterator[Tuple[str, str, Any]]:
+        with open(self.path, "rb") as self._file:
+            self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+            if self._peek() == "\ufeff":  # BOM
+                self._pos += 1
+            self._expect("{")
+            if self._peek() == "}":
+                return
+            while True:
+                section = self._read_value()
+                self._expect(":")
+                if section in SECTIONS and self._peek() == "{":
+                    self._pos += 1
+                    if self._peek() == "}":
+                        self._pos += 1
+                    else:
+                        while True:
+                            key = self._read_value()
+                            self._expect(":")
+                            yield section, key, self._read_value()
+                            if self._separator() == "}":
+                                break
+                else:
+                    self._read_value()
+                if self._separator() == "}":
+                    return
 
-    try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    def _fill(self, min_bytes: int = 0) -> None:
+        data = self._file.read(max(self._chunk_bytes, min_bytes))
+        self.bytes_read += len(data)
+        if not data:
+            self._eof = True
+        self._buf = self._buf[self._pos :] + self._text_decoder.decode(data, final=not data)
+        self._pos = 0
 
-        # Миграция пользователей и настроек
-        settings = data.get("settings", {})
-        for user_id_str, user_settings in settings.items():
-            try:
-                user_id = int(user_id_str)
-                await db.create_or_update_user(
-                    telegram_id=user_id,
-                    language=user_settings.get("language", "ru"),
-                    persona=user_settings.get("persona", "assistant"),
-                    model=user_settings.get("model", "auto"),
-                    image_model=user_settings.get("image_model", "auto"),
-                )
-            except Exception as e:
-                logger.error(f"Ошибка миграции пользователя {user_id_str}: {e}")
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                raise ValueError(f"{self.path}: неожиданный конец файла")
+            self._fill()
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f"{self.path}: ожидался {char!r} (байт ~{self.bytes_read})")
+        self._pos += 1
 
-        logger.info(f"Мигрировано {len(settings)} пользователей")
+    def _separator(self) -> str:
+        char = self._peek()
+        if char not in ",}":
+            raise ValueError(f"{self.path}: ожидался ',' или '}}' (байт ~{self.bytes_read})")
+        self._pos += 1
+        return char
 
-        # Миграция истории сообщений
-        conversations = data.get("conversations", {})
-        migrated_messages = 0
-        for user_id_str, messages in conversations.items():
+    def _read_value(self) -> Any:
+        self._peek()
+        while True:
             try:
-                user_id = int(user_id_str)
-                for msg in messages[-20:]:  # Берем последние 20 сообщений
-                    await db.add_message(
-                        user_id=user_id,
-                        role=msg.get("role", "user"),
-                        content=msg.get("content", ""),
-                    )
-                    migrated_messages += 1
-            except Exception as e:
-                logger.error(f"Ошибка миграции сообщений пользователя {user_id_str}: {e}")
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                # Значение не поместилось в буфер: дочитываем с удвоением
+                self._fill(min_bytes=len(self._buf) - self._pos)
+                continue
+            if end == len(self._buf) and not self._eof:
+                self._fill()  # число на границе буфера могло быть обрезано
+                continue
+            self._pos = end
+            return value
 
-        logger.info(f"Мигрировано {migrated_messages} сообщений")
 
-        # Миграция статистики
-        stats_data = data.get("stats", {})
-        for user_id_str, stats in stats_data.items():
-            try:
-                user_id = int(user_id_str)
-                commands_used = stats.get("commands_used", {})
-                if isinstance(commands_used, dict):
-                    for command, count in commands_used.items():
-                        for _ in range(count):
-                            await db.update_stats(user_id, command=command)
-
-                await db.update_stats(
-                    user_id,
-                    requests_count=stats.get("requests", 0),
-                    tokens_used=stats.get("tokens_used", 0),
-                    images_generated=stats.get("images_generated", 0),
-                )
-            except Exception as e:
-                logger.error(f"Ошибка миграции статистики пользователя {user_id_str}: {e}")
+def _dialect_insert(conn):
+    return pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
 
-        logger.info(f"Мигрировано статистики для {len(stats_data)} пользователей")
 
-        # Миграция избранного
-        favorites = data.get("favorites", {})
-        migrated_favorites = 0
-        for user_id_str, fav_list in favorites.items():
-            try:
-                user_id = int(user_id_str)
-                for fav in fav_list:
-                    await db.add_favorite(
-                        user_id=user_id,
-                        content=fav.get("content", ""),
-                        content_type=fav.get("type", "text"),
-                        tags=fav.get("tags", []),
+class Checkpoint:
+    """
+    Контрольная точка миграции (data_migration_state): завершённые разделы и позиция
+    в текущем. save() выполняется в транзакции пачки — точка и строки коммитятся вместе.
+    """
+
+    def __init__(self, json_file: str) -> None:
+        self.source = os.path.abspath(json_file)
+        self.size = os.path.getsize(json_file)
+        self.sections_done: List[str] = []
+        self.section: Optional[str] = None
+        self.entries = 0
+
+    async def load(self, conn) -> bool:
+        row = (
+            await conn.execute(
+                select(DataMigrationState).where(DataMigrationState.source == self.source)
+            )
+        ).first()
+        if row is None:
+            return False
+        if row.file_size != self.size:
+            logger.warning(f"Точка для {self.source} относится к другой версии файла — сначала")
+            return False
+        self.sections_done = list(row.sections_done or [])
+        self.section = row.section
+        self.entries = row.entries
+        return True
+
+    async def save(self, conn) -> None:
+        values = {
+            "file_size": self.size,
+            "sections_done": list(self.sections_done),
+            "section": self.section,
+            "entries": self.entries,
+            "updated_at": datetime.utcnow(),
+        }
+        stmt = _dialect_insert(conn)(DataMigrationState).values(source=self.source, **values)
+        stmt = stmt.on_conflict_do_update(index_elements=[DataMigrationState.source], set_=values)
+        await conn.execute(stmt)
+
+    async def clear(self, conn) -> None:
+        await conn.execute(
+            delete(DataMigrationState).where(DataMigrationState.source == self.source)
+        )
+
+
+@dataclass
+class _Batch:
+    """Строки пачки; счётчики сводятся по ключу (один upsert на строку в пачке)"""
+
+    users: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    messages: List[Tuple[int, str, str]] = field(default_factory=list)
+    stats: Dict[int, Dict[str, int]] = field(default_factory=dict)
+    commands: Dict[Tuple[int, str], int] = field(default_factory=dict)
+    favorites: List[Dict[str, Any]] = field(default_factory=list)
+    achievements: Set[Tuple[int, str]] = field(default_factory=set)
+
+    def __len__(self) -> int:
+        return (
+            len(self.users)
+            + len(self.messages)
+            + len(self.stats)
+            + len(self.commands)
+            + len(self.favorites)
+            + len(self.achievements)
+        )
+
+
+def _add_entry(batch: _Batch, section: str, user_id: int, value: Any, history_limit: int) -> None:
+    if section == "settings":
+        value = value or {}
+        batch.users[user_id] = {
+            "telegram_id": user_id,
+            "language": value.get("language", "ru"),
+            "persona": value.get("persona", "assistant"),
+            "model": value.get("model", "auto"),
+            "image_model": value.get("image_model", "auto"),
+        }
+    elif section == "conversations":
+        messages = value or []
+        if history_limit:
+            messages = messages[-history_limit:]
+        batch.messages.extend(
+            (user_id, msg.get("role", "user"), msg.get("content", "") or "") for msg in messages
+        )
+    elif section == "stats":
+        value = value or {}
+        totals = batch.stats.setdefault(
+            user_id, {"requests_count": 0, "tokens_used": 0, "images_generated": 0}
+        )
+        totals["requests_count"] += int(value.get("requests", 0) or 0)
+        totals["tokens_used"] += int(value.get("tokens_used", 0) or 0)
+        totals["images_generated"] += int(value.get("images_generated", 0) or 0)
+        commands_used = value.get("commands_used", {})
+        if isinstance(commands_used, dict):
+            for command, count in commands_used.items():
+                key = (user_id, str(command))
+                batch.commands[key] = batch.commands.get(key, 0) + int(count)
+    elif section == "favorites":
+        batch.favorites.extend(
+            {
+                "user_id": user_id,
+                "content": fav.get("content", "") or "",
+                "content_type": fav.get("type", "text"),
+                "tags": fav.get("tags", []),
+            }
+            for fav in value or []
+        )
+    elif section == "achievements":
+        batch.achievements.update((user_id, str(ach_id)) for ach_id in value or [])
+
+
+class BulkWriter:
+    """
+    Запись пачки одной транзакцией вместе с контрольной точкой: executemany, сообщения
+    на PostgreSQL — COPY
+    """
+
+    def __init__(self, day: str) -> None:
+        self.day = day  # день счётчиков команд (дата файла — повторный импорт в те же строки)
+        self.is_postgres = db.engine.dialect.name == "postgresql"
+        self._insert = pg_insert if self.is_postgres else sqlite_insert
+        self._greatest = func.greatest if self.is_postgres else func.max
+
+    async def write(self, batch: _Batch, checkpoint: Checkpoint) -> None:
+        """Строки пачки и контрольная точка — одной транзакцией"""
+        now = datetime.utcnow()
+        async with db.engine.begin() as conn:
+            await checkpoint.save(conn)
+            if batch.users:
+                stmt = self._insert(User)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[User.telegram_id],
+                    set_={
+                        name: getattr(stmt.excluded, name)
+                        for name in ("language", "persona", "model", "image_model", "updated_at")
+                    },
+                )
+                rows = [{**row, "updated_at": now} for row in batch.users.values()]
+                await conn.execute(stmt, rows)
+            if batch.messages:
+                await self._write_messages(conn, batch.messages, now)
+            if batch.stats:
+                # Максимум, а не сумма: повторный импорт не задваивает, набранное ботом после
+                # первого импорта не теряется
+                stmt = self._insert(Stats)
+                set_ = {
+                    name: self._greatest(
+                        func.coalesce(Stats.__table__.c[name], 0), getattr(stmt.excluded, name)
+                    )
+                    for name in ("requests_count", "tokens_used", "images_generated")
+                }
+                set_["updated_at"] = stmt.excluded.updated_at
+                stmt = stmt.on_conflict_do_update(index_elements=[Stats.user_id], set_=set_)
+                rows = [
+                    {"user_id": uid, "start_date": now, "updated_at": now, **totals}
+                    for uid, totals in batch.stats.items()
+                ]
+                await conn.execute(stmt, rows)
+            if batch.commands:
+                stmt = self._insert(CommandUsage)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[CommandUsage.user_id, CommandUsage.command, CommandUsage.day],
+                    set_={
+                        "count": self._greatest(CommandUsage.__table__.c.count, stmt.excluded.count)
+                    },
+                )
+                rows = [
+                    {"user_id": uid, "command": command, "day": self.day, "count": count}
+                    for (uid, command), count in batch.commands.items()
+                ]
+                await conn.execute(stmt, rows)
+            if batch.favorites:
+                # Как достижения: уже сохранённое избранное отсекается выборкой
+                user_ids = {fav["user_id"] for fav in batch.favorites}
+                existing = await conn.execute(
+                    select(Favorite.user_id, Favorite.content, Favorite.content_type).where(
+                        Favorite.user_id.in_(user_ids)
+                    )
+                )
+                seen = {tuple(row) for row in existing.all()}
+                new_favorites = []
+                for fav in batch.favorites:
+                    key = (fav["user_id"], fav["content"], fav["content_type"])
+                    if key not in seen:
+                        seen.add(key)
+                        new_favorites.append(fav)
+                if new_favorites:
+                    await conn.execute(insert(Favorite), new_favorites)
+            if batch.achievements:
+                # Уникального индекса нет: уже выданные достижения отсекаются выборкой
+                user_ids = {uid for uid, _ in batch.achievements}
+                existing = await conn.execute(
+                    select(Achievement.user_id, Achievement.achievement_id).where(
+                        Achievement.user_id.in_(user_ids)
+                    )
+                )
+                new = batch.achievements - {tuple(row) for row in existing.all()}
+                if new:
+                    await conn.execute(
+                        insert(Achievement),
+                        [{"user_id": uid, "achievement_id": ach_id} for uid, ach_id in new],
                     )
-                    migrated_favorites += 1
-            except Exception as e:
-                logger.error(f"Ошибка миграции избранного пользователя {user_id_str}: {e}")
 
-        logger.info(f"Мигрировано {migrated_favorites} записей избранного")
+    async def _write_messages(self, conn, messages: List[Tuple[int, str, str]], now: datetime):
+        # История пользователя целиком в одной пачке: у кого сообщения уже есть (прошлый
+        # импорт или бот), тем не пишем — повторный импорт не задваивает историю
+        user_ids = {uid for uid, _, _ in messages}
+        existing = await conn.execute(
+            select(Message.user_id).where(Message.user_id.in_(user_ids)).distinct()
+        )
+        with_history = set(existing.scalars().all())
+        messages = [msg for msg in messages if msg[0] not in with_history]
+        if not messages:
+            return
+        if self.is_postgres:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                "messages",
+                columns=["user_id", "role", "content", "created_at"],
+                records=[(uid, role, encode_text(content), now) for uid, role, content in messages],
+            )
+            return
+        await conn.execute(
+            insert(Message),
+            [
+                {"user_id": uid, "role": role, "content": content, "created_at": now}
+                for uid, role, content in messages
+            ],
+        )
 
-        # Миграция достижений
-        achievements = data.get("achievements", {})
-        migrated_achievements = 0
-        for user_id_str, ach_list in achievements.items():
-            try:
-                user_id = int(user_id_str)
-                for ach_id in ach_list:
-                    await db.add_achievement(user_id, ach_id)
-                    migrated_achievements += 1
-            except Exception as e:
-                logger.error(f"Ошибка миграции достижений пользователя {user_id_str}: {e}")
 
-        logger.info(f"Мигрировано {migrated_achievements} достижений")
+async def migrate_from_json(
+    json_file: str = "bot_data.json",
+    batch_rows: int = BATCH_ROWS,
+    history_limit: int = HISTORY_LIMIT,
+    restart: bool = False,
+) -> Dict[str, int]:
+    """Миграция данных из JSON файла в БД; вернуть число записей по разделам"""
+    counts: Dict[str, int] = {section: 0 for section in SECTIONS}
+    if not json_file or not os.path.exists(json_file):
+        logger.warning(f"Файл {json_file} не найден. Миграция пропущена.")
+        return counts
+
+    await db.init()
+    checkpoint = Checkpoint(json_file)
+    async with db.engine.begin() as conn:
+        if restart:
+            await checkpoint.clear(conn)
+        elif await checkpoint.load(conn):
+            logger.info(
+                f"Продолжаю с контрольной точки: готово {checkpoint.sections_done}, "
+                f"{checkpoint.section}: {checkpoint.entries} записей"
+            )
+    resume_section, resume_entries = checkpoint.section, checkpoint.entries
 
-        logger.info("✅ Миграция завершена успешно!")
+    writer = BulkWriter(datetime.utcfromtimestamp(os.path.getmtime(json_file)).strftime("%Y-%m-%d"))
+    reader = JsonSectionReader(json_file)
+    batch = _Batch()
+    section: Optional[str] = None
+    entries = 0
+    rows_written = 0
+    started = time.monotonic()
+    logger.info(f"Начинаю миграцию данных из {json_file} ({reader.size / 1e6:.1f} МБ)...")
 
+    async def flush() -> None:
+        nonlocal batch, rows_written
+        checkpoint.section, checkpoint.entries = section, entries
+        await writer.write(batch, checkpoint)
+        rows_written += len(batch)
+        batch = _Batch()
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(
+            f"{section}: {entries} записей | строк {rows_written} "
+            f"({rows_written / elapsed:.0f}/с) | файл {100 * reader.bytes_read / reader.size:.0f}%"
+        )
+
+    try:
+        for entry_section, key, value in reader.entries():
+            if entry_section != section:
+                if section is not None and section not in checkpoint.sections_done:
+                    await flush()
+                    checkpoint.sections_done.append(section)
+                section, entries = entry_section, 0
+            entries += 1
+            if section in checkpoint.sections_done:
+                continue
+            if section == resume_section and entries <= resume_entries:
+                continue
+            try:
+                _add_entry(batch, section, int(key), value, history_limit)
+                counts[section] += 1
+            except (TypeError, ValueError, AttributeError) as e:
+                logger.error(f"Пропущена запись {section}/{key}: {e}")
+                continue
+            if len(batch) >= batch_rows:
+                await flush()
+        if section is not None and section not in checkpoint.sections_done:
+            await flush()
+            checkpoint.sections_done.append(section)
+        async with db.engine.begin() as conn:
+            await checkpoint.clear(conn)
+        logger.info(
+            f"✅ Миграция завершена за {time.monotonic() - started:.1f} с: "
+            + ", ".join(f"{name} {count}" for name, count in counts.items())
+        )
     except Exception as e:
-        logger.error(f"Ошибка миграции: {e}", exc_info=True)
+        logger.error(f"Ошибка миграции (продолжить — повторный запуск, точка в БД): {e}")
+        raise
     finally:
         await db.close()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Миграция bot_data.json в базу данных")
+    parser.add_argument("json_file", nargs="?", default="bot_data.json")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--history-limit", type=int, default=HISTORY_LIMIT)
+    parser.add_argument(
+        "--restart", action="store_true", help="игнорировать контрольную точку (импорт заново)"
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        migrate_from_json(args.json_file, args.batch_rows, args.history_limit, args.restart)
+    )
 
 
 if __name__ == "__main__":
-    asyncio.run(migrate_from_json())
+    main()
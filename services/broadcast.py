@@ -0,0 +1,495 @@
+"""
+Рассылка админа (/broadcast) фоновой задачей: не занимает обработку апдейта и
+продолжается после перезапуска бота.
+
+- Получатели — users пачками по BROADCAST_BATCH_SIZE (iter_telegram_ids, keyset по
+  users.id), кроме забаненных и заблокировавших бота (users.bot_blocked_at).
+- Отправка параллельная (BROADCAST_CONCURRENCY), темп задаёт общий TokenBucket —
+  BROADCAST_RATE_PER_SEC, ниже глобального лимита Bot API (~30 сообщений/с). Лимит
+  одного чата (~1 сообщение/с) соблюдается сам собой: получатель встречается в рассылке
+  один раз и повторно — только после паузы RetryAfter, сообщение статуса у админа
+  правится не чаще BROADCAST_STATUS_INTERVAL_SEC.
+- RetryAfter (flood wait) ставит на паузу весь bucket: Telegram ограничивает бота целиком.
+- Forbidden (бот заблокирован, аккаунт удалён) и «chat not found» — отметка
+  users.bot_blocked_at, следующие рассылки такого пользователя пропускают.
+- После каждой пачки — чекпоинт в broadcasts: cursor (users.id последней пачки) и
+  счётчики. post_init продолжает running-рассылки с cursor; повторно сообщение могут
+  получить только получатели недоотправленной пачки.
+- Сбой БД или сети посреди рассылки — повтор с cursor с нарастающей паузой
+  (BROADCAST_BATCH_RETRIES, BROADCAST_RETRY_BASE_SEC); получатели, уже обработанные
+  в прерванной пачке, пропускаются. Повторы кончились — статус paused: /broadcast status
+  его показывает, /broadcast resume продолжает.
+"""
+
+import asyncio
+import contextlib
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, List, Optional, Set
+
+import structlog
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+import config
+from database import Broadcast, UserFilter, db
+from utils.metrics import record_broadcast_flood_wait, record_broadcast_message
+from utils.token_bucket import TokenBucket
+
+logger = structlog.get_logger(__name__)
+
+STATUS_RUNNING = "running"
+STATUS_PAUSED = "paused"
+STATUS_DONE = "done"
+STATUS_CANCELLED = "cancelled"
+
+OUTCOME_SENT = "sent"
+OUTCOME_BLOCKED = "blocked"
+OUTCOME_FAILED = "failed"
+
+# Рассылка не уходит забаненным и тем, кто заблокировал бота
+RECIPIENTS = UserFilter(is_banned=False, bot_blocked=False)
+
+
+def format_broadcast_text(text: str) -> str:
+    return f"📢 **Объявление:**\n\n{text}"
+
+
+def _seconds(value) -> float:
+    """RetryAfter.retry_after: int или timedelta (в зависимости от версии PTB)"""
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes >= 60:
+        return f"{minutes // 60} ч {minutes % 60} мин"
+    if minutes:
+        return f"{minutes} мин"
+    return f"{int(seconds)} с"
+
+
+@dataclass
+class BroadcastProgress:
+    """Счётчики рассылки в памяти; в БД — после каждой пачки"""
+
+    broadcast_id: int
+    total: int
+    cursor: int = 0
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    state: str = STATUS_RUNNING
+    started_at: float = 0.0
+    processed_at_start: int = 0
+    # Текущая пачка: кому уже отправлено и кто заблокировал бота (до чекпоинта) —
+    # повтор пачки после сбоя их пропускает
+    batch_done: Set[int] = field(default_factory=set)
+    batch_blocked: List[int] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    def add(self, outcome: str) -> None:
+        if outcome == OUTCOME_SENT:
+            self.sent += 1
+        elif outcome == OUTCOME_BLOCKED:
+            self.blocked += 1
+        else:
+            self.failed += 1
+
+    def rate(self) -> float:
+        """Сообщений в секунду с момента (пере)запуска"""
+        elapsed = time.monotonic() - self.started_at
+        if elapsed <= 0:
+            return 0.0
+        return (self.processed - self.processed_at_start) / elapsed
+
+    def status_text(self, paused: bool = False) -> str:
+        title = {
+            STATUS_RUNNING: f"📤 Рассылка #{self.broadcast_id} идёт",
+            STATUS_PAUSED: (
+                f"⏸ Рассылка #{self.broadcast_id} приостановлена после ошибок: "
+                "продолжить — /broadcast resume"
+            ),
+            STATUS_DONE: f"✅ Рассылка #{self.broadcast_id} завершена",
+            STATUS_CANCELLED: f"⛔ Рассылка #{self.broadcast_id} остановлена",
+        }[self.state]
+        if paused:
+            title = f"⏸ Рассылка #{self.broadcast_id} приостановлена: продолжится после перезапуска бота"
+        percent = self.processed * 100 // self.total if self.total else 100
+        lines = [
+            title,
+            "",
+            f"Обработано: {self.processed} из {self.total} ({min(percent, 100)}%)",
+            f"✅ Доставлено: {self.sent}",
+            f"🚫 Заблокировали бота: {self.blocked}",
+            f"❌ Не доставлено: {self.failed}",
+        ]
+        rate = self.rate()
+        if self.state == STATUS_RUNNING and not paused and rate > 0:
+            left = max(self.total - self.processed, 0) / rate
+            lines.append(f"⏱ {rate:.1f} сообщ./с, осталось ~{_format_duration(left)}")
+        return "\n".join(lines)
+
+
+class BroadcastEngine:
+    """Запуск, продолжение после перезапуска и отмена рассылок (по задаче asyncio на рассылку)"""
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        status_interval: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        batch_retries: Optional[int] = None,
+        retry_base: Optional[float] = None,
+        retry_max: Optional[float] = None,
+    ) -> None:
+        self.rate = rate
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.status_interval = status_interval
+        self.max_attempts = max_attempts
+        self.batch_retries = batch_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._bucket: Optional[TokenBucket] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._progress: Dict[int, BroadcastProgress] = {}
+        self._cancelled: Set[int] = set()
+        self._stopping = False
+
+    def _configure(self) -> None:
+        if self._bucket is not None:
+            return
+        self.rate = self.rate or getattr(config.settings, "BROADCAST_RATE_PER_SEC", 25.0)
+        self.concurrency = self.concurrency or getattr(config, "BROADCAST_CONCURRENCY", 10)
+        self.batch_size = self.batch_size or getattr(config, "BROADCAST_BATCH_SIZE", 200)
+        if self.status_interval is None:
+            self.status_interval = getattr(config, "BROADCAST_STATUS_INTERVAL_SEC", 5.0)
+        self.max_attempts = self.max_attempts or getattr(config, "BROADCAST_MAX_ATTEMPTS", 3)
+        if self.batch_retries is None:
+            self.batch_retries = getattr(config, "BROADCAST_BATCH_RETRIES", 5)
+        if self.retry_base is None:
+            self.retry_base = getattr(config, "BROADCAST_RETRY_BASE_SEC", 2.0)
+        self.retry_max = self.retry_max or getattr(config, "BROADCAST_RETRY_MAX_SEC", 60.0)
+        self._bucket = TokenBucket(self.rate)
+
+    def active(self) -> List[BroadcastProgress]:
+        """Идущие в этом процессе рассылки"""
+        return [self._progress[i] for i in self._tasks if i in self._progress]
+
+    async def start(self, bot: Bot, text: str, admin_chat_id: int) -> Broadcast:
+        """
+        Новая рассылка: образец сообщения админу (ошибка разметки — BadRequest до начала
+        рассылки), сообщение статуса, запись в broadcasts и фоновая задача.
+        """
+        self._configure()
+        await bot.send_message(
+            chat_id=admin_chat_id, text=format_broadcast_text(text), parse_mode=ParseMode.MARKDOWN
+        )
+        total = await db.count_users(RECIPIENTS)
+        status_message = await bot.send_message(
+            chat_id=admin_chat_id, text=f"📤 Рассылка {total} пользователям..."
+        )
+        broadcast = await db.create_broadcast(
+            text, admin_chat_id, total, status_message_id=status_message.message_id
+        )
+        self._launch(bot, broadcast)
+        logger.info("broadcast_started", broadcast_id=broadcast.id, total=total)
+        return broadcast
+
+    async def resume(self, bot: Bot) -> int:
+        """Продолжить незавершённые рассылки (post_init); вернуть их число"""
+        self._configure()
+        self._stopping = False
+        resumed = 0
+        for broadcast in await db.get_unfinished_broadcasts():
+            if broadcast.id not in self._tasks:
+                self._launch(bot, broadcast)
+                resumed += 1
+                logger.info(
+                    "broadcast_resumed",
+                    broadcast_id=broadcast.id,
+                    cursor=broadcast.cursor,
+                    processed=broadcast.sent + broadcast.blocked + broadcast.failed,
+                )
+        return resumed
+
+    async def paused(self) -> List[BroadcastProgress]:
+        """Рассылки, приостановленные после сбоев (статус paused в БД)"""
+        return [
+            BroadcastProgress(
+                broadcast_id=b.id,
+                total=b.total,
+                cursor=b.cursor,
+                sent=b.sent,
+                blocked=b.blocked,
+                failed=b.failed,
+                state=STATUS_PAUSED,
+            )
+            for b in await db.get_unfinished_broadcasts(STATUS_PAUSED)
+        ]
+
+    async def resume_paused(self, bot: Bot) -> List[int]:
+        """Продолжить рассылки, приостановленные после сбоев (/broadcast resume); вернуть id"""
+        self._configure()
+        resumed = []
+        for broadcast in await db.get_unfinished_broadcasts(STATUS_PAUSED):
+            if broadcast.id in self._tasks:
+                continue
+            await db.save_broadcast_progress(
+                broadcast.id,
+                broadcast.cursor,
+                broadcast.sent,
+                broadcast.blocked,
+                broadcast.failed,
+                status=STATUS_RUNNING,
+            )
+            self._launch(bot, broadcast)
+            resumed.append(broadcast.id)
+            logger.info("broadcast_resumed", broadcast_id=broadcast.id, cursor=broadcast.cursor)
+        return resumed
+
+    async def cancel(self, broadcast_id: int) -> None:
+        """Остановить рассылку насовсем (статус cancelled, продолжения не будет)"""
+        self._cancelled.add(broadcast_id)
+        await db.set_broadcast_status(broadcast_id, STATUS_CANCELLED)
+        logger.info("broadcast_cancelled", broadcast_id=broadcast_id)
+
+    async def stop(self, timeout: float = 15.0) -> None:
+        """
+        Остановка бота (post_stop): даём дослать текущие пачки, статус остаётся running —
+        после перезапуска рассылка продолжится с чекпоинта.
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        tasks = list(self._tasks.values())
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _launch(self, bot: Bot, broadcast: Broadcast) -> None:
+        progress = BroadcastProgress(
+            broadcast_id=broadcast.id,
+            total=broadcast.total,
+            cursor=broadcast.cursor,
+            sent=broadcast.sent,
+            blocked=broadcast.blocked,
+            failed=broadcast.failed,
+            started_at=time.monotonic(),
+        )
+        progress.processed_at_start = progress.processed
+        self._progress[broadcast.id] = progress
+        task = asyncio.create_task(
+            self._run(bot, broadcast, progress), name=f"broadcast-{broadcast.id}"
+        )
+        self._tasks[broadcast.id] = task
+        task.add_done_callback(lambda _task, i=broadcast.id: self._forget(i))
+
+    def _forget(self, broadcast_id: int) -> None:
+        self._tasks.pop(broadcast_id, None)
+        self._progress.pop(broadcast_id, None)
+        self._cancelled.discard(broadcast_id)
+
+    def _halted(self, broadcast_id: int) -> bool:
+        return self._stopping or broadcast_id in self._cancelled
+
+    async def _run(self, bot: Bot, broadcast: Broadcast, progress: BroadcastProgress) -> None:
+        reporter = asyncio.create_task(self._report_loop(bot, broadcast, progress))
+        completed = False
+        try:
+            completed = await self._send_with_retries(bot, broadcast, progress)
+            if completed:
+                progress.state = STATUS_DONE
+                await db.save_broadcast_progress(
+                    broadcast.id,
+                    progress.cursor,
+                    progress.sent,
+                    progress.blocked,
+                    progress.failed,
+                    status=STATUS_DONE,
+                )
+            elif broadcast.id in self._cancelled:
+                progress.state = STATUS_CANCELLED
+            logger.info(
+                "broadcast_finished" if completed else "broadcast_interrupted",
+                broadcast_id=broadcast.id,
+                state=progress.state,
+                sent=progress.sent,
+                blocked=progress.blocked,
+                failed=progress.failed,
+            )
+        except Exception as e:
+            # Не удалось записать даже итог: статус в БД остаётся running — рассылка
+            # продолжится с чекпоинта после перезапуска
+            logger.error("broadcast_error", broadcast_id=broadcast.id, error=str(e))
+        finally:
+            reporter.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await reporter
+            paused = progress.state == STATUS_RUNNING
+            await self._edit_status(bot, broadcast, progress.status_text(paused=paused))
+
+    async def _send_with_retries(
+        self, bot: Bot, broadcast: Broadcast, progress: BroadcastProgress
+    ) -> bool:
+        """
+        Отправить всё с cursor; сбой — повтор с cursor через 2, 4, 8 … с (счётчик
+        повторов сбрасывается после каждой записанной пачки). Повторы кончились —
+        статус paused. Вернуть True, если рассылка дошла до конца.
+        """
+        failures = 0
+        while True:
+            cursor = progress.cursor
+            try:
+                return await self._send_from_cursor(bot, broadcast, progress)
+            except Exception as e:
+                if progress.cursor != cursor:
+                    failures = 0
+                failures += 1
+                if self._halted(broadcast.id):
+                    return False
+                if failures > self.batch_retries:
+                    await self._pause(broadcast, progress, e)
+                    return False
+                delay = min(self.retry_base * 2 ** (failures - 1), self.retry_max)
+                logger.warning(
+                    "broadcast_batch_retry",
+                    broadcast_id=broadcast.id,
+                    cursor=progress.cursor,
+                    attempt=failures,
+                    delay=delay,
+                    error=str(e),
+                )
+                await asyncio.sleep(delay)
+
+    async def _send_from_cursor(
+        self, bot: Bot, broadcast: Broadcast, progress: BroadcastProgress
+    ) -> bool:
+        batches = db.iter_telegram_ids(
+            batch_size=self.batch_size, filters=RECIPIENTS, after_id=progress.cursor
+        )
+        async with contextlib.aclosing(batches):
+            async for batch in batches:
+                if self._halted(broadcast.id):
+                    return False
+                await self._send_batch(bot, broadcast, batch.telegram_ids, progress)
+                await db.save_broadcast_progress(
+                    broadcast.id,
+                    batch.cursor,
+                    progress.sent,
+                    progress.blocked,
+                    progress.failed,
+                )
+                progress.cursor = batch.cursor
+                progress.batch_done.clear()
+        return not self._halted(broadcast.id)
+
+    async def _pause(self, broadcast: Broadcast, progress: BroadcastProgress, error) -> None:
+        """Повторы кончились: статус paused (виден в /broadcast status, /broadcast resume)"""
+        logger.error(
+            "broadcast_paused", broadcast_id=broadcast.id, cursor=progress.cursor, error=str(error)
+        )
+        await db.save_broadcast_progress(
+            broadcast.id,
+            progress.cursor,
+            progress.sent,
+            progress.blocked,
+            progress.failed,
+            status=STATUS_PAUSED,
+        )
+        progress.state = STATUS_PAUSED
+
+    async def _send_batch(
+        self, bot: Bot, broadcast: Broadcast, telegram_ids: List[int], progress: BroadcastProgress
+    ) -> None:
+        text = format_broadcast_text(broadcast.text)
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(chat_id: int) -> None:
+            async with slots:
+                # Отмена — не досылать пачку; остановка бота — дослать (чекпоинт по пачкам)
+                if broadcast.id in self._cancelled or chat_id in progress.batch_done:
+                    return
+                outcome = await self._deliver(bot, chat_id, text)
+                progress.batch_done.add(chat_id)
+                progress.add(outcome)
+                record_broadcast_message(outcome)
+                if outcome == OUTCOME_BLOCKED:
+                    progress.batch_blocked.append(chat_id)
+
+        # Дождаться всех отправок пачки, и только потом поднять сбой (повтор пачки)
+        results = await asyncio.gather(
+            *(deliver(chat_id) for chat_id in telegram_ids), return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+        if progress.batch_blocked:
+            await db.set_users_bot_blocked(progress.batch_blocked)
+            progress.batch_blocked.clear()
+
+    async def _deliver(self, bot: Bot, chat_id: int, text: str) -> str:
+        """Отправить одно сообщение с учётом RetryAfter: sent / blocked / failed"""
+        for attempt in range(1, self.max_attempts + 1):
+            await self._bucket.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.MARKDOWN)
+                return OUTCOME_SENT
+            except RetryAfter as e:
+                delay = _seconds(e.retry_after)
+                self._bucket.pause(delay)
+                record_broadcast_flood_wait()
+                logger.warning("broadcast_flood_wait", retry_after=delay, attempt=attempt)
+            except Forbidden:
+                return OUTCOME_BLOCKED
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    return OUTCOME_BLOCKED
+                logger.warning("broadcast_send_failed", chat_id=chat_id, error=str(e))
+                return OUTCOME_FAILED
+            except NetworkError as e:
+                # Таймауты и сетевые ошибки — повтор с нарастающей паузой
+                logger.debug("broadcast_send_retry", chat_id=chat_id, error=str(e))
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(attempt)
+            except TelegramError as e:
+                logger.warning("broadcast_send_failed", chat_id=chat_id, error=str(e))
+                return OUTCOME_FAILED
+        return OUTCOME_FAILED
+
+    async def _report_loop(
+        self, bot: Bot, broadcast: Broadcast, progress: BroadcastProgress
+    ) -> None:
+        while True:
+            await asyncio.sleep(self.status_interval)
+            await self._edit_status(bot, broadcast, progress.status_text())
+
+    async def _edit_status(self, bot: Bot, broadcast: Broadcast, text: str) -> None:
+        if broadcast.status_message_id is None:
+            return
+        await self._bucket.acquire()
+        try:
+            await bot.edit_message_text(
+                text, chat_id=broadcast.admin_chat_id, message_id=broadcast.status_message_id
+            )
+        except RetryAfter as e:
+            self._bucket.pause(_seconds(e.retry_after))
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.debug("broadcast_status_failed", error=str(e))
+        except TelegramError as e:
+            logger.debug("broadcast_status_failed", error=str(e))
+
+
+broadcaster = BroadcastEngine()
@@ -0,0 +1,176 @@
+"""
+Локальный пре-фильтр для RAG Lite: стоит ли отправлять сообщение на LLM-извлечение фактов.
+Большинство сообщений («напиши код сортировки», «переведи это») фактов о пользователе
+не содержат — отсеиваем их без сети: скомпилированные regex-сигналы + линейная модель
+(взвешенная сумма → сигмоида). Веса заданы вручную; отчёт по размеченной выборке
+(доля отсеянных, точность, полнота) — проверка после их правки:
+python -m services.fact_filter tests/data/fact_filter_sample.jsonl
+"""
+
+import json
+import math
+import re
+import sys
+from dataclasses import dataclass
+from typing import Iterable, List, Pattern, Tuple
+
+# Порог вероятности: ниже — сообщение не отправляется на LLM-извлечение
+DEFAULT_THRESHOLD = 0.5
+
+# Смещение модели: без сигналов вероятность ≈ 0.08
+_BIAS = -2.5
+
+_FLAGS = re.IGNORECASE | re.UNICODE
+
+# (имя сигнала, паттерн, вес). Каждый сигнал учитывается один раз.
+_SIGNALS: List[Tuple[str, Pattern[str], float]] = [
+    # Маркеры первого лица — сами по себе слабые («я хочу, чтобы ты…»)
+    ("first_person", re.compile(r"\b(?:я|меня|мне|мой|моя|моё|мое|мои|i|my|me)\b", _FLAGS), 1.0),
+    # Те же типы, что и FACT_PATTERNS / промпт извлечения в services.memory
+    (
+        "name",
+        re.compile(r"\b(?:меня зовут|мо[её] имя|зовите меня|my name is|call me)\b", _FLAGS),
+        3.0,
+    ),
+    ("age", re.compile(r"\bмне\s+\d{1,3}\s*(?:лет|год)|\bi'?m\s+\d{1,3}\s+years", _FLAGS), 3.5),
+    (
+        "job",
+        re.compile(r"\bя\s+(?:работаю|работал[аи]?|тружусь|подрабатываю)\b|\bi work\b", _FLAGS),
+        3.0,
+    ),
+    (
+        "city",
+        re.compile(
+            r"\b(?:живу|проживаю|переехал[аи]?)\s+(?:в|во|на|сюда)\b|\bя\s+из\s+\w|\bi live in\b",
+            _FLAGS,
+        ),
+        3.0,
+    ),
+    (
+        "profession",
+        re.compile(
+            r"\bя\s+(?:—\s*|-\s*)?(?:[а-яё]+(?:олог|ист|ер|ор|ант|ник|тель|ца)|врач|повар|пилот)\b",
+            _FLAGS,
+        ),
+        2.5,
+    ),
+    (
+        "interests",
+        re.compile(
+            r"\b(?:увлекаюсь|люблю|обожаю|интересуюсь|занимаюсь|моё хобби|мое хобби)\b", _FLAGS
+        ),
+        3.0,
+    ),
+    (
+        "education",
+        re.compile(
+            r"\b(?:окончил[аи]?|закончил[аи]?|учусь|учился|училась|студент(?:ка)?|выпускник)\b",
+            _FLAGS,
+        ),
+        3.0,
+    ),
+    ("skills", re.compile(r"\b(?:умею|владею|пишу на|программирую на)\b", _FLAGS), 1.5),
+    (
+        "family",
+        re.compile(r"\bу меня\s+(?:есть\s+)?(?:жена|муж|дет|сын|доч|кот|собак)", _FLAGS),
+        2.0,
+    ),
+    # Отрицательные сигналы: просьба/вопрос к боту, код
+    (
+        "request",
+        re.compile(
+            r"^\s*(?:напиши|переведи|объясни|сделай|покажи|найди|расскажи|создай|сгенерируй|"
+            r"посчитай|реши|придумай|исправь|сократи|как|что|почему|зачем|где|когда|сколько|"
+            r"какой|какая|какие)\b",
+            _FLAGS,
+        ),
+        -1.5,
+    ),
+    ("question", re.compile(r"\?\s*$"), -1.0),
+    ("code", re.compile(r"```|\bdef\s+\w+\(|\bclass\s+\w+|[;{}]\s*$", re.MULTILINE), -2.5),
+]
+
+
+def fact_features(text: str) -> List[str]:
+    """Имена сработавших сигналов (для отладки и подбора весов)."""
+    if not text:
+        return []
+    return [name for name, pattern, _ in _SIGNALS if pattern.search(text)]
+
+
+def fact_score(text: str) -> float:
+    """Вероятность (0..1), что в сообщении есть факты о пользователе."""
+    if not text:
+        return 0.0
+    z = _BIAS
+    for _, pattern, weight in _SIGNALS:
+        if pattern.search(text):
+            z += weight
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def is_fact_candidate(text: str, threshold: float = DEFAULT_THRESHOLD) -> bool:
+    """True — сообщение стоит отправить на LLM-извлечение фактов."""
+    return fact_score(text) >= threshold
+
+
+@dataclass
+class FilterReport:
+    """Качество фильтра на размеченной выборке."""
+
+    total: int
+    positives: int
+    passed: int
+    true_positives: int
+
+    @property
+    def skip_rate(self) -> float:
+        """Доля сообщений, отсеянных без LLM-вызова."""
+        return 1.0 - self.passed / self.total if self.total else 0.0
+
+    @property
+    def precision(self) -> float:
+        """Доля действительно «фактовых» среди пропущенных на LLM."""
+        return self.true_positives / self.passed if self.passed else 0.0
+
+    @property
+    def recall(self) -> float:
+        """Доля «фактовых» сообщений, которые дошли до LLM."""
+        return self.true_positives / self.positives if self.positives else 0.0
+
+
+def evaluate(
+    samples: Iterable[Tuple[str, bool]], threshold: float = DEFAULT_THRESHOLD
+) -> FilterReport:
+    """Оценить фильтр на выборке [(text, has_facts), ...]."""
+    total = positives = passed = true_positives = 0
+    for text, label in samples:
+        total += 1
+        positives += int(bool(label))
+        if is_fact_candidate(text, threshold):
+            passed += 1
+            true_positives += int(bool(label))
+    return FilterReport(total, positives, passed, true_positives)
+
+
+def load_samples(path: str) -> List[Tuple[str, bool]]:
+    """Выборка в JSONL: {"text": "...", "label": 1} на строку."""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                row = json.loads(line)
+                samples.append((row["text"], bool(row["label"])))
+    return samples
+
+
+if __name__ == "__main__":
+    _path = sys.argv[1] if len(sys.argv) > 1 else "tests/data/fact_filter_sample.jsonl"
+    _threshold = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_THRESHOLD
+    _report = evaluate(load_samples(_path), _threshold)
+    print(
+        f"samples={_report.total} positives={_report.positives} threshold={_threshold}\n"
+        f"skip_rate={_report.skip_rate:.2%} precision={_report.precision:.2%} "
+        f"recall={_report.recall:.2%}"
+    )
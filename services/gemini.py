@@ -107,16 +107,16 @@ class GeminiService:
                 and sum(len(m.get("content", "") or "") for m in context_messages) > max_chars
             ):
                 context_messages.pop(0)
-            user = await db.get_user(user_id)
-            if user:
-                persona_key = user.persona or "assistant"
+            profile = await db.get_user_profile(user_id)
+            if profile.exists:
+                persona_key = profile.persona or "assistant"
                 persona_prompt = config.PERSONAS.get(persona_key, config.PERSONAS["assistant"])[
                     "prompt"
                 ]
 
         from services.memory import get_relevant_facts
 
-        facts_block = await get_relevant_facts(user_id) if user_id else ""
+        facts_block = await get_relevant_facts(user_id, prompt) if user_id else ""
         facts_line = f"\n\n{facts_block}" if facts_block else ""
         rag_block = f"\n\n{rag_context}" if rag_context else ""
         system_prompt = (
@@ -164,10 +164,9 @@ class GeminiService:
             await db.add_message(user_id, "user", prompt)
             await db.add_message(user_id, "assistant", response_text)
 
-            await db.update_stats(user_id, requests_count=1, tokens_used=tokens)
+            await db.update_stats(user_id, requests_count=1, tokens_used=tokens, model=model_name)
 
-            user = await db.get_user(user_id)
-            if not user:
+            if not (await db.get_user_profile(user_id)).exists:
                 await db.create_or_update_user(telegram_id=user_id)
 
     async def _execute_legacy_fallback(
@@ -275,6 +274,9 @@ class GeminiService:
         """
         t0 = time.perf_counter()
         messages = await self._prepare_messages_context(prompt, user_id, use_context, rag_context)
+        if user_id:
+            # Контекст прочитан: отдаём соединение в пул на время ожидания LLM (unit of work)
+            await db.checkpoint()
         msg_chars = sum(len(m.get("content", "") or "") for m in messages)
         if struct_log:
             struct_log.info(
@@ -344,6 +346,9 @@ class GeminiService:
         Использует общий _prepare_messages_context и _select_target_models.
         """
         messages = await self._prepare_messages_context(prompt, user_id, use_context, rag_context)
+        if user_id:
+            # Контекст прочитан: отдаём соединение в пул на время ожидания LLM (unit of work)
+            await db.checkpoint()
         models_to_try = await self._select_target_models(model)
 
         url = self._chat_url()
@@ -430,6 +435,7 @@ class GeminiService:
             history_limit=8,
             extra_system=extra_system,
         )
+        await db.checkpoint()
         # В base последний элемент — user с текстом prompt; заменяем на мультимодальный
         out = base[:-1]
         out.append({"role": "user", "content": self._user_content_with_image(prompt, image_base64)})
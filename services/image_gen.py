@@ -176,7 +176,7 @@ class ImageGenerator:
 
                 # Обновляем статистику
                 if user_id:
-                    await db.update_stats(user_id, images_generated=1)
+                    await db.update_stats(user_id, images_generated=1, model=strategy.get_name())
 
                 logger.info(f"✅ Изображение успешно сгенерировано через {strategy.get_name()}")
                 return image_bytes, strategy.get_name()
@@ -2,17 +2,31 @@
 RAG Lite — долгосрочная память: факты о пользователе в контексте
 Сохраняем важные факты, подмешиваем в промпт при генерации
 Используем Gemini API для умного извлечения фактов
+Извлечение идёт в фоне (FactExtractionQueue / Taskiq) и не задерживает ответ пользователю
 """
 
+import asyncio
 import json
 import re
-from typing import Dict
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
 
 import structlog
 
 import config
 from database import db
+from database.redis_cache import InvalidatingCache
+from services.fact_filter import is_fact_candidate
 from services.gemini import gemini_service
+from services.llm_common import llm_semaphore
+from utils.metrics import (
+    record_fact_batch_size,
+    record_fact_dropped,
+    record_fact_extraction,
+    record_fact_prefilter,
+    set_fact_queue_depth,
+)
 
 logger = structlog.get_logger(__name__)
 
@@ -26,16 +40,8 @@ FACT_PATTERNS = [
 ]
 
 
-async def extract_facts_with_gemini(user_message: str) -> Dict[str, str]:
-    """
-    Использует Gemini API для извлечения структурированных фактов из сообщения.
-    Возвращает словарь {fact_type: fact_value} или пустой словарь при ошибке.
-    """
-    prompt = f"""Проанализируй сообщение пользователя и извлеки важные факты о нём.
-
-Сообщение: "{user_message}"
-
-Извлеки факты в формате JSON. Доступные типы фактов:
+# Типы фактов — общие для одиночного и пакетного промпта извлечения
+_FACT_TYPES_PROMPT = """Доступные типы фактов:
 - name: имя пользователя
 - age: возраст (только число)
 - job: место работы или профессия
@@ -43,129 +49,483 @@ async def extract_facts_with_gemini(user_message: str) -> Dict[str, str]:
 - profession: профессия (разработчик, дизайнер, учитель и т.д.)
 - interests: интересы и хобби
 - education: образование
-- skills: навыки и умения
+- skills: навыки и умения"""
+
+# Ограничение длины одного сообщения в пакетном промпте
+BATCH_MESSAGE_MAX_CHARS = 1000
+
+
+def _fact_model() -> str:
+    # Используем лёгкую модель (Gemini Flash) для быстрого извлечения фактов
+    return getattr(config, "FACT_EXTRACTION_MODEL", "gemini-2.0-flash") or "gemini-2.0-flash"
+
+
+def _parse_json_response(response: str):
+    """Очищает ответ модели от markdown-блоков кода и парсит JSON."""
+    response = response.strip()
+    if response.startswith("```json"):
+        response = response[7:]
+    if response.startswith("```"):
+        response = response[3:]
+    if response.endswith("```"):
+        response = response[:-3]
+    return json.loads(response.strip())
+
+
+def _clean_facts(facts) -> Dict[str, str]:
+    """Фильтрует пустые значения и обрезает длинные."""
+    if not isinstance(facts, dict):
+        return {}
+    return {
+        str(k): str(v).strip()[:200]
+        for k, v in facts.items()
+        if v and str(v).strip() and len(str(v).strip()) > 2
+    }
+
+
+async def extract_facts_with_gemini(user_message: str) -> Dict[str, str]:
+    """
+    Использует Gemini API для извлечения структурированных фактов из сообщения.
+    Возвращает словарь {fact_type: fact_value} или пустой словарь при ошибке.
+    """
+    facts = await extract_facts_batch_with_gemini([user_message])
+    return facts[0] if facts else {}
+
+
+async def extract_facts_batch_with_gemini(messages: List[str]) -> Optional[List[Dict[str, str]]]:
+    """
+    Один LLM-вызов на пачку сообщений (разных пользователей): сообщения передаются
+    JSON-массивом с id, модель возвращает объект {id: {fact_type: fact_value}}.
+    Возвращает список фактов по позициям сообщений или None, если вызов не удался.
+    """
+    if not messages:
+        return []
+    payload = json.dumps(
+        [{"id": i, "text": m[:BATCH_MESSAGE_MAX_CHARS]} for i, m in enumerate(messages)],
+        ensure_ascii=False,
+    )
+    prompt = f"""Проанализируй сообщения пользователей и извлеки важные факты об авторе каждого сообщения.
 
-Верни ТОЛЬКО валидный JSON без дополнительного текста, например:
-{{"name": "Николай", "profession": "Python-разработчик"}}
+Сообщения (JSON-массив, у каждого свой id):
+{payload}
 
-Если фактов нет, верни {{}}."""
+{_FACT_TYPES_PROMPT}
+
+Верни ТОЛЬКО валидный JSON-объект без дополнительного текста: ключ — id сообщения,
+значение — объект с фактами. Сообщения без фактов не включай. Например:
+{{"0": {{"name": "Николай", "profession": "Python-разработчик"}}, "3": {{"city": "Казань"}}}}
+
+Если фактов нет ни в одном сообщении, верни {{}}."""
 
     try:
-        # Используем лёгкую модель (Gemini Flash) для быстрого извлечения фактов
-        fact_model = (
-            getattr(config, "FACT_EXTRACTION_MODEL", "gemini-2.0-flash") or "gemini-2.0-flash"
-        )
         response = await gemini_service.generate_content(
             prompt=prompt,
             user_id=None,  # без контекста пользователя
             use_context=False,
-            model=fact_model,
+            model=_fact_model(),
         )
-
-        # Очищаем ответ от markdown блоков кода, если есть
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-        response = response.strip()
-
-        # Парсим JSON
-        facts = json.loads(response)
-        if isinstance(facts, dict):
-            # Фильтруем пустые значения
-            return {k: str(v).strip()[:200] for k, v in facts.items() if v and str(v).strip()}
-        return {}
+        data = _parse_json_response(response)
     except json.JSONDecodeError as e:
-        logger.debug("fact_extraction_failed", error=str(e), method="gemini")
-        return {}
+        logger.debug("fact_extraction_failed", error=str(e), method="gemini", batch=len(messages))
+        return None
     except Exception as e:
-        logger.debug("fact_extraction_failed", error=str(e), method="gemini", fallback="regex")
-        return {}
+        logger.debug(
+            "fact_extraction_failed",
+            error=str(e),
+            method="gemini",
+            batch=len(messages),
+            fallback="regex",
+        )
+        return None
+
+    results: List[Dict[str, str]] = [{} for _ in messages]
+    if isinstance(data, dict):
+        for key, facts in data.items():
+            try:
+                idx = int(key)
+            except (TypeError, ValueError):
+                continue
+            if 0 <= idx < len(messages):
+                results[idx] = _clean_facts(facts)
+    return results
+
+
+def extract_facts_with_regex(user_message: str) -> Dict[str, str]:
+    """Резервное извлечение фактов regex-паттернами (когда LLM недоступен)."""
+    facts: Dict[str, str] = {}
+    for pattern, fact_type in FACT_PATTERNS:
+        m = re.search(pattern, user_message, re.IGNORECASE)
+        if m:
+            value = m.group(1).strip()[:200]
+            if len(value) > 2:
+                facts[fact_type] = value
+    return facts
 
 
-async def extract_and_save_facts(user_id: int, user_message: str) -> None:
+async def extract_and_save_facts_batch(items: List[Tuple[int, str]]) -> int:
+    """
+    Извлекает факты из пачки сообщений [(user_id, text), ...] одним LLM-вызовом
+    и сохраняет все найденные факты одной транзакцией.
+    При ошибке LLM использует резервные regex-паттерны.
+    Возвращает количество сохранённых фактов.
+    """
+    items = [(uid, text) for uid, text in items if len(text.strip()) >= 10]
+    if not items:
+        return 0
+
+    extracted = await extract_facts_batch_with_gemini([text for _, text in items])
+    method = "gemini"
+    if extracted is None:
+        method = "regex"
+        extracted = [extract_facts_with_regex(text) for _, text in items]
+
+    # Несколько сообщений одного пользователя: более поздний факт того же типа побеждает
+    facts_by_user: Dict[int, Dict[str, str]] = {}
+    for (user_id, _), facts in zip(items, extracted):
+        if facts:
+            facts_by_user.setdefault(user_id, {}).update(facts)
+    if not facts_by_user:
+        return 0
+
+    try:
+        saved = await db.upsert_user_facts_batch(facts_by_user)
+    except Exception as e:
+        logger.warning("fact_save_skipped", users=len(facts_by_user), error=str(e))
+        return 0
+    for user_id in facts_by_user:
+        await fact_index.invalidate(user_id)
+    logger.debug(
+        "facts_saved", users=len(facts_by_user), facts=saved, messages=len(items), method=method
+    )
+    return saved
+
+
+async def extract_and_save_facts(user_id: int, user_message: str) -> int:
     """
     Извлекает факты из сообщения пользователя через Gemini API и сохраняет в БД.
     При ошибке Gemini использует резервные regex-паттерны.
+    Возвращает количество сохранённых фактов.
+    """
+    return await extract_and_save_facts_batch([(user_id, user_message)])
+
+
+class FactExtractionQueue:
     """
-    msg_lower = user_message.lower().strip()
-    if len(msg_lower) < 10:
-        return
+    Фоновая очередь извлечения фактов: ответ пользователю не ждёт LLM-вызова.
+    Ограниченный буфер и собственные воркеры (свой лимит параллельных вызовов).
+    Низкий приоритет: пока пул LLM-слотов чата занят, воркеры ждут; под нагрузкой
+    задачи отбрасываются (переполнение, устаревание), а не копятся.
+    Дебаунс: один сборщик копит сообщения (всех пользователей) до batch_window_sec или
+    batch_max штук и отдаёт пачку целиком свободному воркеру — один LLM-вызов на пачку.
+    Пока воркеры заняты, сборщик ждёт, а сообщения копятся в очереди к следующей пачке.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        workers: Optional[int] = None,
+        max_age_sec: Optional[float] = None,
+        batch_window_sec: Optional[float] = None,
+        batch_max: Optional[int] = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_age_sec = max_age_sec
+        self.batch_window_sec = batch_window_sec
+        self.batch_max = batch_max
+        self._queue: Optional[asyncio.Queue[Tuple[int, str, float]]] = None
+        self._batches: Optional[asyncio.Queue[List[Tuple[int, str, float]]]] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """Запуск воркеров (вызывать из post_init бота)."""
+        if self.running:
+            return
+        self.maxsize = self.maxsize or getattr(config, "FACT_QUEUE_MAXSIZE", 1000)
+        self.workers = self.workers or getattr(config, "FACT_WORKERS", 2)
+        self.max_age_sec = self.max_age_sec or getattr(config, "FACT_TASK_MAX_AGE_SEC", 120)
+        if self.batch_window_sec is None:
+            self.batch_window_sec = getattr(config, "FACT_BATCH_WINDOW_SEC", 2.0)
+        self.batch_max = self.batch_max or getattr(config, "FACT_BATCH_MAX_MESSAGES", 20)
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        # Не больше одной пачки в ожидании: пока воркеры заняты, сообщения копятся в очереди
+        self._batches = asyncio.Queue(maxsize=1)
+        self._tasks = [asyncio.create_task(self._collector(), name="fact-collector")]
+        self._tasks += [
+            asyncio.create_task(self._worker(), name=f"fact-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info("fact_queue_started", workers=self.workers, maxsize=self.maxsize)
 
-    # Пробуем извлечь факты через Gemini
-    facts = await extract_facts_with_gemini(user_message)
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Остановка: даём воркерам дообработать очередь, остаток отбрасываем."""
+        if not self.running:
+            return
+        queue = self._queue
+        try:
+            await asyncio.wait_for(queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Сообщения, собранные сборщиком, но не взятые воркером, отбрасываются вместе с очередью
+        dropped = queue.qsize() + self._release_batches()
+        for _ in range(queue.qsize()):
+            record_fact_dropped("shutdown")
+        self._queue = None
+        self._batches = None
+        self._tasks = []
+        set_fact_queue_depth(0)
+        logger.info("fact_queue_stopped", dropped=dropped)
 
-    # Если Gemini вернул факты — сохраняем их
-    if facts:
-        for fact_type, fact_value in facts.items():
-            if len(fact_value) > 2:
+    def submit(self, user_id: int, user_message: str) -> bool:
+        """Поставить сообщение в очередь без ожидания. False — задача отброшена."""
+        if self._queue is None:
+            record_fact_dropped("not_running")
+            return False
+        try:
+            self._queue.put_nowait((user_id, user_message, time.monotonic()))
+        except asyncio.QueueFull:
+            record_fact_dropped("queue_full")
+            logger.debug("fact_task_dropped", user_id=user_id, reason="queue_full")
+            return False
+        set_fact_queue_depth(self._queue.qsize())
+        return True
+
+    async def _wait_for_llm_headroom(self) -> None:
+        """Уступаем чату: пока все LLM-слоты заняты, фоновые вызовы не стартуют."""
+        while llm_semaphore.locked():
+            await asyncio.sleep(0.5)
+
+    def _release(self, queue: asyncio.Queue, batch: List[Tuple[int, str, float]]) -> int:
+        """Отбросить уже вынутые из очереди сообщения (остановка), сохранив баланс task_done"""
+        for _ in batch:
+            record_fact_dropped("shutdown")
+            queue.task_done()
+        return len(batch)
+
+    def _release_batches(self) -> int:
+        released = 0
+        while self._batches is not None and not self._batches.empty():
+            released += self._release(self._queue, self._batches.get_nowait())
+        return released
+
+    async def _collect_batch(self, queue: asyncio.Queue) -> List[Tuple[int, str, float]]:
+        """Ждёт первое сообщение, затем добирает пачку в течение окна дебаунса."""
+        batch = [await queue.get()]
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.batch_window_sec
+            while len(batch) < self.batch_max:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
                 try:
-                    await db.add_user_fact(user_id, fact_type, fact_value)
-                    logger.debug(
-                        "fact_saved",
-                        user_id=user_id,
-                        fact_type=fact_type,
-                        fact_value=fact_value[:50],
-                    )
-                except Exception as e:
-                    logger.debug("fact_save_skipped", user_id=user_id, error=str(e))
-        return
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+        except BaseException:
+            # Отмена во время дебаунса: собранные сообщения не теряются молча
+            self._release(queue, batch)
+            raise
+        return batch
 
-    # Fallback: используем regex-паттерны
-    for pattern, fact_type in FACT_PATTERNS:
-        m = re.search(pattern, user_message, re.IGNORECASE)
-        if m:
-            value = m.group(1).strip()[:200]
-            if len(value) > 2:
+    async def _collector(self) -> None:
+        """Единственный сборщик пачек: воркеры получают пачку целиком, а не делят сообщения"""
+        queue, batches = self._queue, self._batches
+        while True:
+            batch = await self._collect_batch(queue)
+            try:
+                await batches.put(batch)
+            except BaseException:
+                self._release(queue, batch)
+                raise
+
+    async def _worker(self) -> None:
+        queue, batches = self._queue, self._batches
+        while True:
+            batch = await batches.get()
+            try:
+                set_fact_queue_depth(queue.qsize())
+                await self._wait_for_llm_headroom()
+                now = time.monotonic()
+                items = []
+                for user_id, user_message, enqueued_at in batch:
+                    if now - enqueued_at > self.max_age_sec:
+                        record_fact_dropped("stale")
+                    else:
+                        items.append((user_id, user_message))
+                if not items:
+                    continue
+                record_fact_batch_size(len(items))
+                t0 = time.perf_counter()
                 try:
-                    await db.add_user_fact(user_id, fact_type, value)
-                    logger.debug(
-                        "fact_saved",
-                        user_id=user_id,
-                        fact_type=fact_type,
-                        fact_value=value[:50],
-                        method="regex",
-                    )
+                    saved = await extract_and_save_facts_batch(items)
+                    outcome = "ok" if saved else "empty"
                 except Exception as e:
-                    logger.debug("fact_save_skipped", user_id=user_id, error=str(e))
+                    outcome = "error"
+                    logger.warning("fact_extraction_error", batch=len(items), error=str(e))
+                record_fact_extraction(time.perf_counter() - t0, outcome)
+            finally:
+                for _ in batch:
+                    queue.task_done()
 
 
-async def get_relevant_facts(user_id: int, limit: int = 5) -> str:
+fact_queue = FactExtractionQueue()
+
+
+async def schedule_fact_extraction(user_id: int, user_message: str) -> bool:
     """
-    Возвращает строку с фактами для добавления в системный промпт.
-    Форматирует факты в читаемом виде для модели.
+    Отправить извлечение фактов в фон — обработчик сообщения не ждёт LLM.
+    При FACT_EXTRACTION_USE_TASKIQ и доступном Redis задача уходит воркеру Taskiq,
+    иначе — в in-process очередь. Возвращает True, если задача принята.
+    Сообщения без признаков фактов отсекаются локальным пре-фильтром без LLM-вызова.
     """
-    facts = await db.get_user_facts(user_id, limit=limit)
-    if not facts:
-        return ""
+    if len(user_message.strip()) < 10:
+        return False
+    threshold = getattr(config, "FACT_FILTER_THRESHOLD", 0.5)
+    passed = is_fact_candidate(user_message, threshold)
+    record_fact_prefilter(passed)
+    if not passed:
+        return False
+    if getattr(config.settings, "FACT_EXTRACTION_USE_TASKIQ", False) is True:
+        try:
+            from tasks.memory_tasks import extract_facts_task
 
-    # Группируем факты по типам для лучшей читаемости
-    fact_dict = {}
-    for f in facts:
-        if f.fact_type not in fact_dict:
-            fact_dict[f.fact_type] = []
-        fact_dict[f.fact_type].append(f.fact_value)
+            if extract_facts_task is not None:
+                await extract_facts_task.kiq(user_id=user_id, user_message=user_message)
+                return True
+        except Exception as e:
+            logger.warning("fact_taskiq_unavailable", error=str(e), fallback="local_queue")
+    return fact_queue.submit(user_id, user_message)
 
-    # Формируем читаемый текст
-    lines = ["\nИзвестные факты о пользователе:"]
 
-    type_names = {
-        "name": "Имя",
-        "age": "Возраст",
-        "job": "Работа",
-        "city": "Город",
-        "profession": "Профессия",
-        "interests": "Интересы",
-        "education": "Образование",
-        "skills": "Навыки",
-    }
+# Названия типов фактов для системного промпта
+FACT_TYPE_NAMES = {
+    "name": "Имя",
+    "age": "Возраст",
+    "job": "Работа",
+    "city": "Город",
+    "profession": "Профессия",
+    "interests": "Интересы",
+    "education": "Образование",
+    "skills": "Навыки",
+}
+
+# Основы слов запроса, при которых факт данного типа уместен в контексте
+FACT_TYPE_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "age": ("возра", "лет", "стар", "молод", "пенси", "здоро"),
+    "job": ("работ", "карье", "колле", "начал", "офис", "зарпл", "резюм", "собес", "проек"),
+    "city": ("город", "живу", "погод", "рядом", "куда", "где", "транс", "ресто", "перее"),
+    "profession": ("профе", "работ", "карье", "задач", "резюм", "навык"),
+    "interests": ("хобби", "увлеч", "досуг", "посов", "книг", "фильм", "музык", "игр", "отдых"),
+    "education": ("учеб", "учус", "униве", "экзам", "курс", "диплом", "сесси", "студе"),
+    "skills": ("навык", "умею", "код", "прогр", "язык", "python", "опыт"),
+}
+
+# Сброс индекса фактов во всех процессах бота (факты сохраняет и воркер Taskiq)
+FACT_INDEX_INVALIDATE_CHANNEL = "nero:facts:invalidate"
+FACT_INDEX_LISTENER_RETRY_SEC = 5.0
 
-    for fact_type, values in fact_dict.items():
-        type_name = type_names.get(fact_type, fact_type)
-        value_str = ", ".join(values) if len(values) > 1 else values[0]
-        lines.append(f"- {type_name}: {value_str}")
+# Факты, которые подмешиваются всегда (короткие и нужны для обращения к пользователю)
+PINNED_FACT_TYPES = ("name",)
 
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+", re.IGNORECASE)
+
+
+def _stems(text: str) -> Set[str]:
+    """Грубые основы слов (первые 5 символов) — лексическое сравнение без морфологии."""
+    return {w[:5] for w in _WORD_RE.findall(text.lower()) if len(w) >= 3}
+
+
+@dataclass
+class IndexedFact:
+    """Факт в индексе пользователя: строка для промпта и основы слов для ранжирования."""
+
+    fact_type: str
+    fact_value: str
+    line: str
+    stems: Set[str]
+
+
+def score_fact(fact: IndexedFact, query_stems: Set[str]) -> float:
+    """Релевантность факта запросу: совпадения по значению + ключевые слова типа."""
+    score = 2.0 * len(fact.stems & query_stems)
+    keywords = FACT_TYPE_KEYWORDS.get(fact.fact_type, ())
+    if any(q.startswith(k) for q in query_stems for k in keywords):
+        score += 1.0
+    if fact.fact_type in PINNED_FACT_TYPES:
+        score += 0.5
+    return score
+
+
+def rank_facts(facts: List[IndexedFact], query: str, limit: int) -> List[IndexedFact]:
+    """Факты, релевантные запросу (по убыванию score). Без запроса — первые limit."""
+    if not query:
+        return facts[:limit]
+    query_stems = _stems(query)
+    scored = [(score_fact(f, query_stems), i, f) for i, f in enumerate(facts)]
+    relevant = [item for item in scored if item[0] > 0]
+    # При равном score — более свежий факт (facts отсортированы от новых к старым)
+    relevant.sort(key=lambda item: (-item[0], item[1]))
+    return [f for _, _, f in relevant[:limit]]
+
+
+class FactIndex(InvalidatingCache[List[IndexedFact]]):
+    """
+    Per-user in-memory индекс фактов (LRU + TTL): факты грузятся из БД один раз,
+    строки для промпта и основы слов считаются при загрузке, а не на каждый запрос.
+    Сбрасывается при сохранении новых фактов этого пользователя: в своём процессе сразу,
+    в остальных — по Redis pub/sub (факты может сохранить воркер Taskiq).
+    """
+
+    def __init__(self, ttl_sec: float = 300.0, max_users: int = 10000) -> None:
+        super().__init__(
+            "fact_index",
+            self._load,
+            FACT_INDEX_INVALIDATE_CHANNEL,
+            ttl_sec,
+            max_users,
+            listener_retry_sec=FACT_INDEX_LISTENER_RETRY_SEC,
+        )
+
+    @staticmethod
+    async def _load(user_id: int) -> List[IndexedFact]:
+        rows = await db.get_user_facts(user_id, limit=getattr(config, "FACT_INDEX_MAX_FACTS", 50))
+        return [
+            IndexedFact(
+                fact_type=f.fact_type,
+                fact_value=f.fact_value,
+                line=f"- {FACT_TYPE_NAMES.get(f.fact_type, f.fact_type)}: {f.fact_value}",
+                stems=_stems(f.fact_value),
+            )
+            for f in rows
+        ]
+
+
+fact_index = FactIndex(
+    ttl_sec=getattr(config, "FACT_INDEX_TTL_SEC", 300),
+    max_users=getattr(config, "FACT_INDEX_MAX_USERS", 10000),
+)
+
+
+async def get_relevant_facts(user_id: int, query: str = "", limit: int = 5) -> str:
+    """
+    Возвращает строку с фактами для добавления в системный промпт.
+    Факты ранжируются по лексической близости к запросу (query): в промпт попадают
+    только релевантные и закреплённые (имя). Без query — последние limit фактов.
+    """
+    facts = rank_facts(await fact_index.get(user_id), query, limit)
+    if not facts:
+        return ""
+    lines = ["\nИзвестные факты о пользователе:"]
+    lines.extend(f.line for f in facts)
     return "\n".join(lines)
@@ -1,5 +1,5 @@
 """Очереди задач (Taskiq + Redis). Тяжёлые операции выполняются воркерами."""
 
-from .broker import broker, get_taskiq_queue_length
+from .broker import broker, facts_broker, get_taskiq_queue_length
 
-__all__ = ["broker", "get_taskiq_queue_length"]
+__all__ = ["broker", "facts_broker", "get_taskiq_queue_length"]
@@ -11,11 +11,15 @@ logger = logging.getLogger(__name__)
 
 # Имя ключа очереди в Redis (ListQueueBroker хранит список под этим ключом; при смене — задать TASKIQ_QUEUE_NAME в .env)
 TASKIQ_DEFAULT_QUEUE = getattr(config.settings, "TASKIQ_QUEUE_NAME", None) or "default"
+# Отдельная низкоприоритетная очередь для извлечения фактов — не влияет на позицию в очереди картинок
+TASKIQ_FACTS_QUEUE = "facts"
 
 broker: Optional[ListQueueBroker] = None
+facts_broker: Optional[ListQueueBroker] = None
 try:
     broker = ListQueueBroker(url=config.settings.REDIS_URL)
     broker.result_backend = RedisAsyncResultBackend(config.settings.REDIS_URL)
+    facts_broker = ListQueueBroker(url=config.settings.REDIS_URL, queue_name=TASKIQ_FACTS_QUEUE)
 except Exception as e:
     logger.warning("Redis недоступен, фоновые задачи отключены: %s", e)
 
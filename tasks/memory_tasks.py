@@ -0,0 +1,42 @@
+"""
+Фоновое извлечение фактов о пользователе (RAG Lite) — отдельная очередь и воркер:
+python -m tasks.worker facts
+Задачи складываются в FactExtractionQueue внутри воркера, которая копит их
+(дебаунс) и отправляет пачками — один LLM-вызов на много сообщений.
+"""
+
+import logging
+
+from taskiq import TaskiqEvents, TaskiqState
+
+from .broker import facts_broker
+
+logger = logging.getLogger(__name__)
+
+if facts_broker:
+
+    @facts_broker.on_event(TaskiqEvents.WORKER_STARTUP)
+    async def _startup(_state: TaskiqState) -> None:
+        from database import db
+        from services.memory import fact_queue
+
+        await db.init()
+        await fact_queue.start()
+
+    @facts_broker.on_event(TaskiqEvents.WORKER_SHUTDOWN)
+    async def _shutdown(_state: TaskiqState) -> None:
+        from database import db
+        from services.memory import fact_queue
+
+        await fact_queue.stop()
+        await db.close()
+
+    @facts_broker.task
+    async def extract_facts_task(user_id: int, user_message: str) -> None:
+        """Фоновая задача: поставить сообщение в пакетную очередь извлечения фактов."""
+        from services.memory import fact_queue
+
+        if not fact_queue.submit(user_id, user_message):
+            logger.debug("Fact task dropped for user_id=%s", user_id)
+else:
+    extract_facts_task = None  # type: ignore
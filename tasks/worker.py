@@ -1,6 +1,9 @@
 """
 Taskiq worker — запуск: python -m tasks.worker
 Эквивалентно: taskiq worker tasks.broker:broker tasks.image_tasks
+
+Воркер фактов (низкий приоритет, свой лимит параллельности): python -m tasks.worker facts
+Эквивалентно: taskiq worker tasks.broker:facts_broker tasks.memory_tasks -w 1 --max-async-tasks 2
 """
 
 import subprocess
@@ -11,20 +14,29 @@ import structlog
 logger = structlog.get_logger(__name__)
 
 if __name__ == "__main__":
-    from .broker import broker
+    from .broker import broker, facts_broker
+
+    if len(sys.argv) > 1 and sys.argv[1] == "facts":
+        import config
+
+        target = facts_broker
+        args = [
+            "tasks.broker:facts_broker",
+            "tasks.memory_tasks",
+            "--workers",
+            "1",
+            "--max-async-tasks",
+            str(getattr(config, "FACT_WORKERS", 2)),
+        ]
+    else:
+        target = broker
+        args = ["tasks.broker:broker", "tasks.image_tasks"]
 
-    if broker is None:
+    if target is None:
         logger.error("worker_start_failed", reason="Redis недоступен")
         sys.exit(1)
     rc = subprocess.run(
-        [
-            sys.executable,
-            "-m",
-            "taskiq",
-            "worker",
-            "tasks.broker:broker",
-            "tasks.image_tasks",
-        ],
+        [sys.executable, "-m", "taskiq", "worker", *args],
         check=False,
     )
     sys.exit(rc.returncode)
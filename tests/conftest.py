@@ -4,6 +4,7 @@ Pytest conftest: общие фикстуры и настройка путей.
 
 import os
 import sys
+from contextlib import asynccontextmanager
 
 import pytest
 
@@ -35,3 +36,34 @@ def mock_db():
     from tests.mocks import make_mock_db
 
     return make_mock_db()
+
+
+@asynccontextmanager
+async def _real_database(url: str, **init_kwargs):
+    from tests.mocks import real_modules
+
+    with real_modules():
+        from database.db import Database
+
+        database = Database()
+        database.profiles.use_redis = False
+        await database.init(url, **init_kwargs)
+        try:
+            yield database
+        finally:
+            await database.close()
+
+
+@pytest.fixture
+async def real_db(tmp_path):
+    """Настоящая Database на файле SQLite (WAL и писатель, как в проде), без Redis"""
+    async with _real_database(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}") as database:
+        yield database
+
+
+@pytest.fixture
+async def plain_db(tmp_path):
+    """SQLite без писателя (sqlite_tuned=False): unit of work — одна сессия, как на PostgreSQL"""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
+    async with _real_database(url, sqlite_tuned=False) as database:
+        yield database
@@ -3,15 +3,23 @@
 Использование: вызвать setup_handler_mocks() до импорта handlers.
 """
 
+import asyncio
+import importlib
+import importlib.util
+import os
 import sys
 import types
+from contextlib import contextmanager
 from unittest.mock import AsyncMock, MagicMock
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 def make_mock_db():
     mock = MagicMock()
     mock.update_stats = AsyncMock()
     mock.get_user = AsyncMock(return_value=None)
+    mock.get_user_profile = AsyncMock(return_value=MagicMock(exists=False, persona="assistant"))
     mock.get_user_messages = AsyncMock(return_value=[])
     mock.add_message = AsyncMock()
     mock.is_banned = AsyncMock(return_value=False)
@@ -43,6 +51,9 @@ def make_telegram_mocks():
     telegram.error = types.ModuleType("telegram.error")
     telegram.error.NetworkError = Exception
     telegram.error.BadRequest = Exception
+    telegram.error.TelegramError = Exception
+    telegram.error.Forbidden = type("Forbidden", (Exception,), {})
+    telegram.error.RetryAfter = type("RetryAfter", (Exception,), {"retry_after": 1})
     telegram.ext = types.ModuleType("telegram.ext")
     telegram.Update = MagicMock()
     telegram.InlineKeyboardButton = MagicMock()
@@ -56,6 +67,237 @@ def make_telegram_mocks():
     return telegram
 
 
+# Пакеты проекта: при изолированной загрузке импортируются заново
+PROJECT_PACKAGES = (
+    "admin",
+    "benchmarks",
+    "config",
+    "database",
+    "handlers",
+    "middlewares",
+    "migrate_data",
+    "services",
+    "tasks",
+    "utils",
+)
+# Модули, которые нельзя импортировать повторно: utils.metrics регистрирует метрики
+# в глобальном реестре prometheus_client
+SHARED_MODULES = ("utils.metrics",)
+_shared = {}
+
+
+def _is_stub(module) -> bool:
+    return isinstance(module, MagicMock) or getattr(module, "__spec__", None) is None
+
+
+def _remember_shared(modules) -> None:
+    for name in SHARED_MODULES:
+        module = modules.get(name)
+        if module is not None and not _is_stub(module):
+            _shared.setdefault(name, module)
+
+
+def _restore_modules(saved, roots) -> None:
+    """Вернуть sys.modules: пакеты roots — как в saved, общие модули остаются загруженными"""
+    _remember_shared(sys.modules)
+    for module_name in list(sys.modules):
+        if module_name not in saved and module_name.split(".")[0] in roots:
+            del sys.modules[module_name]
+    sys.modules.update(saved)
+    for module_name, module in _shared.items():
+        sys.modules.setdefault(module_name, module)
+
+
+def _exec_file(relative_path: str, name: str):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_isolated(relative_path: str, name: str, stubs=None, real_telegram: bool = False):
+    """
+    Загрузить модуль проекта по пути независимо от моков других тестов и без .env:
+    пакеты проекта импортируются заново, config и database — моки (make_mock_config,
+    make_mock_db; database.redis_cache — настоящий), stubs — {имя: модуль} поверх;
+    с real_telegram — настоящий python-telegram-bot. После загрузки sys.modules возвращается как был, модуль держит
+    свои зависимости сам. Возвращает (telegram, модуль).
+    """
+    saved = dict(sys.modules)
+    roots = PROJECT_PACKAGES + ("telegram",)
+    _remember_shared(saved)
+    try:
+        for module_name in list(sys.modules):
+            root = module_name.split(".")[0]
+            if root in PROJECT_PACKAGES or (real_telegram and root == "telegram"):
+                del sys.modules[module_name]
+        database = MagicMock()
+        database.db = make_mock_db()
+        sys.modules.update({"config": make_mock_config(), "database": database})
+        sys.modules["database.db"] = database.db
+        # Без зависимостей от проекта — настоящий (кэши и счётчики наследуют его классы)
+        sys.modules["database.redis_cache"] = _exec_file("database/redis_cache.py", "redis_cache")
+        sys.modules.update(_shared)
+        sys.modules.update(stubs or {})
+        telegram = importlib.import_module("telegram") if real_telegram else None
+        return telegram, _exec_file(relative_path, name)
+    finally:
+        _restore_modules(saved, roots + tuple((stubs or {}).keys()))
+
+
+def load_with_real_telegram(relative_path: str, name: str):
+    """load_isolated с настоящим python-telegram-bot: другие тесты подменяют telegram"""
+    return load_isolated(relative_path, name, real_telegram=True)
+
+
+# Сторонние пакеты, которые тесты подменяют моками (setup_core_mocks, make_telegram_mocks)
+STUBBED_PACKAGES = (
+    "httpx",
+    "pydantic",
+    "pydantic_settings",
+    "redis",
+    "sqlalchemy",
+    "structlog",
+    "telegram",
+)
+# Окружение настоящего config: без .env; Redis на закрытом порту — отказ сразу, без ожидания
+REAL_ENV = {
+    "TELEGRAM_BOT_TOKEN": "test_token",
+    "ARTEMOX_API_KEY": "test_key",
+    "REDIS_URL": "redis://127.0.0.1:1/0",
+}
+_real = {}
+
+
+@contextmanager
+def real_modules():
+    """
+    Настоящие пакеты проекта и зависимостей вместо моков других тестов (тесты на реальной
+    SQLite). Внутри блока import database / config даёт настоящие модули; они загружаются
+    один раз за сессию pytest и переиспользуются. При выходе sys.modules и окружение
+    возвращаются как были.
+    """
+    saved, saved_env = dict(sys.modules), dict(os.environ)
+    roots = PROJECT_PACKAGES + STUBBED_PACKAGES
+    _remember_shared(saved)
+    stubbed = {
+        name.split(".")[0]
+        for name, module in saved.items()
+        if name.split(".")[0] in STUBBED_PACKAGES and _is_stub(module)
+    }
+    try:
+        for module_name in list(sys.modules):
+            root = module_name.split(".")[0]
+            if root in PROJECT_PACKAGES or root in stubbed:
+                del sys.modules[module_name]
+        sys.modules.update(_real)
+        sys.modules.update(_shared)
+        os.environ.update(REAL_ENV)
+        yield
+    finally:
+        for module_name, module in sys.modules.items():
+            if module_name.split(".")[0] in roots and not _is_stub(module):
+                _real[module_name] = module
+        os.environ.clear()
+        os.environ.update(saved_env)
+        _restore_modules(saved, roots)
+
+
+class FakePubSub:
+    def __init__(self, redis: "FakeRedis") -> None:
+        self.redis = redis
+
+    async def subscribe(self, channel):
+        self.redis.subscribed.set()
+
+    async def listen(self):
+        while True:
+            yield {"type": "message", "data": await self.redis.messages.get()}
+
+    async def aclose(self):
+        pass
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis") -> None:
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append(getattr(self.redis, name)(*args, **kwargs))
+
+    async def execute(self):
+        return [await call for call in self.calls]
+
+
+class FakeRedis:
+    """
+    Redis в памяти: строки, множества (и HyperLogLog поверх них), срок жизни (expire_at),
+    pipeline; publish пишет в published, messages — входящие pub/sub
+    """
+
+    def __init__(self) -> None:
+        self.store = {}
+        self.sets = {}
+        self.expire_at = {}
+        self.published = []
+        self.messages = asyncio.Queue()
+        self.subscribed = asyncio.Event()
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def mget(self, *keys):
+        if len(keys) == 1 and isinstance(keys[0], list):
+            keys = keys[0]
+        return [self.store.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key] = str(value)
+        return True
+
+    async def delete(self, key):
+        self.store.pop(key, None)
+
+    async def incrby(self, key, amount):
+        self.store[key] = str(int(self.store.get(key, 0)) + amount)
+        return int(self.store[key])
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def expireat(self, key, when):
+        self.expire_at[key] = when
+
+    async def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(str(m) for m in members)
+
+    async def spop(self, key, count):
+        members = self.sets.get(key, set())
+        return [members.pop() for _ in range(min(count, len(members)))]
+
+    async def expire(self, key, seconds):
+        self.expire_at[key] = seconds
+
+    async def pfadd(self, key, *members):
+        await self.sadd(key, *members)
+
+    async def pfcount(self, *keys):
+        """Точное число уникальных (HyperLogLog Redis — оценка)"""
+        return len(set().union(*(self.sets.get(key, set()) for key in keys)))
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def publish(self, channel, data):
+        self.published.append((channel, data))
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+
 def setup_core_mocks():
     """Базовые моки: sqlalchemy, pydantic, redis, structlog, database, config."""
     sys.modules.setdefault("sqlalchemy", MagicMock())
@@ -98,9 +340,11 @@ def setup_handler_mocks():
     sys.modules["middlewares.usage_limit"].check_can_make_request = AsyncMock(
         return_value=(True, "")
     )
+    sys.modules["middlewares.usage_limit"].record_usage = AsyncMock(return_value=1)
     sys.modules.setdefault("middlewares.ban_check", MagicMock())
     _mem = MagicMock()
     _mem.extract_and_save_facts = AsyncMock()
+    _mem.schedule_fact_extraction = AsyncMock(return_value=True)
     sys.modules.setdefault("services.memory", _mem)
     sys.modules.setdefault("services.rag", MagicMock())
     return mock_db, mock_config
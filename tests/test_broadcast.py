@@ -0,0 +1,217 @@
+"""
+Тесты для services.broadcast и utils.token_bucket: темп, общая пауза по RetryAfter, статус,
+классификация ошибок отправки и продолжение рассылки с чекпоинта.
+"""
+
+import asyncio
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from tests.mocks import load_with_real_telegram
+
+_, broadcast = load_with_real_telegram("services/broadcast.py", "broadcast")
+# utils.token_bucket — через модуль рассылки: пакет utils тянет telegram
+BroadcastProgress, TokenBucket = broadcast.BroadcastProgress, broadcast.TokenBucket
+BadRequest, Forbidden = broadcast.BadRequest, broadcast.Forbidden
+RetryAfter = broadcast.RetryAfter
+
+
+class TestTokenBucket:
+    async def test_rate_limits_concurrent_senders(self):
+        bucket = TokenBucket(rate=50)
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(11)))
+        # Первый токен — из запаса, остальные 10 — по 1/50 с
+        assert time.monotonic() - started >= 0.19
+
+    async def test_pause_blocks_all_senders(self):
+        bucket = TokenBucket(rate=1000)
+        await bucket.acquire()
+        bucket.pause(0.2)
+        started = time.monotonic()
+        await asyncio.gather(bucket.acquire(), bucket.acquire())
+        assert time.monotonic() - started >= 0.2
+
+    async def test_try_acquire_does_not_wait(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        assert bucket.try_acquire() and bucket.try_acquire()
+        assert not bucket.try_acquire()
+
+
+def test_progress_status_text():
+    progress = BroadcastProgress(broadcast_id=7, total=10, sent=3, blocked=1, failed=1)
+    text = progress.status_text()
+    assert "#7" in text and "5 из 10 (50%)" in text
+    assert "приостановлена" in progress.status_text(paused=True)
+
+
+class FakeBot:
+    """send_message: errors[chat_id] — исключения по очереди попыток, затем успех"""
+
+    def __init__(self, errors=None) -> None:
+        self.errors = {chat_id: list(items) for chat_id, items in (errors or {}).items()}
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        pending = self.errors.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+        self.delivered.append(chat_id)
+        return SimpleNamespace(message_id=len(self.delivered))
+
+    async def edit_message_text(self, text, chat_id, message_id):
+        pass
+
+
+class FakeBroadcastDB:
+    """Получатели — [(users.id, telegram_id)]; iter_telegram_ids — keyset по users.id"""
+
+    def __init__(self, users) -> None:
+        self.users = users
+        self.saved = []
+        self.blocked = []
+        self.save_errors = []  # исключения следующих save_broadcast_progress
+
+    async def iter_telegram_ids(self, batch_size, filters=None, after_id=0):
+        rows = [row for row in self.users if row[0] > after_id]
+        for i in range(0, len(rows), batch_size):
+            chunk = rows[i : i + batch_size]
+            yield SimpleNamespace(telegram_ids=[tid for _, tid in chunk], cursor=chunk[-1][0])
+
+    async def save_broadcast_progress(self, broadcast_id, cursor, sent, blocked, failed, **kw):
+        if self.save_errors:
+            raise self.save_errors.pop(0)
+        self.saved.append((cursor, sent, blocked, failed, kw.get("status")))
+
+    async def set_users_bot_blocked(self, telegram_ids, blocked=True):
+        self.blocked.extend(telegram_ids)
+        return len(telegram_ids)
+
+
+def make_engine(**kwargs) -> "broadcast.BroadcastEngine":
+    params = dict(
+        rate=1000,
+        concurrency=2,
+        batch_size=2,
+        status_interval=10,
+        max_attempts=3,
+        batch_retries=2,
+        retry_base=0.01,
+        retry_max=0.05,
+    )
+    params.update(kwargs)
+    engine = broadcast.BroadcastEngine(**params)
+    engine._configure()
+    return engine
+
+
+@pytest.fixture(autouse=True)
+def metrics(monkeypatch):
+    monkeypatch.setattr(broadcast, "record_broadcast_message", MagicMock())
+    monkeypatch.setattr(broadcast, "record_broadcast_flood_wait", MagicMock())
+
+
+class TestDeliver:
+    async def test_retry_after_pauses_bucket(self, monkeypatch):
+        engine = make_engine()
+        pause = MagicMock(wraps=engine._bucket.pause)
+        monkeypatch.setattr(engine._bucket, "pause", pause)
+        bot = FakeBot({1: [RetryAfter(timedelta(milliseconds=50))]})
+        started = time.monotonic()
+        assert await engine._deliver(bot, 1, "текст") == broadcast.OUTCOME_SENT
+        pause.assert_called_once_with(0.05)
+        assert time.monotonic() - started >= 0.05
+        broadcast.record_broadcast_flood_wait.assert_called_once()
+
+    @pytest.mark.parametrize(
+        "error, outcome",
+        [
+            (Forbidden("Forbidden: bot was blocked by the user"), broadcast.OUTCOME_BLOCKED),
+            (BadRequest("Chat not found"), broadcast.OUTCOME_BLOCKED),
+            (BadRequest("Can't parse entities"), broadcast.OUTCOME_FAILED),
+        ],
+    )
+    async def test_error_outcome(self, error, outcome):
+        bot = FakeBot({1: [error]})
+        assert await make_engine()._deliver(bot, 1, "текст") == outcome
+        assert bot.delivered == []
+
+
+def make_record(**kwargs):
+    values = dict(
+        id=1,
+        text="Новости",
+        admin_chat_id=100,
+        total=5,
+        status_message_id=None,
+        cursor=0,
+        sent=0,
+        blocked=0,
+        failed=0,
+    )
+    values.update(kwargs)
+    return SimpleNamespace(**values)
+
+
+USERS = [(10, 1), (11, 2), (12, 3), (13, 4), (14, 5)]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeBroadcastDB(USERS)
+    monkeypatch.setattr(broadcast, "db", fake)
+    return fake
+
+
+async def run(bot, record):
+    progress = BroadcastProgress(
+        broadcast_id=record.id, total=record.total, cursor=record.cursor, sent=record.sent
+    )
+    await make_engine()._run(bot, record, progress)
+    return progress
+
+
+class TestRun:
+    async def test_resume_from_cursor(self, fake_db):
+        bot = FakeBot({4: [Forbidden("Forbidden: user is deactivated")]})
+        # До перезапуска доставлены первые две записи (users.id <= 11)
+        progress = await run(bot, make_record(cursor=11, sent=2))
+
+        assert sorted(bot.delivered) == [3, 5]
+        assert fake_db.blocked == [4]
+        assert fake_db.saved == [
+            (13, 3, 1, 0, None),
+            (14, 4, 1, 0, None),
+            (14, 4, 1, 0, broadcast.STATUS_DONE),
+        ]
+        assert progress.state == broadcast.STATUS_DONE
+
+    async def test_deliver_error_retries_batch_without_duplicates(self, fake_db):
+        # Не TelegramError (сбой клиента) — пачка повторяется, отправленным второй раз не шлём
+        bot = FakeBot({4: [OSError("connection reset")]})
+        progress = await run(bot, make_record())
+
+        assert sorted(bot.delivered) == [1, 2, 3, 4, 5]
+        assert fake_db.saved[-1] == (14, 5, 0, 0, broadcast.STATUS_DONE)
+        assert progress.state == broadcast.STATUS_DONE
+
+    async def test_checkpoint_error_retries_batch_without_duplicates(self, fake_db):
+        fake_db.save_errors = [OSError("database is locked")]
+        bot = FakeBot()
+        progress = await run(bot, make_record())
+
+        assert sorted(bot.delivered) == [1, 2, 3, 4, 5]
+        assert [cursor for cursor, *_ in fake_db.saved] == [11, 13, 14, 14]
+        assert progress.state == broadcast.STATUS_DONE
+
+    async def test_paused_after_retries(self, fake_db):
+        fake_db.save_errors = [OSError("database is locked")] * 3  # первая попытка + 2 повтора
+        progress = await run(FakeBot(), make_record())
+
+        assert progress.state == broadcast.STATUS_PAUSED
+        assert fake_db.saved == [(0, 2, 0, 0, broadcast.STATUS_PAUSED)]
+        assert "/broadcast resume" in progress.status_text()
@@ -110,7 +110,7 @@ async def test_handle_message_rate_limit():
     with (
         patch("handlers.chat.db", mock_db),
         patch("handlers.chat.rate_limit_middleware", mock_rate),
-        patch("handlers.chat.extract_and_save_facts", AsyncMock()),
+        patch("handlers.chat.schedule_fact_extraction", AsyncMock()),
     ):
         await handle_message(update, context)
     update.message.reply_text.assert_called_once()
@@ -133,7 +133,7 @@ async def test_handle_message_usage_limit():
             "handlers.chat.rate_limit_middleware",
             MagicMock(check_rate_limit=AsyncMock(return_value=True)),
         ),
-        patch("handlers.chat.extract_and_save_facts", AsyncMock()),
+        patch("handlers.chat.schedule_fact_extraction", AsyncMock()),
         patch("handlers.chat.check_can_make_request", mock_check),
     ):
         await handle_message(update, context)
@@ -166,11 +166,11 @@ async def test_handle_message_stream_then_reply():
             MagicMock(check_rate_limit=AsyncMock(return_value=True)),
         ),
         patch("handlers.chat.check_can_make_request", AsyncMock(return_value=(True, ""))),
-        patch("handlers.chat.extract_and_save_facts", AsyncMock()),
+        patch("handlers.chat.schedule_fact_extraction", AsyncMock()),
         patch("handlers.chat.get_rag_context", mock_rag),
         patch("handlers.chat.gemini_service", mock_gemini),
         patch("handlers.chat.track", MagicMock()),
-        patch("handlers.chat.sanitize_markdown", lambda x: x),
+        patch("handlers.chat.markdown_to_html", lambda x: x),
     ):
         await handle_message(update, context)
 
@@ -48,6 +48,9 @@ telegram = types.ModuleType("telegram")
 telegram.error = types.ModuleType("telegram.error")
 telegram.error.NetworkError = Exception
 telegram.error.BadRequest = Exception
+telegram.error.TelegramError = Exception
+telegram.error.Forbidden = type("Forbidden", (Exception,), {})
+telegram.error.RetryAfter = type("RetryAfter", (Exception,), {"retry_after": 1})
 telegram.ext = types.ModuleType("telegram.ext")
 telegram.ext.ContextTypes = MagicMock()
 telegram.Update = MagicMock()
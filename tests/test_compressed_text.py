@@ -0,0 +1,37 @@
+"""
+Тесты для database.compressed_text: формат значения колонки и совместимость со старыми строками.
+"""
+
+from tests.mocks import real_modules
+
+with real_modules():
+    from database import compressed_text
+
+COMPRESS_THRESHOLD_BYTES = compressed_text.COMPRESS_THRESHOLD_BYTES
+decode_text = compressed_text.decode_text
+encode_text = compressed_text.encode_text
+
+LONG_REPLY = (
+    "Давайте разберём по шагам:\n\n1. **Установка.** Сначала установите зависимости.\n" * 20
+)
+
+
+class TestCompressedText:
+    def test_short_text_stored_as_utf8(self):
+        assert encode_text("Привет") == "Привет".encode("utf-8")
+        assert decode_text(encode_text("Привет")) == "Привет"
+
+    def test_long_text_compressed(self):
+        encoded = encode_text(LONG_REPLY)
+        assert len(LONG_REPLY.encode("utf-8")) >= COMPRESS_THRESHOLD_BYTES
+        assert len(encoded) < len(LONG_REPLY.encode("utf-8")) // 4
+        assert decode_text(encoded) == LONG_REPLY
+
+    def test_marker_bytes_escaped(self):
+        for value in ("", "\x00abc", "\x01abc"):
+            assert decode_text(encode_text(value)) == value
+
+    def test_legacy_values(self):
+        # Строки до миграции 011: str (SQLite) и UTF-8 без маркера (PostgreSQL после convert_to)
+        assert decode_text("старая строка") == "старая строка"
+        assert decode_text(memoryview("старая строка".encode("utf-8"))) == "старая строка"
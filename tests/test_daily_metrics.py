@@ -0,0 +1,86 @@
+"""
+Тесты для database.daily_metrics: сброс счётчиков (возврат в буфер при ошибке БД) и
+пересчёт dau / mau — HyperLogLog Redis или COUNT(DISTINCT) по messages.
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from tests.mocks import FakeRedis, real_modules
+
+with real_modules():
+    from database import daily_metrics
+
+TODAY = daily_metrics.day_of(datetime.utcnow())
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(daily_metrics, "get_redis", AsyncMock(return_value=fake))
+    return fake
+
+
+class TestFlush:
+    async def test_returned_to_buffer_on_db_error(self, redis):
+        db = SimpleNamespace(increment_daily_metrics=AsyncMock(side_effect=OSError("db down")))
+        buffer = daily_metrics.DailyMetricsBuffer(db)
+        await buffer.record(daily_metrics.METRIC_REQUESTS, 2, user_id=1)
+        with pytest.raises(OSError):
+            await buffer.flush()
+        await buffer.record(daily_metrics.METRIC_REQUESTS, 3)  # пришло, пока БД лежала
+
+        db.increment_daily_metrics.side_effect = None
+        assert await buffer.flush() == 1
+        db.increment_daily_metrics.assert_awaited_with(
+            {(TODAY, daily_metrics.METRIC_REQUESTS, ""): 5}
+        )
+        assert len(buffer) == 0
+        assert await redis.pfcount(daily_metrics.hll_key(TODAY)) == 1  # активный не потерян
+
+    async def test_active_users_to_hll(self, redis):
+        buffer = daily_metrics.DailyMetricsBuffer(
+            SimpleNamespace(increment_daily_metrics=AsyncMock())
+        )
+        for user_id in (1, 2, 1):
+            await buffer.record(daily_metrics.METRIC_MESSAGES, 1, "user", user_id)
+        await buffer.flush()
+        assert await redis.pfcount(daily_metrics.hll_key(TODAY)) == 2
+        assert redis.expire_at[daily_metrics.hll_key(TODAY)] == daily_metrics.HLL_TTL_SEC
+
+
+async def write_messages(database, user_ids):
+    for user_id in user_ids:
+        await database.add_message(user_id, "user", "Привет")
+    await database.message_buffer.flush()
+
+
+class TestRollup:
+    async def test_falls_back_to_messages_before_hll_coverage(self, plain_db, redis):
+        await write_messages(plain_db, (1, 2, 2))
+        await redis.pfadd(daily_metrics.hll_key(TODAY), 99)  # не покрывает день целиком
+
+        result = await daily_metrics.run_daily_rollup(plain_db)
+        assert result[f"dau:{TODAY}"] == 2
+        assert result[f"mau:{TODAY}"] == 2
+        # Первый запуск: HyperLogLog считается полным только с завтрашнего дня
+        tomorrow = daily_metrics.day_of(datetime.utcnow() + timedelta(days=1))
+        assert redis.store[daily_metrics.HLL_SINCE_KEY] == tomorrow
+
+    async def test_uses_hll_when_covered(self, plain_db, redis):
+        month_ago = datetime.utcnow() - timedelta(days=daily_metrics.MAU_WINDOW_DAYS)
+        redis.store[daily_metrics.HLL_SINCE_KEY] = daily_metrics.day_of(month_ago)
+        await write_messages(plain_db, (1, 2))  # сброс буфера добавит их в HLL дня
+        await redis.pfadd(daily_metrics.hll_key(TODAY), 99)
+        yesterday = daily_metrics.day_of(datetime.utcnow() - timedelta(days=1))
+        await redis.pfadd(daily_metrics.hll_key(yesterday), 1, 50)
+
+        result = await daily_metrics.run_daily_rollup(plain_db)
+        assert result[f"dau:{TODAY}"] == 3
+        assert result[f"dau:{yesterday}"] == 2
+        assert result[f"mau:{TODAY}"] == 4
+        rows = await plain_db.get_daily_metrics(daily_metrics.METRIC_DAU, yesterday)
+        assert rows == [(yesterday, "", 2), (TODAY, "", 3)]
@@ -0,0 +1,280 @@
+"""
+Тесты Database на реальной SQLite (фикстуры real_db, plain_db): атомарные upsert-счётчики,
+пользователи и факты, подключение админки, unit of work, write-behind буфер истории
+сообщений.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+
+async def count_rows(database, model_name: str) -> int:
+    from sqlalchemy import func, select
+
+    from database import models
+
+    async with database.read_only_session() as session:
+        return await session.scalar(select(func.count()).select_from(getattr(models, model_name)))
+
+
+class TestCounters:
+    async def test_increment_daily_usage_upserts_one_row(self, real_db):
+        assert await real_db.increment_daily_usage(1, "2026-01-01") == 1
+        assert await real_db.increment_daily_usage(1, "2026-01-01") == 2
+        assert await real_db.get_daily_usage(1, "2026-01-01") == 2
+
+        assert await count_rows(real_db, "UsageDaily") == 1
+
+    async def test_update_stats_sums_counters(self, real_db):
+        await real_db.update_stats(1, requests_count=1, tokens_used=100, command="start")
+        await real_db.update_stats(1, requests_count=1, tokens_used=50, images_generated=1)
+        await real_db.update_stats(1, command="start")
+
+        stats = await real_db.get_stats(1)
+        assert (stats.requests_count, stats.tokens_used, stats.images_generated) == (2, 150, 1)
+        assert await real_db.get_command_usage(1) == {"start": 2}
+
+        assert await count_rows(real_db, "Stats") == 1
+
+
+class TestUsers:
+    async def test_get_user_has_bot_blocked_at(self, real_db):
+        await real_db.create_or_update_user(1, username="nick")
+        assert (await real_db.get_user(1)).bot_blocked_at is None
+
+        assert await real_db.set_users_bot_blocked([1]) == 1
+        assert (await real_db.get_user(1)).bot_blocked_at is not None
+        await real_db.set_users_bot_blocked([1], blocked=False)
+        assert (await real_db.get_user(1)).bot_blocked_at is None
+
+
+class TestInitAdmin:
+    @pytest.fixture
+    async def admin_db(self, real_db):
+        from tests.mocks import real_modules
+
+        with real_modules():
+            from database.db import Database
+
+            database = Database()
+            database.profiles.use_redis = False
+            await database.init_admin(str(real_db.engine.url))
+            try:
+                yield database
+            finally:
+                await database.close()
+
+    async def test_no_schema_writer_or_buffers(self, tmp_path):
+        from tests.mocks import real_modules
+
+        with real_modules():
+            from sqlalchemy import text
+
+            from database.db import Database
+
+            database = Database()
+            await database.init_admin(f"sqlite+aiosqlite:///{tmp_path / 'admin.db'}")
+        try:
+            assert database.writer is None
+            assert database.message_buffer._task is None
+            assert database.read_engine is not database.engine
+            async with database.engine.connect() as conn:
+                tables = await conn.execute(text("SELECT name FROM sqlite_master"))
+                assert tables.all() == []
+        finally:
+            await database.close()
+
+    async def test_reads_and_writes_next_to_bot(self, real_db, admin_db):
+        from tests.mocks import real_modules
+
+        with real_modules():
+            from sqlalchemy import text
+
+        await real_db.create_or_update_user(1, username="nick")
+        assert (await admin_db.get_overview_totals())["users"] == 1
+
+        await admin_db.ban_user(1)  # основной пул, рядом с писателем бота
+        assert (await real_db.get_user(1)).is_banned
+        with pytest.raises(Exception, match="readonly"):
+            async with admin_db.read_only_session() as session:
+                await session.execute(text("DELETE FROM users"))
+
+
+class TestUserFacts:
+    async def test_update_refreshes_value_and_order(self, real_db):
+        await real_db.upsert_user_facts(1, {"name": "Николай", "city": "Москва"})
+        await asyncio.sleep(0.01)
+        await real_db.upsert_user_facts(1, {"name": "Коля"})
+
+        facts = await real_db.get_user_facts(1)
+        assert [(f.fact_type, f.fact_value) for f in facts] == [
+            ("name", "Коля"),
+            ("city", "Москва"),
+        ]
+        # Обновление — та же строка (user_id, fact_type) с новым created_at
+        assert facts[0].created_at > facts[1].created_at
+
+    async def test_batch_upserts_each_user(self, real_db):
+        assert await real_db.upsert_user_facts_batch({1: {"job": "врач"}, 2: {"age": "30"}}) == 2
+        assert await real_db.upsert_user_facts_batch({1: {"job": "учитель"}}) == 1
+        assert [(f.fact_type, f.fact_value) for f in await real_db.get_user_facts(1)] == [
+            ("job", "учитель")
+        ]
+        assert [f.fact_value for f in await real_db.get_user_facts(2)] == ["30"]
+
+
+class TestUnitOfWork:
+    async def test_failed_method_rolls_back_only_itself(self, plain_db):
+        ran = []
+        async with plain_db.unit_of_work():
+            await plain_db.add_user_fact(1, "name", "Николай")
+            await plain_db._after_commit(self._record, ran, "name")
+            with pytest.raises(Exception):
+                await plain_db.add_favorite(1, None)  # NOT NULL: метод падает
+            await plain_db.add_user_fact(1, "city", "Москва")
+            assert ran == []  # callback — только после COMMIT
+        assert ran == ["name"]
+        facts = await plain_db.get_user_facts(1)
+        assert sorted(f.fact_type for f in facts) == ["city", "name"]
+        assert await plain_db.get_user_favorites(1) == []
+
+    async def test_exception_rolls_back_everything(self, plain_db):
+        ran = []
+        with pytest.raises(RuntimeError):
+            async with plain_db.unit_of_work():
+                await plain_db.add_user_fact(1, "name", "Николай")
+                await plain_db._after_commit(self._record, ran, "name")
+                raise RuntimeError("handler failed")
+        assert ran == []
+        assert await plain_db.get_user_facts(1) == []
+
+    async def test_checkpoint_commits_and_runs_callbacks(self, plain_db):
+        ran = []
+        with pytest.raises(RuntimeError):
+            async with plain_db.unit_of_work():
+                await plain_db.add_user_fact(1, "name", "Николай")
+                await plain_db._after_commit(self._record, ran, "name")
+                await plain_db.checkpoint()
+                assert ran == ["name"]
+                await plain_db.add_user_fact(1, "city", "Москва")
+                raise RuntimeError("handler failed")
+        assert [f.fact_type for f in await plain_db.get_user_facts(1)] == ["name"]
+
+    async def test_child_task_does_not_share_session(self, plain_db):
+        async with plain_db.unit_of_work():
+            await plain_db.add_user_fact(1, "name", "Николай")
+            assert len(await plain_db.get_user_facts(1)) == 1
+            # Задача, созданная внутри апдейта, работает в своей сессии: незакоммиченного
+            # она не видит и не закоммитит и не откатит чужую транзакцию
+            assert await asyncio.create_task(plain_db.get_user_facts(1)) == []
+        assert len(await plain_db.get_user_facts(1)) == 1
+
+    @staticmethod
+    async def _record(ran, name):
+        ran.append(name)
+
+
+def make_buffer(database, **kwargs):
+    """Свой буфер без фонового сброса: flush вызывает тест"""
+    from database.db import MessageWriteBuffer
+
+    params = dict(maxsize=100, batch_size=100, flush_interval=0, max_attempts=3)
+    params.update(kwargs)
+    return MessageWriteBuffer(database, **params)
+
+
+def operational_error():
+    from sqlalchemy.exc import OperationalError
+
+    return OperationalError("INSERT", {}, Exception("database is down"))
+
+
+class TestMessageWriteBuffer:
+    async def test_read_your_writes(self, real_db):
+        await real_db.add_message(1, "user", "Привет")
+        await real_db.add_message(1, "assistant", "Здравствуйте")
+        assert len(real_db.message_buffer) == 2
+        history = [(m.role, m.content) for m in await real_db.get_user_messages(1)]
+        assert history == [("user", "Привет"), ("assistant", "Здравствуйте")]
+
+        await real_db.message_buffer.flush()
+        assert len(real_db.message_buffer) == 0
+        assert [(m.role, m.content) for m in await real_db.get_user_messages(1)] == history
+
+    async def test_flush_writes_at_most_batch_size(self, real_db):
+        buffer = make_buffer(real_db, batch_size=2)
+        for i in range(5):
+            await buffer.add(1, "user", f"m{i}")
+        assert await buffer.flush() == 2
+        assert [row["content"] for row in buffer.pending_for(1)] == ["m2", "m3", "m4"]
+
+    async def test_clear_waits_for_flush_in_progress(self, real_db, monkeypatch):
+        buffer = real_db.message_buffer
+        inserting, release = asyncio.Event(), asyncio.Event()
+        insert = buffer._insert
+
+        async def slow_insert(rows):
+            inserting.set()
+            await release.wait()
+            await insert(rows)
+
+        monkeypatch.setattr(buffer, "_insert", slow_insert)
+        await real_db.add_message(1, "user", "старое")
+        flush = asyncio.create_task(buffer.flush())
+        await inserting.wait()
+        await real_db.add_message(2, "user", "пока идёт INSERT")
+        clear = asyncio.create_task(real_db.clear_user_messages(1))
+        await asyncio.sleep(0.01)
+        assert not clear.done()  # очистка ждёт сброс: DELETE не обгонит INSERT
+        release.set()
+        await flush
+        await clear
+        assert await real_db.get_user_messages(1) == []
+        assert [m.content for m in await real_db.get_user_messages(2)] == ["пока идёт INSERT"]
+
+    async def test_bad_row_isolated_and_dropped(self, real_db):
+        buffer = make_buffer(real_db)
+        await buffer.add(1, "user", "до")
+        await buffer.add(1, "user", None)  # NOT NULL: INSERT пачки падает
+        await buffer.add(1, "user", "после")
+        assert await buffer.flush() == 2
+        assert [row["content"] for row in buffer.pending_for(1)] == [None]
+        assert await buffer.flush() == 0 and len(buffer) == 1
+        assert await buffer.flush() == 0 and len(buffer) == 0  # третья неудача — выброшена
+        assert [m.content for m in await real_db.get_user_messages(1)] == ["до", "после"]
+
+    async def test_database_down_keeps_rows(self, real_db, monkeypatch):
+        buffer = make_buffer(real_db)
+        for i in range(3):
+            await buffer.add(1, "user", f"m{i}")
+        calls = []
+
+        async def failing_insert(rows):
+            calls.append(len(rows))
+            raise operational_error()
+
+        monkeypatch.setattr(buffer, "_insert", failing_insert)
+        with pytest.raises(Exception, match="database is down"):
+            await buffer.flush()
+        # Недоступность БД — не повод дробить пачку и выбрасывать строки
+        assert calls == [3] and len(buffer) == 3
+
+    async def test_stop_gives_up_after_max_attempts(self, real_db, monkeypatch):
+        buffer = make_buffer(real_db)
+        buffer.start()
+        await buffer.add(1, "user", "m")
+        monkeypatch.setattr(buffer, "_insert", AsyncMock(side_effect=operational_error()))
+        with pytest.raises(Exception, match="database is down"):
+            await buffer.stop()
+        assert len(buffer) == 1
+
+    async def test_full_buffer_waits_for_background_flush(self, real_db):
+        buffer = make_buffer(real_db, maxsize=2, batch_size=2, flush_interval=60)
+        buffer.start()
+        await buffer.add(1, "user", "m0")
+        await buffer.add(1, "user", "m1")
+        await asyncio.wait_for(buffer.add(1, "user", "m2"), timeout=1)
+        await buffer.stop()
+        assert [m.content for m in await real_db.get_user_messages(1)] == ["m0", "m1", "m2"]
@@ -0,0 +1,53 @@
+"""
+Тесты для services.fact_filter: локальный пре-фильтр фактов и отчёт по размеченной выборке.
+"""
+
+import os
+
+from tests.mocks import load_isolated
+
+# По пути: services/__init__ импортирует gemini → config, сам фильтр от config не зависит
+_, fact_filter = load_isolated("services/fact_filter.py", "fact_filter")
+evaluate, fact_features, fact_score = (
+    fact_filter.evaluate,
+    fact_filter.fact_features,
+    fact_filter.fact_score,
+)
+is_fact_candidate, load_samples = fact_filter.is_fact_candidate, fact_filter.load_samples
+
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), "data", "fact_filter_sample.jsonl")
+
+
+class TestFactFilter:
+    def test_empty_text(self):
+        assert fact_score("") == 0.0
+        assert is_fact_candidate("") is False
+
+    def test_self_description_passes(self):
+        assert is_fact_candidate("Меня зовут Николай, мне 27 лет")
+        assert is_fact_candidate("Я работаю учителем и живу в Казани")
+
+    def test_requests_skipped(self):
+        assert not is_fact_candidate("Напиши код сортировки пузырьком")
+        assert not is_fact_candidate("Переведи это на английский")
+        assert not is_fact_candidate("Я хочу, чтобы ты объяснил мне интегралы")
+
+    def test_features_report_signals(self):
+        features = fact_features("Мне 30 лет")
+        assert "age" in features
+        assert "first_person" in features
+
+    def test_threshold_monotonic(self):
+        text = "Люблю играть в шахматы"
+        assert is_fact_candidate(text, threshold=0.1)
+        assert not is_fact_candidate(text, threshold=0.99)
+
+
+def test_labeled_sample_report():
+    """На размеченной выборке фильтр отсеивает не меньше 40% сообщений без потери точности."""
+    samples = load_samples(SAMPLE_PATH)
+    report = evaluate(samples)
+    assert report.total == len(samples)
+    assert report.skip_rate >= 0.4
+    assert report.precision >= 0.9
+    assert report.recall >= 0.8
@@ -89,7 +89,7 @@ async def test_prepare_messages_context_no_user():
 @pytest.mark.asyncio
 async def test_prepare_messages_context_with_user_mocked():
     mock_db.get_user_messages = AsyncMock(return_value=[])
-    mock_db.get_user = AsyncMock(return_value=MagicMock(persona="assistant"))
+    mock_db.get_user_profile = AsyncMock(return_value=MagicMock(exists=True, persona="assistant"))
     with (
         patch("services.gemini.db", mock_db),
         patch("services.memory.get_relevant_facts", new_callable=AsyncMock, return_value=""),
@@ -125,7 +125,7 @@ async def test_prepare_messages_context_trims_by_max_chars():
             MagicMock(role="assistant", content=long),
         ]
     )
-    mock_db.get_user = AsyncMock(return_value=MagicMock(persona="assistant"))
+    mock_db.get_user_profile = AsyncMock(return_value=MagicMock(exists=True, persona="assistant"))
     with (
         patch("services.gemini.db", mock_db),
         patch("services.memory.get_relevant_facts", new_callable=AsyncMock, return_value=""),
@@ -23,6 +23,7 @@ sys.modules["structlog"] = MagicMock()
 mock_db = MagicMock()
 mock_db.get_user_messages = AsyncMock(return_value=[])
 mock_db.get_user = AsyncMock(return_value=None)
+mock_db.get_user_profile = AsyncMock(return_value=MagicMock(exists=False, persona="assistant"))
 mock_db.add_message = AsyncMock()
 mock_db.update_stats = AsyncMock()
 mock_db.create_or_update_user = AsyncMock()
@@ -0,0 +1,200 @@
+"""
+Тесты для services.memory: фоновая очередь извлечения фактов (переполнение, устаревание,
+ожидание свободных LLM-слотов), ранжирование фактов и индекс фактов с инвалидацией.
+"""
+
+import asyncio
+import types
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from tests.mocks import FakeRedis, load_isolated
+
+llm_common = types.ModuleType("services.llm_common")
+llm_common.llm_semaphore = None  # свой семафор на каждый тест — фикстура llm_slots
+_, redis_cache = load_isolated("database/redis_cache.py", "redis_cache")
+_, memory = load_isolated(
+    "services/memory.py",
+    "memory",
+    stubs={
+        "database.redis_cache": redis_cache,
+        "services.gemini": MagicMock(),
+        "services.image_gen": MagicMock(),
+        "services.llm_common": llm_common,
+    },
+)
+FactExtractionQueue, FactIndex = memory.FactExtractionQueue, memory.FactIndex
+FactRow = types.SimpleNamespace
+
+
+def make_queue(**kwargs) -> FactExtractionQueue:
+    params = dict(maxsize=10, workers=1, max_age_sec=60, batch_window_sec=0, batch_max=10)
+    params.update(kwargs)
+    return FactExtractionQueue(**params)
+
+
+@pytest.fixture
+def extract(monkeypatch):
+    mock = AsyncMock(return_value=1)
+    monkeypatch.setattr(memory, "extract_and_save_facts_batch", mock)
+    return mock
+
+
+@pytest.fixture
+def dropped(monkeypatch):
+    mock = MagicMock()
+    monkeypatch.setattr(memory, "record_fact_dropped", mock)
+    return mock
+
+
+@pytest.fixture(autouse=True)
+def llm_slots(monkeypatch):
+    semaphore = asyncio.Semaphore(1)
+    monkeypatch.setattr(memory, "llm_semaphore", semaphore)
+    return semaphore
+
+
+@pytest.fixture
+async def llm_busy(llm_slots):
+    """Все LLM-слоты чата заняты: фоновые вызовы ждут, пока тест не отпустит семафор"""
+    await llm_slots.acquire()
+    return llm_slots
+
+
+class TestFactExtractionQueue:
+    async def test_not_running_drops(self, dropped):
+        assert make_queue().submit(1, "Меня зовут Николай") is False
+        dropped.assert_called_once_with("not_running")
+
+    async def test_full_queue_drops(self, extract, dropped, llm_busy):
+        queue = make_queue(maxsize=2)
+        await queue.start()
+        accepted = []
+        for user_id in range(10):
+            if queue.submit(user_id, f"Меня зовут Пользователь {user_id}"):
+                accepted.append(user_id)
+            await asyncio.sleep(0)
+        # Воркер ждёт LLM-слот: сверх очереди и пачек в работе задачи отбрасываются
+        assert 2 <= len(accepted) < 10
+        assert dropped.call_args_list == [(("queue_full",),)] * (10 - len(accepted))
+        assert not extract.called
+
+        llm_busy.release()
+        await queue.stop(timeout=2)
+        processed = [uid for call in extract.await_args_list for uid, _ in call.args[0]]
+        assert sorted(processed) == accepted
+
+    async def test_stale_items_skipped(self, extract, dropped, llm_busy):
+        queue = make_queue(max_age_sec=0.05)
+        await queue.start()
+        queue.submit(1, "Меня зовут Николай")
+        await asyncio.sleep(0.1)  # пока слоты заняты, задача устаревает
+        llm_busy.release()
+        await queue.stop(timeout=2)
+        dropped.assert_called_once_with("stale")
+        assert not extract.called
+
+    async def test_batch_dispatched_whole(self, extract):
+        queue = make_queue(workers=2, batch_window_sec=0.05)
+        await queue.start()
+        for user_id in range(5):
+            queue.submit(user_id, "Меня зовут Николай")
+        await queue.stop(timeout=2)
+        # Одна пачка на один LLM-вызов, а не половина пачки на каждого воркера
+        assert extract.await_count == 1
+        assert [uid for uid, _ in extract.await_args.args[0]] == [0, 1, 2, 3, 4]
+
+    async def test_cancel_during_debounce_keeps_accounting(self, extract, dropped):
+        queue = make_queue(batch_window_sec=10)
+        await queue.start()
+        queue.submit(1, "Меня зовут Николай")
+        queue.submit(2, "Мне 30 лет")
+        await asyncio.sleep(0.01)  # сборщик вынул сообщения и ждёт окно дебаунса
+        inner = queue._queue
+        await queue.stop(timeout=0.05)
+        assert dropped.call_args_list == [(("shutdown",),)] * 2
+        await asyncio.wait_for(inner.join(), timeout=0.1)  # task_done сбалансирован
+        assert not extract.called
+
+
+def indexed(fact_type: str, fact_value: str):
+    return memory.IndexedFact(fact_type, fact_value, f"- {fact_value}", memory._stems(fact_value))
+
+
+class TestRanking:
+    facts = [indexed("city", "Москва"), indexed("job", "врач"), indexed("name", "Николай")]
+
+    def test_score_fact(self):
+        query = memory._stems("Какая погода в Москве?")
+        city, job, name = self.facts
+        # Совпадение по значению + ключевое слово типа; имя закреплено
+        assert memory.score_fact(city, query) == 3.0
+        assert memory.score_fact(job, query) == 0.0
+        assert memory.score_fact(name, query) == 0.5
+
+    def test_rank_facts(self):
+        ranked = memory.rank_facts(self.facts, "Какая погода в Москве?", limit=5)
+        assert [f.fact_type for f in ranked] == ["city", "name"]
+        assert memory.rank_facts(self.facts, "", limit=2) == self.facts[:2]
+
+
+@pytest.fixture
+def facts_db(monkeypatch):
+    fake = types.SimpleNamespace(
+        get_user_facts=AsyncMock(return_value=[FactRow(fact_type="city", fact_value="Москва")])
+    )
+    monkeypatch.setattr(memory, "db", fake)
+    return fake
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(redis_cache, "get_redis", AsyncMock(return_value=fake))
+    return fake
+
+
+class TestFactIndex:
+    async def test_cached_until_invalidated(self, facts_db, redis):
+        index = FactIndex()
+        first = await index.get(1)
+        assert [f.line for f in first] == ["- Город: Москва"]
+        assert await index.get(1) is first
+        assert facts_db.get_user_facts.await_count == 1
+
+        await index.invalidate(1)
+        assert redis.published == [(memory.FACT_INDEX_INVALIDATE_CHANNEL, "1")]
+        await index.get(1)
+        assert facts_db.get_user_facts.await_count == 2
+
+    async def test_load_racing_invalidation_not_cached(self, facts_db, redis):
+        index = FactIndex()
+        loaded = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_load(user_id, limit):
+            loaded.set()
+            await release.wait()
+            return [FactRow(fact_type="city", fact_value="Москва")]
+
+        facts_db.get_user_facts.side_effect = slow_load
+        task = asyncio.create_task(index.get(1))
+        await loaded.wait()
+        await index.invalidate(1)  # воркер сохранил факты, пока шла загрузка
+        release.set()
+        await task
+        assert index._entries == {} and index._loading == {}
+
+    async def test_invalidation_from_other_process(self, facts_db, redis):
+        index = FactIndex()
+        await index.get(1)
+        await index.start()
+        await asyncio.wait_for(redis.subscribed.wait(), timeout=1)
+        await index.get(1)
+        redis.messages.put_nowait("1")
+        for _ in range(10):
+            await asyncio.sleep(0)
+        await index.stop()
+        assert 1 not in index._entries
+        assert facts_db.get_user_facts.await_count == 2
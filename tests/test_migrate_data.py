@@ -0,0 +1,182 @@
+"""
+Тесты для migrate_data: потоковый разбор JSON (дочитывание буфера, BOM, значения на
+границе чанков, неизвестные разделы), контрольная точка в транзакции пачки и повторный
+импорт без задвоения.
+"""
+
+import json
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from tests.mocks import real_modules
+
+with real_modules():
+    import migrate_data
+
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), "data", "bot_data_sample.json")
+
+
+def expected_entries():
+    with open(SAMPLE_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    return [
+        (section, key, value)
+        for section, values in data.items()
+        if section in migrate_data.SECTIONS
+        for key, value in values.items()
+    ]
+
+
+class TestJsonSectionReader:
+    @pytest.mark.parametrize("chunk_bytes", [1, 7, 64, migrate_data.READ_CHUNK_BYTES])
+    def test_entries_any_chunk_size(self, chunk_bytes):
+        # Чанк в 1 байт режет каждое значение, число и UTF-8 символ на границе буфера
+        reader = migrate_data.JsonSectionReader(SAMPLE_PATH, chunk_bytes=chunk_bytes)
+        assert list(reader.entries()) == expected_entries()
+        assert reader.bytes_read == reader.size
+
+    def test_unknown_sections_skipped(self):
+        sections = {s for s, _, _ in migrate_data.JsonSectionReader(SAMPLE_PATH, 16).entries()}
+        assert sections == {"settings", "conversations", "stats", "favorites", "achievements"}
+
+    def test_bom(self, tmp_path):
+        path = tmp_path / "bom.json"
+        with open(SAMPLE_PATH, "rb") as f:
+            path.write_bytes(b"\xef\xbb\xbf" + f.read())
+        assert list(migrate_data.JsonSectionReader(str(path), 5).entries()) == expected_entries()
+
+    def test_empty_and_truncated(self, tmp_path):
+        empty = tmp_path / "empty.json"
+        empty.write_text(" { } ")
+        assert list(migrate_data.JsonSectionReader(str(empty)).entries()) == []
+
+        truncated = tmp_path / "truncated.json"
+        with open(SAMPLE_PATH, "rb") as f:
+            truncated.write_bytes(f.read()[:-40])
+        with pytest.raises(ValueError):
+            list(migrate_data.JsonSectionReader(str(truncated), 8).entries())
+
+
+class TestCheckpoint:
+    async def test_save_load_clear(self, plain_db):
+        checkpoint = migrate_data.Checkpoint(SAMPLE_PATH)
+        checkpoint.sections_done, checkpoint.section, checkpoint.entries = ["settings"], "stats", 1
+        async with plain_db.engine.begin() as conn:
+            await checkpoint.save(conn)
+            checkpoint.entries = 2
+            await checkpoint.save(conn)  # upsert по пути файла
+
+        loaded = migrate_data.Checkpoint(SAMPLE_PATH)
+        async with plain_db.engine.begin() as conn:
+            assert await loaded.load(conn)
+        assert (loaded.sections_done, loaded.section, loaded.entries) == (["settings"], "stats", 2)
+
+        async with plain_db.engine.begin() as conn:
+            await loaded.clear(conn)
+            assert not await migrate_data.Checkpoint(SAMPLE_PATH).load(conn)
+
+    async def test_other_file_version_ignored(self, plain_db):
+        checkpoint = migrate_data.Checkpoint(SAMPLE_PATH)
+        checkpoint.size += 1
+        async with plain_db.engine.begin() as conn:
+            await checkpoint.save(conn)
+            assert not await migrate_data.Checkpoint(SAMPLE_PATH).load(conn)
+
+    async def test_rolled_back_with_batch(self, plain_db):
+        checkpoint = migrate_data.Checkpoint(SAMPLE_PATH)
+        checkpoint.section, checkpoint.entries = "settings", 3
+        with pytest.raises(RuntimeError):
+            async with plain_db.engine.begin() as conn:
+                await checkpoint.save(conn)
+                raise RuntimeError("сбой пачки")
+        async with plain_db.engine.begin() as conn:
+            assert not await migrate_data.Checkpoint(SAMPLE_PATH).load(conn)
+
+
+@pytest.fixture
+def migration_db(plain_db, monkeypatch):
+    fake = SimpleNamespace(engine=plain_db.engine, init=AsyncMock(), close=AsyncMock())
+    monkeypatch.setattr(migrate_data, "db", fake)
+    return plain_db
+
+
+async def table_counts(database):
+    from sqlalchemy import func, select
+
+    from database.models import (
+        Achievement,
+        CommandUsage,
+        DataMigrationState,
+        Favorite,
+        Message,
+        Stats,
+        User,
+    )
+
+    async with database.engine.connect() as conn:
+        counts = {
+            model.__tablename__: (
+                await conn.execute(select(func.count()).select_from(model))
+            ).scalar()
+            for model in (User, Message, Stats, Favorite, Achievement, DataMigrationState)
+        }
+        counts["requests"] = (await conn.execute(select(func.sum(Stats.requests_count)))).scalar()
+        counts["commands"] = (await conn.execute(select(func.sum(CommandUsage.count)))).scalar()
+        return counts
+
+
+MIGRATED = {
+    "users": 3,
+    "messages": 3,
+    "stats": 2,
+    "favorites": 3,
+    "achievements": 3,
+    "data_migration_state": 0,
+    "requests": 15,  # счётчики не задвоены
+    "commands": 3,
+}
+
+
+class TestResume:
+    @pytest.mark.parametrize("failed_call", [2, 5, 9, 12])
+    async def test_resume_after_failed_batch_is_exact(self, migration_db, monkeypatch, failed_call):
+        write = migrate_data.BulkWriter.write
+        calls = 0
+
+        async def failing_write(self, batch, checkpoint):
+            nonlocal calls
+            calls += 1
+            if calls == failed_call:
+                raise RuntimeError("обрыв соединения")
+            await write(self, batch, checkpoint)
+
+        monkeypatch.setattr(migrate_data.BulkWriter, "write", failing_write)
+        with pytest.raises(RuntimeError):
+            await migrate_data.migrate_from_json(SAMPLE_PATH, batch_rows=1)
+        assert (await table_counts(migration_db))["data_migration_state"] == 1
+
+        monkeypatch.setattr(migrate_data.BulkWriter, "write", write)
+        await migrate_data.migrate_from_json(SAMPLE_PATH, batch_rows=1)
+        assert await table_counts(migration_db) == MIGRATED
+
+
+class TestReimport:
+    @pytest.mark.parametrize("restart", [False, True])
+    async def test_reimport_does_not_duplicate(self, migration_db, restart):
+        await migrate_data.migrate_from_json(SAMPLE_PATH, batch_rows=4)
+        await migrate_data.migrate_from_json(SAMPLE_PATH, batch_rows=3, restart=restart)
+        assert await table_counts(migration_db) == MIGRATED
+
+    async def test_reimport_keeps_newer_counters_and_history(self, migration_db):
+        await migrate_data.migrate_from_json(SAMPLE_PATH)
+        # Бот поработал после импорта
+        await migration_db.update_stats(101, requests_count=5)
+        await migration_db.add_message(103, "user", "Первое сообщение в боте")
+        await migration_db.message_buffer.flush()
+
+        await migrate_data.migrate_from_json(SAMPLE_PATH)
+        counts = await table_counts(migration_db)
+        assert (counts["requests"], counts["messages"]) == (20, 4)
@@ -0,0 +1,98 @@
+"""
+Тесты для database.profile_cache: L1 / L2 (Redis), гонка загрузки с инвалидацией,
+инвалидация из других реплик через pub/sub.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from tests.mocks import FakeRedis, real_modules
+
+with real_modules():
+    from database import profile_cache, redis_cache
+UserProfile, UserProfileCache = profile_cache.UserProfile, profile_cache.UserProfileCache
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(redis_cache, "get_redis", AsyncMock(return_value=fake))
+    return fake
+
+
+def make_cache(**kwargs):
+    loader = AsyncMock(side_effect=lambda uid: UserProfile(telegram_id=uid, exists=True))
+    return UserProfileCache(loader, **kwargs), loader
+
+
+class TestLookup:
+    async def test_l1_hit(self, redis):
+        cache, loader = make_cache()
+        profile = await cache.get(1)
+        assert await cache.get(1) is profile
+        assert loader.await_count == 1 and (cache.hits, cache.misses) == (1, 1)
+        assert cache.peek(1) is profile
+
+    async def test_l2_hit_skips_loader(self, redis):
+        cache, loader = make_cache()
+        await cache.get(1)  # промах: БД, запись в L2
+        assert UserProfileCache.parse(redis.store[UserProfileCache.redis_key(1)]).exists
+
+        other, other_loader = make_cache()  # другая реплика: пустой L1
+        assert (await other.get(1)).exists
+        assert other_loader.await_count == 0
+
+    async def test_without_redis(self):
+        cache, loader = make_cache(use_redis=False)
+        await cache.get(1)
+        await cache.get(1)
+        assert loader.await_count == 1
+
+    async def test_lru_limit(self, redis):
+        cache, _ = make_cache(max_users=2)
+        for uid in (1, 2, 3):
+            await cache.get(uid)
+        assert list(cache._entries) == [2, 3]
+
+
+class TestInvalidation:
+    async def test_invalidate_drops_both_levels_and_publishes(self, redis):
+        cache, loader = make_cache()
+        await cache.get(1)
+        await cache.invalidate(1)
+        assert cache.peek(1) is None
+        assert UserProfileCache.redis_key(1) not in redis.store
+        assert redis.published == [(profile_cache.PROFILE_INVALIDATE_CHANNEL, "1")]
+        await cache.get(1)
+        assert loader.await_count == 2
+
+    async def test_load_racing_invalidation_not_cached(self, redis):
+        loading, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_loader(uid):
+            loading.set()
+            await release.wait()
+            return UserProfile(telegram_id=uid, is_banned=False)
+
+        cache = UserProfileCache(slow_loader)
+        task = asyncio.create_task(cache.get(1))
+        await loading.wait()
+        await cache.invalidate(1)  # бан записан, пока профиль читался из БД
+        release.set()
+        await task
+        assert cache.peek(1) is None
+        assert UserProfileCache.redis_key(1) not in redis.store
+        assert cache._loading == {}  # после загрузки ничего не остаётся
+
+    async def test_invalidation_from_other_replica(self, redis):
+        cache, loader = make_cache()
+        await cache.start()
+        await asyncio.wait_for(redis.subscribed.wait(), timeout=1)
+        await cache.get(1)
+        redis.messages.put_nowait("1")
+        for _ in range(10):
+            await asyncio.sleep(0)
+        await cache.stop()
+        assert cache.peek(1) is None
@@ -0,0 +1,34 @@
+"""
+Планы запросов Database: ни один запрос не делает полный проход по таблице или сортировку
+(database.query_plans). Проверка запускается отдельным процессом — другие тесты
+подменяют sqlalchemy/database в sys.modules. PostgreSQL — при заданном TEST_DATABASE_URL.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _check_plans(url: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-m", "database.query_plans", url],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+
+def test_sqlite_query_plans(tmp_path):
+    result = _check_plans(f"sqlite+aiosqlite:///{tmp_path / 'plans.db'}")
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL не задан")
+def test_postgres_query_plans():
+    result = _check_plans(os.environ["TEST_DATABASE_URL"])
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,136 @@
+"""
+Тесты для database.retention: архивация лишней истории (реальная SQLite), упаковка
+архива, месячные партиции.
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+from tests.mocks import real_modules
+
+with real_modules():
+    from database import retention
+
+
+async def add_history(database, user_id: int, count: int) -> None:
+    for i in range(count):
+        await database.add_message(user_id, "user", f"u{user_id}-m{i}")
+    await database.message_buffer.flush()
+
+
+async def archived(database, user_id: int):
+    from sqlalchemy import select
+
+    from database.models import MessageArchive
+
+    async with database.read_only_session() as session:
+        result = await session.execute(
+            select(MessageArchive.message_count, MessageArchive.payload)
+            .where(MessageArchive.user_id == user_id)
+            .order_by(MessageArchive.id)
+        )
+        return [(count, retention.unpack_messages(payload)) for count, payload in result.all()]
+
+
+class TestArchiveOverflow:
+    async def test_keeps_last_messages_per_user(self, plain_db):
+        await add_history(plain_db, 1, 7)
+        await add_history(plain_db, 2, 3)
+        await add_history(plain_db, 3, 4)
+
+        assert await retention.archive_overflow(plain_db, keep_last=3, batch_size=2) == 5
+        recent = await plain_db.get_user_messages(1)
+        assert [m.content for m in recent] == ["u1-m4", "u1-m5", "u1-m6"]
+        assert [m.content for m in await plain_db.get_user_messages(2)] == [
+            "u2-m0",
+            "u2-m1",
+            "u2-m2",
+        ]
+        blobs = await archived(plain_db, 1)
+        assert [count for count, _ in blobs] == [2, 2]
+        assert [row["content"] for _, rows in blobs for row in rows] == [
+            f"u1-m{i}" for i in range(4)
+        ]
+        assert await archived(plain_db, 2) == []
+        assert [count for count, _ in await archived(plain_db, 3)] == [1]
+
+        # Повторный проход ничего не находит
+        assert await retention.archive_overflow(plain_db, keep_last=3, batch_size=2) == 0
+
+    async def test_sqlite_writes_through_writer(self, real_db, monkeypatch):
+        await add_history(real_db, 1, 5)
+        jobs = real_db.writer.jobs
+
+        def no_direct_sessions():
+            raise AssertionError("ретеншн занял соединение писателя в обход SQLiteWriter")
+
+        monkeypatch.setattr(real_db, "async_session", no_direct_sessions)
+        assert await retention.archive_overflow(real_db, keep_last=2, batch_size=2) == 3
+        assert real_db.writer.jobs == jobs + 2
+        assert [m.content for m in await real_db.get_user_messages(1)] == ["u1-m3", "u1-m4"]
+
+    async def test_stops_at_batch_limit(self, plain_db):
+        await add_history(plain_db, 1, 10)
+        moved = await retention.archive_overflow(plain_db, keep_last=2, batch_size=3, max_batches=2)
+        assert moved == 6
+        assert len(await plain_db.get_user_messages(1, limit=50)) == 4
+
+    async def test_continues_from_saved_cursor(self, plain_db):
+        for user_id in (1, 2, 3):
+            await add_history(plain_db, user_id, 3)
+
+        # Лимит в одну пачку: каждый запуск продолжает с недопройденного пользователя
+        for user_id in (1, 2, 3):
+            assert await retention.archive_overflow(plain_db, 1, 10, max_batches=1) == 2
+            assert [count for count, _ in await archived(plain_db, user_id)] == [2]
+            assert await retention._load_cursor(plain_db) == user_id - 1
+
+        await add_history(plain_db, 1, 2)  # до пользователя 1 дойдём только с начала таблицы
+        assert await retention.archive_overflow(plain_db, 1, 10, max_batches=1) == 0
+        assert await retention._load_cursor(plain_db) == 0
+        assert await retention.archive_overflow(plain_db, 1, 10, max_batches=1) == 2
+
+    async def test_disabled_when_keep_last_not_positive(self, plain_db):
+        await add_history(plain_db, 1, 3)
+        assert await retention.archive_overflow(plain_db, keep_last=0, batch_size=10) == 0
+
+
+async def test_archive_partition_copies_without_delete(plain_db):
+    from datetime import timedelta
+
+    await add_history(plain_db, 2, 3)
+    await add_history(plain_db, 1, 2)
+    now = datetime.utcnow()
+    async with plain_db.engine.begin() as conn:
+        copied = await retention.archive_partition(
+            conn, now - timedelta(days=1), now + timedelta(days=1), batch_size=2
+        )
+        assert await retention.archive_partition(conn, now + timedelta(days=1), now, 2) == 0
+    assert copied == 5
+    # Пачки по ключу (user_id, created_at, id): [u1, u1], [u2, u2], [u2]
+    assert [count for count, _ in await archived(plain_db, 1)] == [2]
+    assert [row["content"] for _, rows in await archived(plain_db, 2) for row in rows] == [
+        "u2-m0",
+        "u2-m1",
+        "u2-m2",
+    ]
+    # Строки не удалены — партицию следом удаляет DROP
+    assert len(await plain_db.get_user_messages(2)) == 3
+
+
+def test_pack_unpack_roundtrip():
+    rows = [
+        SimpleNamespace(id=1, role="user", content="Привет", created_at=datetime(2026, 1, 1, 12)),
+        SimpleNamespace(id=2, role="assistant", content="Здравствуйте", created_at=None),
+    ]
+    assert retention.unpack_messages(retention.pack_messages(rows)) == [
+        {"id": 1, "role": "user", "content": "Привет", "created_at": "2026-01-01T12:00:00"},
+        {"id": 2, "role": "assistant", "content": "Здравствуйте", "created_at": None},
+    ]
+
+
+def test_partition_helpers():
+    assert retention.partition_name(2026, 3) == "messages_p2026_03"
+    assert retention.partition_bounds(2026, 12) == (datetime(2026, 12, 1), datetime(2027, 1, 1))
+    assert retention._add_months(2026, 1, -1) == (2025, 12)
+    assert retention._add_months(2026, 11, 14) == (2028, 1)
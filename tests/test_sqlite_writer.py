@@ -0,0 +1,108 @@
+"""
+Тесты для database.sqlite_mode.SQLiteWriter (реальная SQLite, фикстура real_db): откат
+SAVEPOINT только упавшего блока, отмена до и после выдачи слота, ошибка COMMIT пачки.
+"""
+
+import asyncio
+
+import pytest
+
+
+async def write_fact(writer, user_id: int, fact_type: str = "name") -> None:
+    from database.models import UserFact
+
+    async with writer.session() as session:
+        session.add(UserFact(user_id=user_id, fact_type=fact_type, fact_value="x"))
+        await session.flush()
+
+
+async def fact_users(database):
+    return [uid for uid in range(1, 6) if await database.get_user_facts(uid)]
+
+
+async def test_failed_block_rolls_back_only_its_savepoint(real_db):
+    writer = real_db.writer
+    batches = writer.batches
+
+    async def failing_block():
+        from database.models import UserFact
+
+        async with writer.session() as session:
+            session.add(UserFact(user_id=2, fact_type="name", fact_value="x"))
+            await session.flush()
+            raise RuntimeError("handler failed")
+
+    results = await asyncio.gather(
+        write_fact(writer, 1), failing_block(), write_fact(writer, 3), return_exceptions=True
+    )
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], RuntimeError)
+    assert writer.batches == batches + 1  # все три блока — в одной транзакции
+    assert await fact_users(real_db) == [1, 3]
+
+
+async def test_cancel_before_slot_is_skipped(real_db):
+    writer = real_db.writer
+    holding, release = asyncio.Event(), asyncio.Event()
+
+    async def holder():
+        async with writer.session():
+            holding.set()
+            await release.wait()
+
+    first = asyncio.create_task(holder())
+    await holding.wait()
+    waiting = asyncio.create_task(write_fact(writer, 2))
+    await asyncio.sleep(0.01)  # блок стоит в очереди, слот ещё не выдан
+    waiting.cancel()
+    release.set()
+    await first
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    await write_fact(writer, 3)  # писатель продолжает работу
+    assert await fact_users(real_db) == [3]
+
+
+async def test_cancel_after_slot_rolls_back_block(real_db):
+    writer = real_db.writer
+    inside, never = asyncio.Event(), asyncio.Event()
+
+    async def slow_block():
+        from database.models import UserFact
+
+        async with writer.session() as session:
+            session.add(UserFact(user_id=2, fact_type="name", fact_value="x"))
+            await session.flush()
+            inside.set()
+            await never.wait()
+
+    task = asyncio.create_task(slow_block())
+    await inside.wait()
+    other = asyncio.create_task(write_fact(writer, 1))  # встанет в ту же пачку
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await other
+    assert await fact_users(real_db) == [1]
+
+
+async def test_failed_commit_reaches_every_caller(real_db, monkeypatch):
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    class FailingCommit(AsyncSession):
+        async def commit(self):
+            raise RuntimeError("disk I/O error")
+
+    writer = real_db.writer
+    monkeypatch.setattr(
+        writer,
+        "_session_factory",
+        async_sessionmaker(real_db.engine, class_=FailingCommit, expire_on_commit=False),
+    )
+    results = await asyncio.gather(
+        write_fact(writer, 1), write_fact(writer, 2), return_exceptions=True
+    )
+    assert [str(r) for r in results] == ["disk I/O error"] * 2
+    assert writer.running
+    assert await fact_users(real_db) == []
@@ -0,0 +1,100 @@
+"""
+Тесты для utils.stream_renderer: пропуск пустых правок, переход на новое сообщение до лимита.
+"""
+
+from tests.mocks import load_with_real_telegram
+
+_, stream_renderer = load_with_real_telegram("utils/stream_renderer.py", "stream_renderer")
+StreamRenderer, ChatEditLimiter = stream_renderer.StreamRenderer, stream_renderer.ChatEditLimiter
+TokenBucket = stream_renderer.TokenBucket
+_, text_tools = load_with_real_telegram("utils/text_tools.py", "text_tools")
+
+
+class FakeMessage:
+    def __init__(self, text: str = "") -> None:
+        self.text = text
+        self.edits = []
+        self.deleted = False
+
+    async def edit_text(self, text, parse_mode=None):
+        self.edits.append(text)
+        self.text = text
+
+    async def delete(self):
+        self.deleted = True
+
+
+def make_renderer(sent, **kwargs):
+    async def send_message(text, parse_mode=None):
+        message = FakeMessage(text)
+        sent.append(message)
+        return message
+
+    return StreamRenderer(
+        FakeMessage("..."),
+        send_message=send_message,
+        chat_id=1,
+        budget=TokenBucket(rate=1000, capacity=1000),
+        limiter=ChatEditLimiter(),
+        **kwargs,
+    )
+
+
+async def test_skips_edits_that_do_not_change_message(monkeypatch):
+    monkeypatch.setattr(stream_renderer, "STREAM_CHAT_INTERVAL_SEC", 0)
+    monkeypatch.setattr(stream_renderer, "STREAM_MIN_DELTA_CHARS", 1)
+    monkeypatch.setattr(stream_renderer, "STREAM_GROWTH_RATIO", 0)
+    renderer = make_renderer([], markup=text_tools.TelegramHTMLStream)
+    await renderer.feed("a" * 60)
+    # Маркер жирного ещё не разобран — HTML сообщения тот же
+    await renderer.feed("**")
+    await renderer.feed("b")
+    await renderer.flush()
+    assert renderer.messages[0].edits == ["a" * 60, "a" * 60 + "<b>b</b>"]
+
+
+async def test_rolls_over_before_limit(monkeypatch):
+    monkeypatch.setattr(stream_renderer, "STREAM_CHAT_INTERVAL_SEC", 0)
+    sent = []
+    renderer = make_renderer(sent, markup=text_tools.TelegramHTMLStream)
+    text = "```python\n" + "x = a < b\n" * 500
+    for i in range(0, len(text), 100):
+        await renderer.feed(text[i : i + 100])
+    await renderer.flush()
+
+    messages = renderer.messages
+    assert len(messages) == 2 and messages[1] is sent[0]
+    # Блок кода закрыт в первом сообщении и переоткрыт во втором — с языком
+    assert messages[0].text.startswith('<pre><code class="language-python">x = a &lt; b')
+    assert messages[0].text.endswith("</code></pre>")
+    assert messages[1].text.startswith('<pre><code class="language-python">x = a &lt; b')
+    assert renderer.text == text
+
+    await renderer.discard()
+    assert all(m.deleted for m in messages)
+
+
+async def roll_over(text: str):
+    renderer = make_renderer([], markup=text_tools.TelegramHTMLStream)
+    for i in range(0, len(text), 100):
+        await renderer.feed(text[i : i + 100])
+    await renderer.flush()
+    return [m.text for m in renderer.messages]
+
+
+async def test_rollover_inside_bold(monkeypatch):
+    monkeypatch.setattr(stream_renderer, "STREAM_CHAT_INTERVAL_SEC", 0)
+    head, tail = await roll_over("**" + "жирное слово " * 400 + "конец** после")
+    assert head.startswith("<b>жирное") and head.endswith("</b>")
+    assert tail.startswith("<b>") and tail.endswith("конец</b> после")
+    assert "**" not in head + tail
+
+
+async def test_rollover_ignores_fence_in_inline_code(monkeypatch):
+    monkeypatch.setattr(stream_renderer, "STREAM_CHAT_INTERVAL_SEC", 0)
+    # ``` внутри инлайн-кода и экранированный — не блоки: подсчёт чётности ошибся бы
+    text = "Маркер `` ``` `` и \\`\\`\\`, затем *курсив " + "слово " * 800 + "хвост*"
+    head, tail = await roll_over(text)
+    assert "<pre>" not in head + tail
+    assert head.endswith("</i>") and tail.startswith("<i>слово")
+    assert tail.endswith("хвост</i>")
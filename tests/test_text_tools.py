@@ -0,0 +1,72 @@
+"""
+Тесты для utils.text_tools: Markdown ответа LLM → HTML Telegram (целиком и по фрагментам).
+"""
+
+from tests.mocks import load_with_real_telegram
+
+# По пути: другие тесты подменяют utils.text_tools в sys.modules
+_, text_tools = load_with_real_telegram("utils/text_tools.py", "text_tools")
+TelegramHTMLStream, markdown_to_html = text_tools.TelegramHTMLStream, text_tools.markdown_to_html
+
+SAMPLE = (
+    "**Ответ:** *курсив*, snake_case и 2 * 3 < 4 & 5\n"
+    "* пункт списка\n"
+    "Вызов `f(a<b)` и блок:\n"
+    "```python\nx = a*b_c  # **не разметка**\n```\n"
+    "**жирный *вложенный** хвост*"
+)
+
+
+def test_markdown_to_html():
+    assert markdown_to_html(SAMPLE) == (
+        "<b>Ответ:</b> <i>курсив</i>, snake_case и 2 * 3 &lt; 4 &amp; 5\n"
+        "* пункт списка\n"
+        "Вызов <code>f(a&lt;b)</code> и блок:\n"
+        '<pre><code class="language-python">x = a*b_c  # **не разметка**\n</code></pre>\n'
+        "<b>жирный <i>вложенный</i></b><i> хвост</i>"
+    )
+
+
+def test_stream_matches_whole_text_and_closes_open_tags():
+    stream = TelegramHTMLStream()
+    for char in SAMPLE[: SAMPLE.index(" хвост") - 2]:
+        stream.feed(char)
+    # Незакрытые выделения закрываются в превью, отложенный хвост не показывается
+    assert stream.render().endswith("<b>жирный <i>вложенный</i></b>")
+
+    stream = TelegramHTMLStream()
+    for char in SAMPLE:
+        stream.feed(char)
+    assert stream.finish() == markdown_to_html(SAMPLE)
+
+
+def test_links():
+    assert markdown_to_html('см. [ссылку](http://x.com/?a=1&b="2")') == (
+        'см. <a href="http://x.com/?a=1&amp;b=&quot;2&quot;">ссылку</a>'
+    )
+    assert markdown_to_html("**см. [тут](https://x.com) и [там](https://y.com)**") == (
+        '<b>см. <a href="https://x.com">тут</a> и <a href="https://y.com">там</a></b>'
+    )
+    # Не ссылки: список в скобках, индекс, чужая схема, код
+    assert markdown_to_html("[1, 2] и a[0]") == "[1, 2] и a[0]"
+    assert markdown_to_html("[x](javascript:alert(1))") == "[x](javascript:alert(1))"
+    assert markdown_to_html("`[x](http://a.b)`") == "<code>[x](http://a.b)</code>"
+
+
+def test_link_split_across_deltas():
+    text = "**Источник: [статья](https://example.com/wiki/A_(b))** конец"
+    stream = TelegramHTMLStream()
+    previews = []
+    for char in text:
+        stream.feed(char)
+        previews.append(stream.render())
+    # Пока ссылка не дописана, в превью нет ни скобок, ни половины href
+    assert all("[" not in preview and "](" not in preview for preview in previews)
+    assert stream.finish() == (
+        '<b>Источник: <a href="https://example.com/wiki/A_(b)">статья</a></b> конец'
+    )
+    assert stream.finish() == markdown_to_html(text)
+
+    stream = TelegramHTMLStream()
+    stream.feed("обрыв [ссылки](http://a")
+    assert stream.finish() == "обрыв [ссылки](http://a"
@@ -0,0 +1,100 @@
+"""
+Тесты для utils.update_processor: порядок внутри чата, параллельность между чатами, отбрасывание.
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from tests.mocks import load_with_real_telegram
+
+_telegram, update_processor = load_with_real_telegram(
+    "utils/update_processor.py", "update_processor"
+)
+Chat, Message, Update = _telegram.Chat, _telegram.Message, _telegram.Update
+ChatOrderedUpdateProcessor = update_processor.ChatOrderedUpdateProcessor
+ordering_key = update_processor.ordering_key
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    chat = Chat(id=chat_id, type=Chat.PRIVATE)
+    return Update(update_id, message=Message(update_id, datetime.now(), chat))
+
+
+async def submit(processor, update, handler):
+    """Как Application: задача на апдейт, process_update базового класса"""
+    return asyncio.create_task(processor.process_update(update, handler(update)))
+
+
+class TestChatOrderedUpdateProcessor:
+    def test_ordering_key(self):
+        assert ordering_key(make_update(1, 42)) == 42
+        assert ordering_key(Update(2)) is None
+        assert ordering_key("custom") is None
+
+    async def test_same_chat_sequential_other_chats_parallel(self):
+        processor = ChatOrderedUpdateProcessor(
+            max_concurrent=4, max_backlog=100, max_chat_backlog=10
+        )
+        log = []
+        active = {"now": 0, "max": 0}
+
+        async def handler(update):
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+            log.append(("start", update.update_id))
+            await asyncio.sleep(0.01)
+            log.append(("end", update.update_id))
+            active["now"] -= 1
+
+        tasks = [await submit(processor, make_update(i, i % 2), handler) for i in range(6)]
+        await asyncio.gather(*tasks)
+
+        for chat in (0, 1):
+            ids = [i for event, i in log if event == "start" and i % 2 == chat]
+            assert ids == sorted(ids)
+            # Следующий апдейт чата стартует только после завершения предыдущего
+            for prev, nxt in zip(ids, ids[1:]):
+                assert log.index(("end", prev)) < log.index(("start", nxt))
+        assert active["max"] == 2
+        assert processor.waiting == 0 and not processor._lanes
+
+    async def test_chat_backlog_sheds(self):
+        processor = ChatOrderedUpdateProcessor(
+            max_concurrent=4, max_backlog=100, max_chat_backlog=2
+        )
+        gate = asyncio.Event()
+        done = []
+
+        async def handler(update):
+            await gate.wait()
+            done.append(update.update_id)
+
+        tasks = [await submit(processor, make_update(i, 7), handler) for i in range(4)]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*tasks)
+
+        assert done == [0, 1]
+        assert processor.shed_count == 2
+
+    @pytest.mark.filterwarnings("error::RuntimeWarning")
+    async def test_global_backlog_sheds(self):
+        processor = ChatOrderedUpdateProcessor(max_concurrent=1, max_backlog=2, max_chat_backlog=10)
+        gate = asyncio.Event()
+        done = []
+
+        async def handler(update):
+            await gate.wait()
+            done.append(update.update_id)
+
+        tasks = [await submit(processor, make_update(i, i), handler) for i in range(5)]
+        await asyncio.sleep(0)
+        # Один обрабатывается, двое ждут слота, остальные отброшены
+        assert processor.running == 1 and processor.waiting == 2
+        gate.set()
+        await asyncio.gather(*tasks)
+
+        assert sorted(done) == [0, 1, 2]
+        assert processor.shed_count == 2
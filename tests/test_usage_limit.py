@@ -0,0 +1,127 @@
+"""
+Тесты для middlewares.usage_limit: дневной счётчик в Redis (ключ, срок жизни, догон из БД),
+проверка лимита (засев отсутствующего ключа из БД), сверка usage:dirty → usage_daily.
+"""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from tests.mocks import FakeRedis, load_isolated
+
+_, usage_limit = load_isolated("middlewares/usage_limit.py", "usage_limit")
+DAY = "2026-01-01"
+KEY, DIRTY = f"usage:{DAY}:42", f"usage:dirty:{DAY}"
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(usage_limit, "get_redis", AsyncMock(return_value=fake))
+    return fake
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = SimpleNamespace(
+        get_daily_usage=AsyncMock(return_value=0),
+        increment_daily_usage=AsyncMock(return_value=1),
+        upsert_daily_usage_batch=AsyncMock(side_effect=lambda day, counts: len(counts)),
+        is_premium=AsyncMock(return_value=False),
+        profiles=MagicMock(),
+    )
+    fake.profiles.peek.return_value = SimpleNamespace(is_premium=False)
+    monkeypatch.setattr(usage_limit, "db", fake)
+    monkeypatch.setattr(usage_limit, "_today", lambda: DAY)
+    return fake
+
+
+class TestRecordUsage:
+    async def test_counter_key_and_expiry(self, redis, db):
+        assert await usage_limit.record_usage(42) == 1
+        assert await usage_limit.record_usage(42) == 2
+        assert redis.store[KEY] == "2"
+        # Ключ и множество живут до следующей полуночи UTC + запас на последнюю сверку
+        midnight = datetime(2026, 1, 2, tzinfo=timezone.utc).timestamp()
+        expected = int(midnight) + usage_limit.USAGE_KEY_GRACE_SEC
+        assert redis.expire_at == {KEY: expected, DIRTY: expected}
+        assert redis.sets[DIRTY] == {"42"}
+        db.increment_daily_usage.assert_not_called()
+
+    async def test_new_key_catches_up_from_database(self, redis, db):
+        db.get_daily_usage.return_value = 5  # счётчик вёлся в БД, пока Redis был недоступен
+        assert await usage_limit.record_usage(42) == 6
+        assert redis.store[KEY] == "6"
+
+    async def test_without_redis_uses_database(self, db, monkeypatch):
+        monkeypatch.setattr(usage_limit, "get_redis", AsyncMock(return_value=None))
+        assert await usage_limit.record_usage(42) == 1
+        db.increment_daily_usage.assert_awaited_once_with(42, DAY)
+
+
+class TestCheckSeedsMissingKey:
+    async def test_seeded_from_database(self, redis, db, monkeypatch):
+        # Redis перезапустился: ключа дня нет, в usage_daily — уже исчерпанный лимит
+        monkeypatch.setattr(usage_limit.config, "FREE_DAILY_LIMIT", 3)
+        db.get_daily_usage.return_value = 3
+        allowed, _ = await usage_limit.check_can_make_request(42)
+        assert not allowed
+        assert redis.store[KEY] == "3"
+        assert redis.expire_at[KEY] == usage_limit._expire_at(DAY)
+
+        db.get_daily_usage.reset_mock()
+        assert await usage_limit.record_usage(42) == 4  # INCR поверх засеянного
+        db.get_daily_usage.assert_not_called()
+
+    async def test_does_not_overwrite_concurrent_increment(self, redis, db, monkeypatch):
+        monkeypatch.setattr(usage_limit.config, "FREE_DAILY_LIMIT", 10)
+        db.get_daily_usage.return_value = 2
+
+        async def get(key):
+            await redis.incr(key)  # запрос, прошедший между GET и SET NX
+            return None
+
+        redis.get = get
+        assert await usage_limit.check_can_make_request(42) == (True, "")
+        assert redis.store[KEY] == "1"
+
+    async def test_nothing_in_database_leaves_key_absent(self, redis, db, monkeypatch):
+        monkeypatch.setattr(usage_limit.config, "FREE_DAILY_LIMIT", 10)
+        assert await usage_limit.check_can_make_request(42) == (True, "")
+        assert KEY not in redis.store
+
+
+async def test_check_can_make_request(redis, db, monkeypatch):
+    monkeypatch.setattr(usage_limit.config, "FREE_DAILY_LIMIT", 2)
+    await usage_limit.record_usage(42)
+    assert await usage_limit.check_can_make_request(42) == (True, "")
+    await usage_limit.record_usage(42)
+    allowed, message = await usage_limit.check_can_make_request(42)
+    assert not allowed and "лимит" in message
+
+
+class TestReconcile:
+    async def test_drains_dirty_set_in_batches(self, redis, db, monkeypatch):
+        monkeypatch.setattr(usage_limit, "USAGE_RECONCILE_BATCH", 2)
+        for user_id, count in ((1, 3), (2, 1), (3, 7)):
+            redis.store[f"usage:{DAY}:{user_id}"] = str(count)
+            await redis.sadd(DIRTY, user_id)
+
+        assert await usage_limit.reconcile_usage([DAY]) == 3
+        assert db.upsert_daily_usage_batch.await_count == 2
+        written = {}
+        for call in db.upsert_daily_usage_batch.await_args_list:
+            assert call.args[0] == DAY
+            written.update(call.args[1])
+        assert written == {1: 3, 2: 1, 3: 7}
+        assert redis.sets[DIRTY] == set()
+
+    async def test_failed_write_returns_ids_to_dirty_set(self, redis, db):
+        redis.store[KEY] = "4"
+        await redis.sadd(DIRTY, 42)
+        db.upsert_daily_usage_batch.side_effect = RuntimeError("db down")
+        with pytest.raises(RuntimeError):
+            await usage_limit.reconcile_usage([DAY])
+        assert redis.sets[DIRTY] == {"42"}
@@ -1,6 +1,9 @@
 """
 Prometheus-метрики для Observability
 requests_per_minute, average_response_time, errors_count, token_usage
+БД (database.instrumentation): время методов Database, ожидание и заполнение пулов, медленные запросы.
+Апдейты (utils.update_processor): очередь, обрабатываемые, ожидание, отброшенные.
+Рассылки (services.broadcast): сообщения по исходу, flood wait.
 HTTP: /metrics (Prometheus), /health (liveness для балансировщиков и оркестраторов).
 """
 
@@ -15,6 +18,7 @@ try:
         CONTENT_TYPE_LATEST,
         REGISTRY,
         Counter,
+        Gauge,
         Histogram,
         generate_latest,
     )
@@ -47,11 +51,100 @@ if PROMETHEUS_AVAILABLE:
         "Total LLM errors",
         ["provider", "model", "error_type"],
     )
+    # Фоновое извлечение фактов (services.memory)
+    FACT_QUEUE_DEPTH = Gauge(
+        "fact_enrichment_queue_depth",
+        "Fact extraction tasks waiting in the in-process queue",
+    )
+    FACT_EXTRACTION_TIME = Histogram(
+        "fact_extraction_seconds",
+        "Fact extraction latency (LLM call + DB write) in seconds",
+        ["outcome"],
+        buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+    )
+    FACT_TASKS_DROPPED = Counter(
+        "fact_enrichment_dropped_total",
+        "Fact extraction tasks dropped under load",
+        ["reason"],
+    )
+    FACT_BATCH_SIZE = Histogram(
+        "fact_extraction_batch_size",
+        "Messages per fact extraction LLM call",
+        buckets=(1, 2, 5, 10, 20, 50),
+    )
+    FACT_PREFILTER_TOTAL = Counter(
+        "fact_prefilter_total",
+        "Local fact pre-filter decisions (pass = sent to LLM extractor)",
+        ["decision"],
+    )
+    # База данных (database.instrumentation)
+    DB_CALL_TIME = Histogram(
+        "db_call_seconds",
+        "Database method latency in seconds",
+        ["method", "outcome"],
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    )
+    DB_POOL_CHECKOUT_WAIT = Histogram(
+        "db_pool_checkout_wait_seconds",
+        "Time to get a connection from the pool (queue wait + new connection)",
+        ["pool"],
+        buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+    )
+    DB_POOL_SIZE = Gauge("db_pool_size", "Configured pool size", ["pool"])
+    DB_POOL_CHECKED_OUT = Gauge(
+        "db_pool_checked_out", "Connections currently checked out of the pool", ["pool"]
+    )
+    DB_POOL_OVERFLOW = Gauge(
+        "db_pool_overflow", "Overflow connections above pool size (negative = idle slots)", ["pool"]
+    )
+    DB_SLOW_QUERIES = Counter(
+        "db_slow_queries_total", "Queries slower than DB_SLOW_QUERY_MS", ["method"]
+    )
+    # Обработка апдейтов Telegram (utils.update_processor)
+    UPDATE_QUEUE_DEPTH = Gauge(
+        "update_queue_depth", "Accepted updates waiting for their chat turn or a free slot"
+    )
+    UPDATES_IN_PROGRESS = Gauge("updates_in_progress", "Updates being processed right now")
+    UPDATE_WAIT_TIME = Histogram(
+        "update_wait_seconds",
+        "Time from update acceptance to start of processing",
+        buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+    )
+    UPDATES_SHED = Counter(
+        "updates_shed_total", "Updates dropped because the backlog was full", ["reason"]
+    )
+    # Рассылки (services.broadcast)
+    BROADCAST_MESSAGES = Counter(
+        "broadcast_messages_total", "Broadcast messages by outcome", ["outcome"]
+    )
+    BROADCAST_FLOOD_WAITS = Counter(
+        "broadcast_flood_waits_total", "RetryAfter (flood wait) responses during broadcasts"
+    )
+    # Потоковые ответы (utils.stream_renderer)
+    STREAM_EDITS = Counter("stream_edits_total", "Streaming reply edits by outcome", ["outcome"])
 else:
     REQUESTS_TOTAL = None  # type: ignore[assignment]
     RESPONSE_TIME = None  # type: ignore[assignment]
     TOKENS_USED = None  # type: ignore[assignment]
     ERRORS_TOTAL = None  # type: ignore[assignment]
+    FACT_QUEUE_DEPTH = None  # type: ignore[assignment]
+    FACT_EXTRACTION_TIME = None  # type: ignore[assignment]
+    FACT_TASKS_DROPPED = None  # type: ignore[assignment]
+    FACT_BATCH_SIZE = None  # type: ignore[assignment]
+    FACT_PREFILTER_TOTAL = None  # type: ignore[assignment]
+    DB_CALL_TIME = None  # type: ignore[assignment]
+    DB_POOL_CHECKOUT_WAIT = None  # type: ignore[assignment]
+    DB_POOL_SIZE = None  # type: ignore[assignment]
+    DB_POOL_CHECKED_OUT = None  # type: ignore[assignment]
+    DB_POOL_OVERFLOW = None  # type: ignore[assignment]
+    DB_SLOW_QUERIES = None  # type: ignore[assignment]
+    UPDATE_QUEUE_DEPTH = None  # type: ignore[assignment]
+    UPDATES_IN_PROGRESS = None  # type: ignore[assignment]
+    UPDATE_WAIT_TIME = None  # type: ignore[assignment]
+    UPDATES_SHED = None  # type: ignore[assignment]
+    BROADCAST_MESSAGES = None  # type: ignore[assignment]
+    BROADCAST_FLOOD_WAITS = None  # type: ignore[assignment]
+    STREAM_EDITS = None  # type: ignore[assignment]
 
 
 def _parse_model_key(model_key: str) -> tuple:
@@ -95,6 +188,114 @@ def record_response_time(model_key: str, duration_sec: float) -> None:
     RESPONSE_TIME.labels(provider=provider, model=model).observe(duration_sec)
 
 
+def set_fact_queue_depth(depth: int) -> None:
+    """Текущая длина очереди извлечения фактов"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    FACT_QUEUE_DEPTH.set(depth)
+
+
+def record_fact_extraction(duration_sec: float, outcome: str = "ok") -> None:
+    """Записать время извлечения фактов (outcome: ok / empty / error)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    FACT_EXTRACTION_TIME.labels(outcome=outcome).observe(duration_sec)
+
+
+def record_fact_batch_size(size: int) -> None:
+    """Сколько сообщений ушло в один LLM-вызов извлечения фактов"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    FACT_BATCH_SIZE.observe(size)
+
+
+def record_fact_dropped(reason: str) -> None:
+    """Задача извлечения фактов отброшена (queue_full / stale / shutdown)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    FACT_TASKS_DROPPED.labels(reason=reason).inc()
+
+
+def record_fact_prefilter(passed: bool) -> None:
+    """Решение локального пре-фильтра фактов (pass / skip)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    FACT_PREFILTER_TOTAL.labels(decision="pass" if passed else "skip").inc()
+
+
+def record_db_call(method: str, outcome: str, duration_sec: float) -> None:
+    """Время вызова метода Database (outcome: ok / error)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    DB_CALL_TIME.labels(method=method, outcome=outcome).observe(duration_sec)
+
+
+def record_db_pool_wait(pool: str, duration_sec: float) -> None:
+    """Ожидание соединения из пула (primary / read)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    DB_POOL_CHECKOUT_WAIT.labels(pool=pool).observe(duration_sec)
+
+
+def set_db_pool_state(pool: str, size: int, checked_out: int, overflow: int) -> None:
+    """Заполнение пула после выдачи / возврата соединения"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    DB_POOL_SIZE.labels(pool=pool).set(size)
+    DB_POOL_CHECKED_OUT.labels(pool=pool).set(checked_out)
+    DB_POOL_OVERFLOW.labels(pool=pool).set(overflow)
+
+
+def record_db_slow_query(method: str) -> None:
+    """Медленный запрос (подробности — в логе db_slow_query)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    DB_SLOW_QUERIES.labels(method=method).inc()
+
+
+def set_update_queue_state(waiting: int, running: int) -> None:
+    """Очередь апдейтов: ждущие своей очереди и обрабатываемые"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    UPDATE_QUEUE_DEPTH.set(waiting)
+    UPDATES_IN_PROGRESS.set(running)
+
+
+def record_update_wait(duration_sec: float) -> None:
+    """Ожидание апдейта от приёма до начала обработки"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    UPDATE_WAIT_TIME.observe(duration_sec)
+
+
+def record_update_shed(reason: str) -> None:
+    """Апдейт отброшен при перегрузке (backlog_full / chat_backlog_full)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    UPDATES_SHED.labels(reason=reason).inc()
+
+
+def record_broadcast_message(outcome: str) -> None:
+    """Сообщение рассылки (outcome: sent / blocked / failed)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    BROADCAST_MESSAGES.labels(outcome=outcome).inc()
+
+
+def record_broadcast_flood_wait() -> None:
+    """Ответ RetryAfter во время рассылки"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    BROADCAST_FLOOD_WAITS.inc()
+
+
+def record_stream_edit(outcome: str) -> None:
+    """Правка потокового ответа (outcome: sent / noop / no_budget / failed / rollover)"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    STREAM_EDITS.labels(outcome=outcome).inc()
+
+
 @asynccontextmanager
 async def track_llm_call(model_key: str) -> AsyncGenerator[None, None]:
     """Контекстный менеджер для отслеживания LLM вызова"""
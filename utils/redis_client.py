@@ -3,22 +3,31 @@
 При недоступности Redis функции возвращают fallback-поведение.
 """
 
-import logging
+import time
 from typing import TYPE_CHECKING, Optional
 
+import structlog
+
 if TYPE_CHECKING:
     from redis.asyncio import Redis
 
-logger = logging.getLogger(__name__)
+logger = structlog.get_logger(__name__)
+
+# После неудачного подключения следующая попытка — не раньше чем через столько секунд
+# (иначе каждый запрос без Redis ждал бы таймаут подключения)
+REDIS_RETRY_SEC = 30.0
 
 _redis: Optional["Redis"] = None
+_last_failure_at: float = 0.0
 
 
 async def get_redis():
     """Возвращает общий async Redis-клиент или None, если Redis недоступен."""
-    global _redis
+    global _redis, _last_failure_at
     if _redis is not None:
         return _redis
+    if _last_failure_at and time.monotonic() - _last_failure_at < REDIS_RETRY_SEC:
+        return None
     try:
         from redis.asyncio import from_url
 
@@ -27,9 +36,11 @@ async def get_redis():
         client = from_url(config.settings.REDIS_URL, decode_responses=True)
         await client.ping()
         _redis = client
+        _last_failure_at = 0.0
         logger.info("redis_connected", url=config.settings.REDIS_URL.split("@")[-1])
         return _redis
     except Exception as e:
+        _last_failure_at = time.monotonic()
         logger.warning("redis_unavailable", error=str(e))
         return None
 
@@ -0,0 +1,314 @@
+"""
+Потоковый ответ правками сообщения Telegram (StreamRenderer)
+
+- Темп правок задаёт прирост текста: правка, когда добавилось не меньше
+  STREAM_GROWTH_RATIO от уже показанного (минимум STREAM_MIN_DELTA_CHARS) или прошло
+  STREAM_MAX_INTERVAL_SEC. Короткий ответ появляется сразу, длинный правится всё реже:
+  каждая правка пересылает текст сообщения целиком, а при геометрическом росте суммарный
+  трафик линеен по длине ответа.
+- Лимит чата: правки не чаще STREAM_CHAT_INTERVAL_SEC (личка) / STREAM_GROUP_INTERVAL_SEC
+  (группы — ~20 сообщений в минуту), общий для всех потоков чата; RetryAfter откладывает
+  правки этого чата.
+- Общий бюджет правок всех активных потоков — token bucket STREAM_EDITS_PER_SEC
+  (запас до глобального лимита Bot API остаётся ответам и рассылкам): без свободного
+  токена промежуточная правка пропускается, следующая всё равно покажет весь текст.
+- Правка, которая не меняет текст сообщения, не отправляется.
+- До лимита 4096 символов сообщение закрывается (по абзацу / строке / пробелу),
+  продолжение уходит новым сообщением. Открытые в месте разреза сущности (выделения,
+  код, блок кода с языком) закрываются в закрытом сообщении и открываются в продолжении.
+"""
+
+import asyncio
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import structlog
+from telegram.error import BadRequest, RetryAfter
+
+from utils.metrics import record_stream_edit
+from utils.token_bucket import TokenBucket
+
+logger = structlog.get_logger(__name__)
+
+STREAM_SEGMENT_MAX_CHARS = 4000  # < 4096: запас на закрывающую разметку санитайзера
+STREAM_FIRST_EDIT_CHARS = 50
+STREAM_MIN_DELTA_CHARS = 40
+STREAM_GROWTH_RATIO = 0.25
+STREAM_MAX_INTERVAL_SEC = 3.0
+STREAM_CHAT_INTERVAL_SEC = 1.0
+STREAM_GROUP_INTERVAL_SEC = 3.0
+STREAM_EDITS_PER_SEC = 20.0
+STREAM_EDITS_BURST = 5.0
+CHAT_LIMITER_MAX_CHATS = 10000
+
+GROUP_CHAT_TYPES = ("group", "supergroup", "channel")
+
+
+def _seconds(value: Any) -> float:
+    """RetryAfter.retry_after: int или timedelta (в зависимости от версии PTB)"""
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+def split_point(text: str, limit: int, start: int = 0) -> int:
+    """Где закрыть сообщение: последний абзац, строка или пробел во второй половине лимита"""
+    floor = max(start + 1, limit // 2)
+    for separator in ("\n\n", "\n", " "):
+        index = text.rfind(separator, floor, limit)
+        if index != -1:
+            return index + len(separator)
+    return limit
+
+
+class ChatEditLimiter:
+    """Момент, с которого чату можно отправить следующую правку (общий для потоков чата)"""
+
+    def __init__(self, max_chats: int = CHAT_LIMITER_MAX_CHATS) -> None:
+        self.max_chats = max_chats
+        self._next_at: Dict[int, float] = {}
+
+    def wait_time(self, chat_id: int, now: float) -> float:
+        return max(self._next_at.get(chat_id, 0.0) - now, 0.0)
+
+    def record(self, chat_id: int, now: float, interval: float) -> None:
+        self._next_at[chat_id] = max(self._next_at.get(chat_id, 0.0), now + interval)
+        if len(self._next_at) > self.max_chats:
+            # Истёкшие отметки больше ничего не ограничивают
+            self._next_at = {c: t for c, t in self._next_at.items() if t > now}
+
+    def defer(self, chat_id: int, seconds: float) -> None:
+        self.record(chat_id, time.monotonic(), seconds)
+
+
+edit_budget = TokenBucket(STREAM_EDITS_PER_SEC, capacity=STREAM_EDITS_BURST)
+chat_limiter = ChatEditLimiter()
+
+
+class StreamRenderer:
+    """
+    Показывает растущий текст правками message; feed() — очередной фрагмент,
+    flush() — дописать текущее сообщение до конца, discard() — удалить все сообщения
+    потока (когда ответ отправляется заново, с клавиатурой).
+
+    markup — фабрика инкрементальной разметки (utils.text_tools.TelegramHTMLStream:
+    feed / render / finish, parse_mode): фрагмент разбирается один раз при feed(),
+    правка берёт готовый результат. Без markup текст отправляется как есть.
+    """
+
+    def __init__(
+        self,
+        message: Any,
+        send_message: Callable[..., Awaitable[Any]],
+        chat_id: int,
+        chat_type: Optional[str] = None,
+        markup: Optional[Callable[[], Any]] = None,
+        budget: Optional[TokenBucket] = None,
+        limiter: Optional[ChatEditLimiter] = None,
+    ) -> None:
+        self._message = message
+        self._messages: List[Any] = [message]
+        self._send_message = send_message
+        self._chat_id = chat_id
+        self._interval = (
+            STREAM_GROUP_INTERVAL_SEC if chat_type in GROUP_CHAT_TYPES else STREAM_CHAT_INTERVAL_SEC
+        )
+        self._markup_factory = markup
+        self._markup = markup() if markup else None
+        self._parse_mode: Optional[str] = markup.parse_mode if markup else None
+        self._budget = budget or edit_budget
+        self._limiter = limiter or chat_limiter
+        self._chunks: List[str] = []
+        self._length = 0
+        self._segment_start = 0  # начало текста текущего сообщения в полном ответе
+        self._prefix = ""  # блок кода, переоткрытый в продолжении
+        self._shown_len = 0  # длина текста сообщения на последней правке
+        self._last_sent: Optional[str] = None
+        self._last_edit_at = time.monotonic()
+        self._plain = False  # Telegram не принял разметку — сообщение без parse_mode
+        self._broken = False  # новое сообщение не отправилось — правки прекращены
+
+    @property
+    def text(self) -> str:
+        """Весь накопленный ответ"""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def messages(self) -> List[Any]:
+        return list(self._messages)
+
+    def _segment(self) -> str:
+        return self._prefix + self.text[self._segment_start :]
+
+    def _segment_len(self) -> int:
+        return len(self._prefix) + self._length - self._segment_start
+
+    async def feed(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        if self._broken:
+            return
+        if self._markup is not None:
+            self._markup.feed(chunk)
+        while self._segment_len() > STREAM_SEGMENT_MAX_CHARS and not self._broken:
+            await self._rollover()
+        if self._due(time.monotonic()):
+            await self._edit(None, force=False)
+
+    async def flush(self) -> None:
+        """Показать текущее сообщение полностью (с ожиданием лимитов)"""
+        if not self._broken:
+            await self._edit(None, force=True, final=True)
+
+    async def discard(self) -> None:
+        for message in self._messages:
+            try:
+                await message.delete()
+            except Exception:
+                pass
+
+    def _due(self, now: float) -> bool:
+        length = self._segment_len()
+        grown = length - self._shown_len
+        if grown <= 0 or self._limiter.wait_time(self._chat_id, now) > 0:
+            return False
+        if self._last_sent is None:
+            return length >= STREAM_FIRST_EDIT_CHARS
+        threshold = max(STREAM_MIN_DELTA_CHARS, self._shown_len * STREAM_GROWTH_RATIO)
+        return grown >= threshold or now - self._last_edit_at >= STREAM_MAX_INTERVAL_SEC
+
+    async def _wait_turn(self) -> None:
+        """Дождаться лимита чата и токена общего бюджета (обязательные правки)"""
+        delay = self._limiter.wait_time(self._chat_id, time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._budget.acquire()
+
+    def _prepare(self, text: Optional[str], final: bool = False) -> Tuple[str, str]:
+        """
+        (что отправить, исходный текст). text=None — текущее сообщение из накопленной
+        разметки; иначе — отдельный текст (закрываемое сообщение), размечается заново.
+        """
+        if text is None:
+            raw = self._segment()
+            if self._plain or self._markup is None:
+                return raw, raw
+            return (self._markup.finish() if final else self._markup.render()), raw
+        if self._plain or self._markup_factory is None:
+            return text, text
+        markup = self._markup_factory()
+        markup.feed(text)
+        return markup.finish(), text
+
+    async def _edit(self, text: Optional[str], force: bool, final: bool = False) -> bool:
+        prepared, raw = self._prepare(text, final)
+        if prepared == self._last_sent:
+            self._shown_len = len(raw)
+            record_stream_edit("noop")
+            return True
+        if force:
+            await self._wait_turn()
+        elif not self._budget.try_acquire():
+            record_stream_edit("no_budget")
+            return False
+        sent = await self._send_edit(prepared, raw)
+        now = time.monotonic()
+        self._limiter.record(self._chat_id, now, self._interval)
+        self._last_edit_at = now
+        if sent is None:
+            record_stream_edit("failed")
+            return False
+        self._shown_len = len(raw)
+        self._last_sent = sent
+        record_stream_edit("sent")
+        return True
+
+    async def _send_edit(self, prepared: str, text: str) -> Optional[str]:
+        """Правка текущего сообщения; вернуть фактически отправленный текст или None"""
+        try:
+            await self._message.edit_text(
+                prepared, parse_mode=None if self._plain else self._parse_mode
+            )
+            return prepared
+        except RetryAfter as e:
+            self._limiter.defer(self._chat_id, _seconds(e.retry_after))
+            return None
+        except BadRequest as e:
+            error = str(e).lower()
+            if "not modified" in error:
+                return prepared
+            if self._parse_mode and not self._plain and ("parse" in error or "entities" in error):
+                # До конца сообщения — без разметки, а не две правки на каждый шаг
+                self._plain = True
+                try:
+                    await self._message.edit_text(text, parse_mode=None)
+                    return text
+                except Exception:
+                    return None
+            logger.debug("stream_edit_failed", chat_id=self._chat_id, error=str(e))
+            return None
+        except Exception as e:
+            logger.debug("stream_edit_failed", chat_id=self._chat_id, error=str(e))
+            return None
+
+    def _split(self, segment: str) -> Tuple[int, str]:
+        """
+        (где закрыть сообщение, разметка для начала продолжения). Незакрытые сущности
+        берутся из разметки, разобравшей голову: её finish() закрывает их в закрываемом
+        сообщении, reopen_markdown() открывает в продолжении (блок кода — с языком).
+        """
+        cut = split_point(segment, STREAM_SEGMENT_MAX_CHARS, start=len(self._prefix))
+        if self._markup_factory is None:
+            return cut, ""
+        markup = self._markup_factory()
+        markup.feed(segment[:cut])
+        pending = len(markup.pending)
+        if pending and cut - pending > len(self._prefix):
+            # Недописанная ссылка или маркер на границе уходят в продолжение целиком
+            cut -= pending
+            markup = self._markup_factory()
+            markup.feed(segment[:cut])
+        return cut, markup.reopen_markdown()
+
+    async def _rollover(self) -> None:
+        """Закрыть текущее сообщение до лимита и продолжить новым"""
+        segment = self._segment()
+        cut, prefix = self._split(segment)
+        await self._edit(segment[:cut], force=True)
+
+        self._segment_start += cut - len(self._prefix)
+        self._prefix = prefix
+        segment = self._segment()
+        self._plain = False
+        if self._markup_factory is not None:
+            self._markup = self._markup_factory()
+            self._markup.feed(segment)
+        prepared, _ = self._prepare(None)
+        await self._wait_turn()
+        try:
+            message = await self._send_message(prepared, parse_mode=self._parse_mode)
+        except BadRequest:
+            self._plain = True
+            try:
+                message = await self._send_message(segment, parse_mode=None)
+            except Exception as e:
+                self._stop(e)
+                return
+            prepared = segment
+        except Exception as e:
+            self._stop(e)
+            return
+        self._limiter.record(self._chat_id, time.monotonic(), self._interval)
+        self._message = message
+        self._messages.append(message)
+        self._shown_len = len(segment)
+        self._last_sent = prepared
+        self._last_edit_at = time.monotonic()
+        record_stream_edit("rollover")
+
+    def _stop(self, error: Exception) -> None:
+        self._broken = True
+        logger.warning("stream_rollover_failed", chat_id=self._chat_id, error=str(error))
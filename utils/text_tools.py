@@ -2,6 +2,10 @@
 Утилиты для работы с текстом и разметкой Telegram
 """
 
+import html
+import re
+from typing import List
+
 
 def sanitize_markdown(text: str) -> str:
     """
@@ -36,3 +40,279 @@ def truncate_for_telegram(text: str, max_length: int = 4096) -> str:
     if len(text) <= max_length:
         return text
     return text[: max_length - 3] + "..."
+
+
+# --- Потоковая разметка: Markdown ответа LLM → HTML Telegram ---
+
+_TEXT_SPECIAL = re.compile(r"[*_`\\\n\[]")
+_MARKER_RUN = re.compile(r"\*+|_+|`+")
+_ESCAPABLE = frozenset("\\`*_{}[]()#+-.!|~>")
+_EMPHASIS_TAGS = {"**": "b", "__": "b", "*": "i", "_": "i"}
+_FENCE_LANG = re.compile(r"[^\w+#.-]")
+FENCE_INFO_MAX_CHARS = 32
+# [текст](url): url без пробелов, допускается одна пара скобок внутри (Википедия)
+_LINK = re.compile(r"\[([^\]\n]*)\]\(((?:[^\s()]|\([^\s()]*\))+)\)")
+_LINK_PREFIX = re.compile(r"\[[^\]\n]*(?:\](?:\((?:[^\s()]|\([^\s()]*\)?)*)?)?\Z")
+_LINK_SCHEMES = ("http://", "https://", "tg://", "mailto:")
+LINK_MAX_CHARS = 2048  # дольше недописанную ссылку не ждём — выводим как текст
+
+
+class TelegramHTMLStream:
+    """
+    Инкрементальный перевод Markdown ответа LLM (**жирный**, *курсив* / _курсив_,
+    `код`, ```блок```, [ссылка](url)) в HTML Telegram. feed() разбирает только новый фрагмент:
+    готовый HTML копится, состояние — стек открытых выделений и режим (текст / код /
+    блок кода). render() — валидный HTML текущего префикса: готовая часть плюс
+    закрывающие теги; finish() — то же в конце ввода.
+
+    В отличие от подсчёта чётности в sanitize_markdown, теги всегда вложены правильно
+    (закрытие не верхнего выделения закрывает и переоткрывает вложенные), `*` в списках
+    и `_` внутри слов остаются текстом, а внутри кода разметка не разбирается.
+    Хвост, который нельзя разобрать без следующего символа (`*`, ``` `` ```, строка
+    языка после ```, недописанная [ссылка](url)), ждёт следующего фрагмента и в render()
+    не попадает. Ссылки — только http(s), tg и mailto; href экранируется.
+    """
+
+    parse_mode = "HTML"
+
+    def __init__(self) -> None:
+        self._out: List[str] = []
+        self._pending = ""
+        self._stack: List[str] = []  # открытые маркеры выделения, снизу вверх
+        self._mode = "text"  # text / code / pre
+        self._code_ticks = 0
+        self._pre_close = ""
+        self._pre_lang = ""
+        self._prev = "\n"  # последний разобранный символ исходного текста
+        self._line_blank = True  # в текущей строке пока только пробелы
+        self._steps = {"text": self._step_text, "code": self._step_code, "pre": self._step_pre}
+
+    def feed(self, delta: str) -> None:
+        if delta:
+            self._pending += delta
+            self._consume(at_end=False)
+
+    def render(self) -> str:
+        if len(self._out) > 1:
+            self._out = ["".join(self._out)]
+        return (self._out[0] if self._out else "") + self._closing()
+
+    def finish(self) -> str:
+        """Разобрать отложенный хвост как конец текста и вернуть итоговый HTML"""
+        self._consume(at_end=True)
+        return self.render()
+
+    @property
+    def pending(self) -> str:
+        """Хвост ввода, который ждёт следующего фрагмента"""
+        return self._pending
+
+    def reopen_markdown(self) -> str:
+        """
+        Markdown, заново открывающий сущности, незакрытые в разобранной части: выделения,
+        инлайн-код, блок кода с языком — начало продолжения в новом сообщении
+        """
+        markers = "".join(self._stack)
+        if self._mode == "code":
+            return markers + "`" * self._code_ticks
+        if self._mode == "pre":
+            return f"```{self._pre_lang}\n"
+        return markers
+
+    def _closing(self) -> str:
+        tail = "</code>" if self._mode == "code" else self._pre_close
+        return tail + "".join(f"</{_EMPHASIS_TAGS[m]}>" for m in reversed(self._stack))
+
+    def _emit_text(self, text: str) -> None:
+        self._out.append(html.escape(text, quote=False))
+        self._prev = text[-1]
+        if self._line_blank and text.strip(" "):
+            self._line_blank = False
+
+    def _consume(self, at_end: bool) -> None:
+        text, i = self._pending, 0
+        while i < len(text):
+            # Шаг возвращает позицию продолжения; без продвижения — ждём следующий фрагмент
+            step = self._steps[self._mode](text, i, at_end)
+            if step == i:
+                break
+            i = step
+        self._pending = text[i:]
+
+    def _step_text(self, text: str, i: int, at_end: bool) -> int:
+        while self._mode == "text" and i < len(text):
+            match = _TEXT_SPECIAL.search(text, i)
+            if match is None:
+                self._emit_text(text[i:])
+                return len(text)
+            j = match.start()
+            if j > i:
+                self._emit_text(text[i:j])
+            i = self._text_token(text, j, at_end)
+            if i == j:
+                break
+        return i
+
+    def _text_token(self, text: str, j: int, at_end: bool) -> int:
+        """Разобрать спецсимвол в позиции j"""
+        char = text[j]
+        if char == "\n":
+            if self._prev == "\n":
+                # Выделение не переходит через абзац
+                self._close_all()
+            self._out.append("\n")
+            self._prev, self._line_blank = "\n", True
+            return j + 1
+        if char == "\\":
+            if j + 1 == len(text):
+                if not at_end:
+                    return j
+                self._emit_text("\\")
+                return j + 1
+            if text[j + 1] in _ESCAPABLE:
+                self._emit_text(text[j + 1])
+                return j + 2
+            self._emit_text("\\")
+            return j + 1
+        if char == "[":
+            return self._link(text, j, at_end)
+        end = _MARKER_RUN.match(text, j).end()
+        if end == len(text) and not at_end:
+            return j
+        if char == "`":
+            return self._open_code(text, j, end, at_end)
+        return self._emphasis(text, j, end)
+
+    def _link(self, text: str, j: int, at_end: bool) -> int:
+        """[текст](url) → <a href>; недописанная ссылка ждёт следующего фрагмента"""
+        match = _LINK.match(text, j)
+        if match is None:
+            if (
+                not at_end
+                and len(text) - j <= LINK_MAX_CHARS
+                and _LINK_PREFIX.match(text, j) is not None
+            ):
+                return j
+            self._emit_text("[")
+            return j + 1
+        label, url = match.group(1), match.group(2)
+        if not url.lower().startswith(_LINK_SCHEMES):
+            self._emit_text("[")
+            return j + 1
+        # Разметка внутри текста ссылки разбирается отдельно и закрывается внутри <a>
+        inner = markdown_to_html(label) if label.strip() else html.escape(url, quote=False)
+        self._out.append(f'<a href="{html.escape(url, quote=True)}">{inner}</a>')
+        self._prev, self._line_blank = ")", False
+        return match.end()
+
+    def _open_code(self, text: str, j: int, end: int, at_end: bool) -> int:
+        ticks = end - j
+        if ticks < 3 or not self._line_blank:
+            self._out.append("<code>")
+            self._mode, self._code_ticks, self._prev = "code", ticks, "`"
+            self._line_blank = False
+            return end
+        newline = text.find("\n", end)
+        if newline == -1 and not at_end and len(text) - end <= FENCE_INFO_MAX_CHARS:
+            return j
+        info_end = len(text) if newline == -1 else newline
+        info = text[end:info_end].strip() if info_end - end <= FENCE_INFO_MAX_CHARS else ""
+        lang = _FENCE_LANG.sub("", info.split()[0]) if info else ""
+        self._close_all()
+        self._pre_lang = lang
+        if lang:
+            self._out.append(f'<pre><code class="language-{lang}">')
+            self._pre_close = "</code></pre>"
+        else:
+            self._out.append("<pre>")
+            self._pre_close = "</pre>"
+        self._mode, self._prev, self._line_blank = "pre", "\n", True
+        if info_end - end > FENCE_INFO_MAX_CHARS:
+            return end  # не строка языка, а начало кода
+        return info_end + 1 if newline != -1 else info_end
+
+    def _emphasis(self, text: str, j: int, end: int) -> int:
+        char, run = text[j], text[j:end]
+        after = text[end] if end < len(text) else " "
+        if len(run) > 3:
+            self._emit_text(run)
+            return end
+        can_open = not after.isspace()
+        can_close = not self._prev.isspace()
+        if char == "_":
+            # snake_case — не выделение
+            can_open = can_open and not self._prev.isalnum()
+            can_close = can_close and not after.isalnum()
+        markers = [char * 2, char] if len(run) == 3 else [run]
+        closing = [m for m in markers if m in self._stack] if can_close else []
+        for marker in sorted(closing, key=self._stack.index, reverse=True):
+            self._close(marker)
+        for marker in markers:
+            if marker in closing:
+                continue
+            if can_open:
+                self._stack.append(marker)
+                self._out.append(f"<{_EMPHASIS_TAGS[marker]}>")
+            else:
+                self._out.append(marker)
+        self._prev = char
+        self._line_blank = False
+        return end
+
+    def _close(self, marker: str) -> None:
+        """Закрыть маркер; вложенные в него выделения закрываются и открываются заново"""
+        index = self._stack.index(marker)
+        inner = self._stack[index + 1 :]
+        for m in reversed(inner):
+            self._out.append(f"</{_EMPHASIS_TAGS[m]}>")
+        self._out.append(f"</{_EMPHASIS_TAGS[marker]}>")
+        self._out.extend(f"<{_EMPHASIS_TAGS[m]}>" for m in inner)
+        self._stack = self._stack[:index] + inner
+
+    def _close_all(self) -> None:
+        self._out.extend(f"</{_EMPHASIS_TAGS[m]}>" for m in reversed(self._stack))
+        self._stack = []
+
+    def _step_code(self, text: str, i: int, at_end: bool) -> int:
+        j = text.find("`", i)
+        if j == -1:
+            self._emit_text(text[i:])
+            return len(text)
+        if j > i:
+            self._emit_text(text[i:j])
+        end = _MARKER_RUN.match(text, j).end()
+        if end == len(text) and not at_end:
+            return j
+        if end - j == self._code_ticks:
+            self._out.append("</code>")
+            self._mode, self._prev = "text", "`"
+        else:
+            self._emit_text(text[j:end])
+        return end
+
+    def _step_pre(self, text: str, i: int, at_end: bool) -> int:
+        if self._prev == "\n":
+            start = i
+            while start < len(text) and text[start] == " ":
+                start += 1
+            head = text[start : start + 3]
+            if len(head) < 3 and "```".startswith(head) and not at_end:
+                return i
+            if head == "```":
+                self._out.append(self._pre_close)
+                self._mode, self._pre_close, self._pre_lang = "text", "", ""
+                self._prev, self._line_blank = "`", False
+                return start + 3
+        newline = text.find("\n", i)
+        if newline == -1:
+            self._emit_text(text[i:])
+            return len(text)
+        self._emit_text(text[i : newline + 1])
+        return newline + 1
+
+
+def markdown_to_html(text: str) -> str:
+    """Markdown ответа LLM → HTML для parse_mode="HTML" (см. TelegramHTMLStream)"""
+    stream = TelegramHTMLStream()
+    stream.feed(text or "")
+    return stream.finish()
@@ -0,0 +1,62 @@
+"""
+Token bucket для исходящих запросов к Bot API: рассылки (services.broadcast) и правки
+потокового ответа (utils.stream_renderer).
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Темп: rate токенов в секунду, запас capacity (по умолчанию 1 — ровный темп без
+    всплесков). acquire() ждёт токен, try_acquire() — без ожидания; pause() — общая
+    пауза для всех отправителей (RetryAfter).
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        if rate <= 0:
+            raise ValueError("rate должен быть > 0")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # Ожидающие обслуживаются по очереди (FIFO asyncio.Lock)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Взять токен без ожидания; False — токенов нет, пауза или их уже ждут другие"""
+        if self._lock.locked():
+            return False
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд; за паузу запас не копится"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
@@ -0,0 +1,151 @@
+"""
+Параллельная обработка апдейтов с порядком внутри чата (Application.concurrent_updates)
+
+- Апдейты разных чатов обрабатываются одновременно, не больше max_concurrent: медленный
+  ответ LLM одному пользователю не задерживает остальных.
+- Апдейты одного чата (без чата — одного пользователя) идут строго по очереди, в порядке
+  поступления: FIFO asyncio.Lock на чат. Так сохраняется порядок сообщений в истории
+  диалога и состояние ConversationHandler, которому нужна последовательная обработка.
+- Очередь ограничена: принятых, но ещё не начатых апдейтов не больше max_backlog, у
+  одного чата — не больше max_chat_backlog. Сверх лимита апдейт отбрасывается (load
+  shedding) — лучше потерять часть апдейтов при перегрузке, чем копить их без предела и
+  отвечать всем с опозданием в минуты.
+- Метрики (utils.metrics): длина очереди, обрабатываемые, ожидание до начала обработки,
+  отброшенные по причинам.
+"""
+
+import asyncio
+import contextlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Dict, Optional
+
+import structlog
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from utils.metrics import record_update_shed, record_update_wait, set_update_queue_state
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class _ChatLane:
+    """Очередь одного чата: lock задаёт порядок, pending — принятые и ещё не завершённые"""
+
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    pending: int = 0
+
+
+def ordering_key(update: object) -> Optional[int]:
+    """Ключ порядка: id чата, без чата — id пользователя; None — порядок не важен"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+def _discard(coroutine: Awaitable[Any]) -> None:
+    """Закрыть так и не запущенную корутину (без предупреждения «never awaited»)"""
+    close = getattr(coroutine, "close", None)
+    if close is not None:
+        close()
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельно по чатам, последовательно внутри чата, с ограниченной очередью"""
+
+    def __init__(self, max_concurrent: int, max_backlog: int, max_chat_backlog: int) -> None:
+        if max_concurrent < 1 or max_backlog < 1 or max_chat_backlog < 1:
+            raise ValueError("max_concurrent, max_backlog и max_chat_backlog должны быть >= 1")
+        # Семафор базового класса держат и ждущие, и обрабатываемые апдейты: его ёмкость с
+        # запасом на проверку лимитов, чтобы лишние апдейты отбрасывались здесь, а не ждали в нём
+        super().__init__(max_concurrent + max_backlog + 1)
+        self.max_concurrent = max_concurrent
+        self.max_backlog = max_backlog
+        self.max_chat_backlog = max_chat_backlog
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._lanes: Dict[int, _ChatLane] = {}
+        self._waiting = 0
+        self._running = 0
+        self.shed_count = 0
+
+    @property
+    def waiting(self) -> int:
+        """Принятые апдейты, ждущие своей очереди в чате или свободного слота"""
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self.shed_count:
+            logger.info("update_processor_shutdown", shed_total=self.shed_count)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # До первого await проверка лимитов и постановка в очередь атомарны
+        key = ordering_key(update)
+        if self._waiting >= self.max_backlog:
+            self._shed(update, coroutine, key, "backlog_full")
+            return
+        lane: Optional[_ChatLane] = None
+        if key is not None:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _ChatLane()
+            elif lane.pending >= self.max_chat_backlog:
+                self._shed(update, coroutine, key, "chat_backlog_full")
+                return
+            lane.pending += 1
+
+        accepted_at = time.perf_counter()
+        self._waiting += 1
+        self._report()
+        started = False
+        try:
+            async with lane.lock if lane is not None else contextlib.nullcontext():
+                async with self._slots:
+                    started = True
+                    self._waiting -= 1
+                    self._running += 1
+                    self._report()
+                    record_update_wait(time.perf_counter() - accepted_at)
+                    try:
+                        await coroutine
+                    finally:
+                        self._running -= 1
+        finally:
+            if not started:
+                # Отмена во время ожидания (остановка приложения)
+                self._waiting -= 1
+                _discard(coroutine)
+            if lane is not None:
+                lane.pending -= 1
+                if lane.pending == 0:
+                    del self._lanes[key]
+            self._report()
+
+    def _shed(
+        self, update: object, coroutine: Awaitable[Any], key: Optional[int], reason: str
+    ) -> None:
+        _discard(coroutine)
+        self.shed_count += 1
+        record_update_shed(reason)
+        logger.warning(
+            "update_shed",
+            reason=reason,
+            update_id=getattr(update, "update_id", None),
+            chat_id=key,
+            waiting=self._waiting,
+            running=self._running,
+        )
+
+    def _report(self) -> None:
+        set_update_queue_state(self._waiting, self._running)